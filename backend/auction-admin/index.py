@@ -3,22 +3,50 @@
 POST / action=create  — создать лот (поддерживает startsAt для отложенного старта)
 POST / action=update  — обновить лот (поля + payment_status + startsAt)
 POST / action=stop    — остановить лот вручную
+POST / action=create_many — массовое создание: {lots: [...]} или {csv: "title,endsAt,..."}
+POST / action=update_many — общие поля (endsAt, antiSnipeMinutes, ...) для {lotIds: [...]}
+POST / action=delete_many — удалить {lotIds: [...]} одной транзакцией
+POST / action=set_hot — {lotId, hot}: отдать лот движку торгов (AUCTION_ENGINE_URL) или вернуть обратно
+Лоты на движке не правятся, не останавливаются и не удаляются (409): их состояние в памяти движка,
+и его групповой коммит перезаписал бы правку. Сначала лот возвращается через set_hot.
+POST / action=analytics — ставки, продления, прирост цены и выручка по статусам оплаты завершённых лотов
+После изменения лотов будится catalog-publish (CATALOG_PUBLISH_URL), чтобы обновить снимок каталога в CDN.
+Правки и остановка лотов сбрасывают кэш лотов auction-bid через NOTIFY auction_cache.
+Действия с лотами видят только лоты сообщества запроса (vk_group_id, заголовок X-Vk-Group-Id)
+и занимают слот из его квоты соединений.
 """
+import csv
+import io
 import json
 import os
-import psycopg2
+import time
 from datetime import datetime, timezone
 
 SCHEMA = "t_p68201414_vk_auction_app_1"
+CATALOG_PUBLISH_INTERVAL_SECONDS = 5
+CATALOG_PUBLISH_PING_SECONDS = 1
+# Канал, который слушает кэш лотов auction-bid
+CACHE_CHANNEL = "auction_cache"
+# NOTIFY принимает не больше 8000 байт: длинный список лотов заменяется сбросом всех лотов
+NOTIFY_PAYLOAD_MAX_BYTES = 7900
+# Окно перед концом лота, ставки в котором считаются отдельно (см. lot_settlements.final_window_bids)
+FINAL_WINDOW_MINUTES = 10
+
+# Когда этот инстанс последний раз будил catalog-publish
+_catalog_publish_requested_at = 0.0
 
 CORS = {
     "Access-Control-Allow-Origin": "*",
     "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-    "Access-Control-Allow-Headers": "Content-Type, X-User-Id, X-User-Name, X-User-Avatar",
+    "Access-Control-Allow-Headers": "Content-Type, X-User-Id, X-User-Name, X-User-Avatar, X-Vk-Group-Id",
 }
 
+# Настройки уведомлений общие для установки и квоты сообщества не требуют
+GLOBAL_ACTIONS = ("get_notification_config", "set_notification_config")
+
 
 def get_conn():
+    import psycopg2
     return psycopg2.connect(os.environ["DATABASE_URL"])
 
 
@@ -27,6 +55,230 @@ def err(msg: str, status: int = 400):
     return {"statusCode": status, "headers": CORS, "body": json.dumps({"error": msg})}
 
 
+# ── Сообщества ────────────────────────────────────────────────────────────────
+
+class TenantError(Exception):
+    """Запрос нельзя обслужить для этого сообщества; status — HTTP-код ответа."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def vk_group_id(event: dict):
+    """vk_group_id из параметров запуска: заголовок X-Vk-Group-Id или параметр vk_group_id."""
+    headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+    raw = headers.get("x-vk-group-id") or (event.get("queryStringParameters") or {}).get("vk_group_id")
+    try:
+        return int(raw) if raw else None
+    except (TypeError, ValueError):
+        return None
+
+
+def acquire_tenant(cur, group_id) -> int:
+    """Сообщество запроса и слот его квоты соединений до закрытия соединения: не подключено — 404, слоты заняты — 503."""
+    cur.execute(f"SELECT tenant_id, slot FROM {SCHEMA}.acquire_tenant_slot(%s)", (group_id,))
+    tenant_id, slot = cur.fetchone()
+    if tenant_id is None:
+        raise TenantError(404, "Сообщество не подключено к аукциону")
+    if slot is None:
+        raise TenantError(503, "Слишком много запросов, попробуйте через пару секунд")
+    return tenant_id
+
+
+def notify_lots(cur, lot_ids: list):
+    """Сбрасывает записи лотов в кэше auction-bid: 'lot:<id>,<id>' или 'lot:*'. NOTIFY уходит при коммите транзакции."""
+    payload = "lot:" + ",".join(str(i) for i in lot_ids)
+    if len(payload) > NOTIFY_PAYLOAD_MAX_BYTES:
+        payload = "lot:*"
+    cur.execute("SELECT pg_notify(%s, %s)", (CACHE_CHANNEL, payload))
+
+
+def request_catalog_publish():
+    """Будит catalog-publish (CATALOG_PUBLISH_URL) не чаще раза в окно публикации на инстанс: запрос уходит, ответ не ждём."""
+    global _catalog_publish_requested_at
+    url = os.environ.get("CATALOG_PUBLISH_URL")
+    now = time.monotonic()
+    if not url or now - _catalog_publish_requested_at < CATALOG_PUBLISH_INTERVAL_SECONDS:
+        return
+    _catalog_publish_requested_at = now
+    import http.client
+    import urllib.parse
+    parts = urllib.parse.urlsplit(url)
+    conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    conn = conn_cls(parts.hostname, parts.port, timeout=CATALOG_PUBLISH_PING_SECONDS)
+    try:
+        conn.request("POST", parts.path or "/", body=b"{}", headers={"Content-Type": "application/json"})
+    except Exception as e:
+        print(f"[catalog-publish] ping: {e}")
+    finally:
+        conn.close()
+
+
+def engine_request(engine_url: str, path: str, payload: dict) -> dict:
+    """POST в движок торгов; ошибка движка — ValueError с его текстом."""
+    import urllib.error
+    import urllib.request
+    req = urllib.request.Request(
+        f"{engine_url.rstrip('/')}/{path}", data=json.dumps(payload).encode(), method="POST",
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return json.loads(resp.read().decode())
+    except urllib.error.HTTPError as e:
+        raise ValueError(json.loads(e.read().decode() or "{}").get("error", f"engine HTTP {e.code}"))
+
+
+LOT_INSERT_COLUMNS = (
+    "title, description, image, video, start_price, current_price, step, "
+    "starts_at, ends_at, status, anti_snipe, anti_snipe_minutes, video_duration, tenant_id"
+)
+BATCH_MAX_LOTS = 5000
+
+
+def lot_values(item: dict, now: datetime, tenant_id: int) -> tuple:
+    """Кортеж значений для INSERT лота из тела запроса (create / create_many)."""
+    video_duration = item.get("videoDuration")
+    start_price = int(item.get("startPrice", 1000))
+    anti_snipe = item.get("antiSnipe", True)
+    if isinstance(anti_snipe, str):
+        anti_snipe = anti_snipe.strip().lower() not in ("", "0", "false", "no")
+
+    # Если задан starts_at и он в будущем — создаём как upcoming
+    starts_at = item.get("startsAt") or None
+    initial_status = "active"
+    if starts_at:
+        try:
+            sa = datetime.fromisoformat(starts_at.replace("Z", "+00:00"))
+            initial_status = "upcoming" if sa > now else "active"
+        except Exception:
+            starts_at = None
+
+    return (
+        item.get("title", ""),
+        item.get("description", ""),
+        item.get("image") or "",
+        item.get("video") or "",
+        start_price,
+        start_price,
+        int(item.get("step", 100)),
+        starts_at,
+        item.get("endsAt", ""),
+        initial_status,
+        bool(anti_snipe),
+        int(item.get("antiSnipeMinutes", 2)),
+        int(video_duration) if video_duration else None,
+        tenant_id,
+    )
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ISO-время из тела запроса (с суффиксом Z или смещением, без смещения — UTC); ValueError, если это не время."""
+    ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def update_fields(body: dict) -> tuple:
+    """
+    SET-фрагменты для UPDATE лота по ключам тела запроса (update / update_many) и их параметры:
+    значения из запроса уходят только плейсхолдерами. ValueError/TypeError — некорректное значение.
+    """
+    fields, params = [], []
+
+    def put(column: str, value):
+        fields.append(f"{column} = %s")
+        params.append(value)
+
+    for key, column in (("title", "title"), ("description", "description"), ("image", "image"),
+                        ("video", "video"), ("paymentStatus", "payment_status")):
+        if key in body:
+            put(column, str(body[key]))
+    if "startPrice" in body:
+        sp = int(body["startPrice"])
+        put("start_price", sp)
+        put("current_price", sp)
+    if "step" in body:
+        put("step", int(body["step"]))
+    if "startsAt" in body:
+        sa = body["startsAt"]
+        if sa:
+            starts_at = parse_timestamp(sa)
+            put("starts_at", starts_at)
+            # Обновляем статус: если starts_at в будущем — upcoming
+            put("status", "upcoming" if starts_at > datetime.now(timezone.utc) else "active")
+        else:
+            put("starts_at", None)
+            put("status", "active")
+    if "endsAt" in body:
+        put("ends_at", parse_timestamp(body["endsAt"]))
+    if "antiSnipe" in body:
+        put("anti_snipe", bool(body["antiSnipe"]))
+    if "antiSnipeMinutes" in body:
+        put("anti_snipe_minutes", int(body["antiSnipeMinutes"]))
+    if "videoDuration" in body:
+        vd = body["videoDuration"]
+        put("video_duration", int(vd) if vd else None)
+    if fields:
+        # Новая версия инвалидирует кэш карточки лота в auction-lots
+        fields.append(f"version = nextval('{SCHEMA}.lot_version_seq')")
+    return fields, params
+
+
+def parse_lot_ids(body: dict) -> list:
+    """lotIds пакетных действий — отсортированные id без повторов; ValueError с текстом для ответа 400."""
+    raw = body.get("lotIds") or []
+    if not isinstance(raw, list):
+        raise ValueError("lotIds must be a list")
+    if len(raw) > BATCH_MAX_LOTS:
+        raise ValueError(f"too many lotIds: {len(raw)} > {BATCH_MAX_LOTS}")
+    try:
+        return sorted({int(i) for i in raw})
+    except (TypeError, ValueError):
+        raise ValueError("lotIds must be integers")
+
+
+def engine_owned(cur, lot_ids: list) -> list:
+    """
+    Лоты из списка, которые обслуживает движок торгов. Строки лотов блокируются до конца транзакции:
+    claim в движке берёт ту же блокировку, так что лот не уйдёт движку между проверкой и правкой.
+    """
+    cur.execute(f"SELECT id FROM {SCHEMA}.lots WHERE id = ANY(%s) ORDER BY id FOR UPDATE", (lot_ids,))
+    cur.execute(f"SELECT lot_id FROM {SCHEMA}.engine_lots WHERE lot_id = ANY(%s) ORDER BY lot_id", (lot_ids,))
+    return [r[0] for r in cur.fetchall()]
+
+
+def engine_owned_error(conn, lot_ids: list) -> dict:
+    conn.rollback()
+    conn.close()
+    ids = ", ".join(str(i) for i in lot_ids)
+    return err(f"Лоты на движке торгов: {ids}. Сначала верните их из движка (set_hot)", 409)
+
+
+def parse_batch_lots(body: dict) -> list:
+    """Лоты для create_many: JSON-массив `lots` или CSV-текст `csv` с заголовком из тех же ключей."""
+    if body.get("csv"):
+        rows = csv.DictReader(io.StringIO(body["csv"]))
+        # Пустые ячейки считаем отсутствующими, чтобы сработали значения по умолчанию
+        return [{k.strip(): v.strip() for k, v in row.items() if k and v and v.strip()} for row in rows]
+    return list(body.get("lots") or [])
+
+
+def delete_lots(cur, tenant_id: int, lot_ids: list):
+    """
+    Удаляет лоты сообщества вместе со ставками, автоставками, трекингом, журналом движка (лот, который
+    движок когда-то захватывал и отпустил), отметками напоминаний и неотправленными уведомлениями —
+    по одному DELETE на таблицу.
+    """
+    cur.execute(f"SELECT id FROM {SCHEMA}.lots WHERE id = ANY(%s) AND tenant_id = %s", (lot_ids, tenant_id))
+    lot_ids = [r[0] for r in cur.fetchall()]
+    for table, column in (
+        ("auto_bids", "lot_id"), ("bids", "lot_id"), ("outbid_tracking", "lot_id"), ("engine_events", "lot_id"),
+        ("lot_reminders", "lot_id"), ("notification_queue", "lot_id"), ("lots", "id"),
+    ):
+        cur.execute(f"DELETE FROM {SCHEMA}.{table} WHERE {column} = ANY(%s)", (lot_ids,))
+
+
 def handler(event: dict, context) -> dict:
     if event.get("httpMethod") == "OPTIONS":
         return {"statusCode": 200, "headers": CORS, "body": ""}
@@ -44,145 +296,240 @@ def handler(event: dict, context) -> dict:
     except Exception as e:
         return err(f"DB connect failed: {e}", 500)
 
-    cur = conn.cursor()
+    # Слот сообщества держится до закрытия соединения — закрываем и когда действие упало.
+    # Ветки закрывают соединение сами перед catalog-publish и движком; повторный close() ничего не делает
+    try:
+        cur = conn.cursor()
+        tenant_id = None
+        if action not in GLOBAL_ACTIONS:
+            try:
+                tenant_id = acquire_tenant(cur, vk_group_id(event))
+            except TenantError as e:
+                return err(str(e), e.status)
+        return run_action(conn, cur, action, body, tenant_id)
+    finally:
+        conn.close()
+
 
+def run_action(conn, cur, action: str, body: dict, tenant_id) -> dict:
+    """Действие админки на соединении со слотом сообщества (tenant_id None — общие настройки)."""
     if action == "create":
         try:
-            title = body.get("title", "").replace("'", "''")
-            description = body.get("description", "").replace("'", "''")
-            image = (body.get("image") or "").replace("'", "''")
-            video = (body.get("video") or "").replace("'", "''")
-            video_duration = body.get("videoDuration")
-            start_price = int(body.get("startPrice", 1000))
-            step = int(body.get("step", 100))
-            ends_at = body.get("endsAt", "")
-            starts_at = body.get("startsAt")
-            anti_snipe = "true" if body.get("antiSnipe", True) else "false"
-            anti_snipe_min = int(body.get("antiSnipeMinutes", 2))
-            vd_sql = f", {int(video_duration)}" if video_duration else ", NULL"
-
-            # Если задан starts_at и он в будущем — создаём как upcoming
-            now = datetime.now(timezone.utc)
-            if starts_at:
-                try:
-                    sa = datetime.fromisoformat(starts_at.replace("Z", "+00:00"))
-                    initial_status = "upcoming" if sa > now else "active"
-                except Exception:
-                    initial_status = "active"
-                    starts_at = None
-            else:
-                initial_status = "active"
-                starts_at = None
-
-            starts_at_sql = f"'{starts_at}'" if starts_at else "NULL"
-
-            print(f"[auction-admin] create: title={title!r} ends_at={ends_at!r} starts_at={starts_at!r} status={initial_status}")
-
-            cur.execute(f"""
-                INSERT INTO {SCHEMA}.lots
-                  (title, description, image, video, start_price, current_price, step,
-                   starts_at, ends_at, status, anti_snipe, anti_snipe_minutes, video_duration)
-                VALUES
-                  ('{title}', '{description}', '{image}', '{video}', {start_price}, {start_price}, {step},
-                   {starts_at_sql}, '{ends_at}', '{initial_status}', {anti_snipe}, {anti_snipe_min}{vd_sql})
-                RETURNING id
-            """)
+            values = lot_values(body, datetime.now(timezone.utc), tenant_id)
+            print(f"[auction-admin] create: title={values[0]!r} ends_at={values[8]!r} starts_at={values[7]!r} status={values[9]}")
+
+            cur.execute(
+                f"INSERT INTO {SCHEMA}.lots ({LOT_INSERT_COLUMNS}) VALUES %s RETURNING id",
+                (values,),
+            )
             new_id = cur.fetchone()[0]
             conn.commit()
             conn.close()
-            print(f"[auction-admin] created lot id={new_id} status={initial_status}")
+            request_catalog_publish()
+            print(f"[auction-admin] created lot id={new_id} status={values[9]}")
             return {"statusCode": 200, "headers": CORS, "body": json.dumps({"ok": True, "id": new_id})}
         except Exception as e:
             conn.rollback()
-            conn.close()
             return err(f"create failed: {e}", 500)
 
-    elif action == "update":
-        lot_id = int(body.get("lotId", 0))
-        fields = []
-        if "title" in body:
-            v = body["title"].replace("'", "''")
-            fields.append(f"title = '{v}'")
-        if "description" in body:
-            v = body["description"].replace("'", "''")
-            fields.append(f"description = '{v}'")
-        if "image" in body:
-            v = body["image"].replace("'", "''")
-            fields.append(f"image = '{v}'")
-        if "video" in body:
-            v = body["video"].replace("'", "''")
-            fields.append(f"video = '{v}'")
-        if "startPrice" in body:
-            sp = int(body["startPrice"])
-            fields.append(f"start_price = {sp}")
-            fields.append(f"current_price = {sp}")
-        if "step" in body:
-            fields.append(f"step = {int(body['step'])}")
-        if "startsAt" in body:
-            sa = body["startsAt"]
-            if sa:
-                fields.append(f"starts_at = '{sa}'")
-                # Обновляем статус: если starts_at в будущем — upcoming
-                try:
-                    sa_dt = datetime.fromisoformat(sa.replace("Z", "+00:00"))
-                    now = datetime.now(timezone.utc)
-                    if sa_dt > now:
-                        fields.append("status = 'upcoming'")
-                    else:
-                        fields.append("status = 'active'")
-                except Exception:
-                    pass
-            else:
-                fields.append("starts_at = NULL")
-                fields.append("status = 'active'")
-        if "endsAt" in body:
-            fields.append(f"ends_at = '{body['endsAt']}'")
-        if "antiSnipe" in body:
-            val = "true" if body["antiSnipe"] else "false"
-            fields.append(f"anti_snipe = {val}")
-        if "antiSnipeMinutes" in body:
-            fields.append(f"anti_snipe_minutes = {int(body['antiSnipeMinutes'])}")
-        if "videoDuration" in body:
-            vd = body["videoDuration"]
-            fields.append(f"video_duration = {int(vd)}" if vd else "video_duration = NULL")
-        if "paymentStatus" in body:
-            ps = body["paymentStatus"].replace("'", "''")
-            fields.append(f"payment_status = '{ps}'")
+    elif action == "create_many":
+        try:
+            items = parse_batch_lots(body)
+            if not items:
+                return err("lots or csv required")
+            if len(items) > BATCH_MAX_LOTS:
+                return err(f"too many lots: {len(items)} > {BATCH_MAX_LOTS}")
+            now = datetime.now(timezone.utc)
+            rows = [lot_values(item, now, tenant_id) for item in items]
+        except (ValueError, TypeError, csv.Error) as e:
+            return err(f"invalid lots: {e}")
 
+        try:
+            import psycopg2.extras
+            # Многострочный INSERT пачками по 500 строк — одно соединение и одна транзакция на весь импорт
+            new_ids = psycopg2.extras.execute_values(
+                cur,
+                f"INSERT INTO {SCHEMA}.lots ({LOT_INSERT_COLUMNS}) VALUES %s RETURNING id",
+                rows,
+                page_size=500,
+                fetch=True,
+            )
+            conn.commit()
+            conn.close()
+            request_catalog_publish()
+            ids = [r[0] for r in new_ids]
+            print(f"[auction-admin] create_many: created {len(ids)} lots")
+            return {"statusCode": 200, "headers": CORS, "body": json.dumps({"ok": True, "ids": ids})}
+        except Exception as e:
+            conn.rollback()
+            return err(f"create_many failed: {e}", 500)
+
+    elif action == "update":
+        try:
+            lot_id = int(body.get("lotId", 0))
+            fields, params = update_fields(body)
+        except (ValueError, TypeError) as e:
+            return err(f"invalid update: {e}")
         if fields:
-            cur.execute(f"UPDATE {SCHEMA}.lots SET {', '.join(fields)} WHERE id = {lot_id}")
+            owned = engine_owned(cur, [lot_id])
+            if owned:
+                return engine_owned_error(conn, owned)
+            cur.execute(
+                f"UPDATE {SCHEMA}.lots SET {', '.join(fields)} WHERE id = %s AND tenant_id = %s",
+                params + [lot_id, tenant_id],
+            )
+            notify_lots(cur, [lot_id])
         conn.commit()
         conn.close()
+        request_catalog_publish()
         return {"statusCode": 200, "headers": CORS, "body": json.dumps({"ok": True})}
 
+    elif action == "update_many":
+        try:
+            lot_ids = parse_lot_ids(body)
+            if not isinstance(body.get("fields") or {}, dict):
+                raise ValueError("fields must be an object")
+            fields, params = update_fields(body.get("fields") or {})
+        except (ValueError, TypeError) as e:
+            return err(f"invalid update_many: {e}")
+        if not lot_ids or not fields:
+            return err("lotIds and fields required")
+        owned = engine_owned(cur, lot_ids)
+        if owned:
+            return engine_owned_error(conn, owned)
+        cur.execute(
+            f"UPDATE {SCHEMA}.lots SET {', '.join(fields)} WHERE id = ANY(%s) AND tenant_id = %s",
+            params + [lot_ids, tenant_id],
+        )
+        updated = cur.rowcount
+        notify_lots(cur, lot_ids)
+        conn.commit()
+        conn.close()
+        request_catalog_publish()
+        print(f"[auction-admin] update_many: {updated} lots, fields={list((body.get('fields') or {}).keys())}")
+        return {"statusCode": 200, "headers": CORS, "body": json.dumps({"ok": True, "updated": updated})}
+
     elif action == "stop":
         lot_id = int(body.get("lotId", 0))
+        owned = engine_owned(cur, [lot_id])
+        if owned:
+            return engine_owned_error(conn, owned)
         cur.execute(f"""
             UPDATE {SCHEMA}.lots
-            SET status = 'cancelled'
-            WHERE id = {lot_id} AND status IN ('active', 'upcoming')
+            SET status = 'cancelled', version = nextval('{SCHEMA}.lot_version_seq')
+            WHERE id = {lot_id} AND tenant_id = {tenant_id} AND status IN ('active', 'upcoming')
         """)
+        notify_lots(cur, [lot_id])
         conn.commit()
         conn.close()
+        request_catalog_publish()
         return {"statusCode": 200, "headers": CORS, "body": json.dumps({"ok": True})}
 
     elif action == "delete":
         lot_id = int(body.get("lotId", 0))
-        cur.execute(f"DELETE FROM {SCHEMA}.auto_bids WHERE lot_id = {lot_id}")
-        cur.execute(f"DELETE FROM {SCHEMA}.bids WHERE lot_id = {lot_id}")
-        cur.execute(f"DELETE FROM {SCHEMA}.outbid_tracking WHERE lot_id = {lot_id}")
-        cur.execute(f"DELETE FROM {SCHEMA}.lots WHERE id = {lot_id}")
-        conn.commit()
+        owned = engine_owned(cur, [lot_id])
+        if owned:
+            return engine_owned_error(conn, owned)
+        try:
+            delete_lots(cur, tenant_id, [lot_id])
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            return err(f"delete failed: {e}", 500)
         conn.close()
+        request_catalog_publish()
         return {"statusCode": 200, "headers": CORS, "body": json.dumps({"ok": True})}
 
+    elif action == "delete_many":
+        try:
+            lot_ids = parse_lot_ids(body)
+        except ValueError as e:
+            return err(str(e))
+        if not lot_ids:
+            return err("lotIds required")
+        owned = engine_owned(cur, lot_ids)
+        if owned:
+            return engine_owned_error(conn, owned)
+        try:
+            delete_lots(cur, tenant_id, lot_ids)
+            deleted = cur.rowcount
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            return err(f"delete_many failed: {e}", 500)
+        conn.close()
+        request_catalog_publish()
+        print(f"[auction-admin] delete_many: {deleted} lots")
+        return {"statusCode": 200, "headers": CORS, "body": json.dumps({"ok": True, "deleted": deleted})}
+
+    # ── Горячий лот: ставки через движок торгов ─────────────────────────────
+    elif action == "set_hot":
+        lot_id = int(body.get("lotId", 0))
+        cur.execute(f"""
+            SELECT l.id, e.engine_url FROM {SCHEMA}.lots l
+            LEFT JOIN {SCHEMA}.engine_lots e ON e.lot_id = l.id
+            WHERE l.id = {lot_id} AND l.tenant_id = {tenant_id}
+        """)
+        lot = cur.fetchone()
+        conn.close()
+        if not lot:
+            return err("Лот не найден", 404)
+        row = (lot[1],) if lot[1] else None
+        try:
+            if body.get("hot"):
+                if row:
+                    return {"statusCode": 200, "headers": CORS, "body": json.dumps({"ok": True, "engineUrl": row[0]})}
+                engine_url = os.environ.get("AUCTION_ENGINE_URL")
+                if not engine_url:
+                    return err("AUCTION_ENGINE_URL not configured")
+                engine_request(engine_url, "claim", {"lotId": lot_id})
+            elif row:
+                engine_request(row[0], "release", {"lotId": lot_id})
+        except ValueError as e:
+            return err(str(e))
+        except Exception as e:
+            return err(f"engine unavailable: {e}", 503)
+        print(f"[auction-admin] set_hot lot={lot_id} hot={bool(body.get('hot'))}")
+        return {"statusCode": 200, "headers": CORS, "body": json.dumps({"ok": True})}
+
+    # ── Аналитика: готовые суммы из tenant_stats, без сканов ставок ─────────
+    elif action == "analytics":
+        cur.execute(f"""
+            SELECT lots_settled, lots_sold, lots_extended, bids, final_window_bids, extensions,
+                   sold_start_price, sold_final_price, updated_at
+            FROM {SCHEMA}.tenant_stats WHERE tenant_id = {tenant_id}
+        """)
+        row = cur.fetchone() or (0, 0, 0, 0, 0, 0, 0, 0, None)
+        cur.execute(f"""
+            SELECT payment_status, lots, amount FROM {SCHEMA}.revenue_by_payment_status
+            WHERE tenant_id = {tenant_id} AND lots > 0 ORDER BY payment_status
+        """)
+        revenue = cur.fetchall()
+        conn.close()
+        settled, sold, extended, bids, final_window_bids, extensions, start_sum, final_sum, updated_at = row
+        return {"statusCode": 200, "headers": CORS, "body": json.dumps({
+            "settledLots": settled,
+            "soldLots": sold,
+            "bids": bids,
+            "bidsPerLot": round(bids / settled, 2) if settled else 0,
+            "finalWindowBidsPerMinute": (
+                round(final_window_bids / (sold * FINAL_WINDOW_MINUTES), 3) if sold else 0
+            ),
+            "extensionsPerLot": round(extensions / settled, 2) if settled else 0,
+            "extendedShare": round(extended / settled, 3) if settled else 0,
+            "priceUplift": round(final_sum / start_sum - 1, 3) if start_sum else 0,
+            "revenueByPaymentStatus": [
+                {"paymentStatus": r[0], "lots": r[1], "amount": r[2]} for r in revenue
+            ],
+            "updatedAt": updated_at.isoformat() if updated_at else None,
+        })}
+
     # ── Получить настройки уведомлений ──────────────────────────────────────
     elif action == "get_notification_config":
         cur.execute(f"SELECT key, enabled FROM {SCHEMA}.notification_config ORDER BY key")
         rows = cur.fetchall()
         cur.execute(f"SELECT COUNT(*) FROM {SCHEMA}.notification_settings WHERE allowed = true")
         subscribers = cur.fetchone()[0]
-        conn.close()
         return {"statusCode": 200, "headers": CORS, "body": json.dumps({
             "config": [{"key": r[0], "enabled": r[1]} for r in rows],
             "subscribers": subscribers,
@@ -199,8 +546,6 @@ def handler(event: dict, context) -> dict:
             ON CONFLICT (key) DO UPDATE SET enabled = {enabled_sql}, updated_at = NOW()
         """)
         conn.commit()
-        conn.close()
         return {"statusCode": 200, "headers": CORS, "body": json.dumps({"ok": True})}
 
-    conn.close()
-    return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": "Неизвестное действие"})}
\ No newline at end of file
+    return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": "Неизвестное действие"})}
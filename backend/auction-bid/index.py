@@ -3,226 +3,659 @@
 POST / {lotId, amount, userId, userName, userAvatar} — разместить ставку
 POST / {action: "auto_bid", lotId, maxAmount, userId, userName, userAvatar} — установить/обновить автоставку
 POST / {action: "allow_notifications", userId} — сохранить разрешение на уведомления
-После каждой ставки проверяет автоставки других участников и перебивает при необходимости.
-После ставки обновляет outbid_tracking и при необходимости отправляет уведомления.
+Ставка и автоставка выполняются процедурами БД place_bid / set_auto_bid (см. V0013) за один запрос:
+валидация, антиснайпинг, ответ автоставок других участников и outbid_tracking.
+Уведомления «ставку перебили» процедура кладёт в notification_queue (см. V0026): их рассылает
+дайджестами по пользователю таймер auction-lots.
+Горячие лоты (engine_lots, см. V0021) обслуживает движок services/auction-engine: ставка в такой лот
+пересылается ему, ответ — в том же формате, что у процедур.
+Ответ содержит readToken ("lotId:version") для чтения своей ставки с реплики в auction-lots.
+Заголовок Idempotency-Key (или поле idempotencyKey) делает повтор безопасным: повторный запрос
+получает исходный ответ (с заголовком Idempotent-Replayed) без повторной блокировки лота.
+Частота ставок ограничена token bucket'ами на пользователя и на лот (RATE_LIMIT_BACKEND:
+memory — по умолчанию, postgres — общая UNLOGGED-таблица, redis — RATE_LIMIT_REDIS_URL); при превышении — 429
+с Retry-After. Ставки ниже закэшированного минимума отклоняются без обращения к БД — только пока
+инстанс слушает NOTIFY auction_cache: правка лота в админке может понизить цену или шаг.
+После ставки будится catalog-publish (CATALOG_PUBLISH_URL), чтобы обновить снимок каталога в CDN.
+Окончательно закрытые лоты запоминаются в памяти инстанса: повторные ставки в них отклоняются без БД,
+пока auction-admin не сбросит запись через NOTIFY auction_cache (или не истечёт TTL).
+Запрос с Idempotency-Key перед таким отказом сверяется с idempotency_keys (чтение по PK): повтор уже
+принятой ставки получает её исходный ответ, а не отказ.
+Ставка занимает слот из квоты соединений сообщества (vk_group_id, заголовок X-Vk-Group-Id): при
+исчерпанной квоте — 503 с Retry-After, неподключённое сообщество или лот чужого сообщества — 404.
 """
 import json
+import math
 import os
-import urllib.request
-import urllib.parse
-import psycopg2
-from datetime import datetime, timezone, timedelta
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
 
 SCHEMA = "t_p68201414_vk_auction_app_1"
 OUTBID_COOLDOWN_MINUTES = 5
+IDEMPOTENCY_TTL_SECONDS = 600
+IDEMPOTENCY_KEY_MAX_LEN = 128
+IDEMPOTENCY_CACHE_MAX_ITEMS = 1024
+
+USER_BID_RATE = 1.0  # жетонов в секунду
+USER_BID_BURST = 5
+LOT_BID_RATE = 20.0
+LOT_BID_BURST = 50
+RATE_LIMIT_MAX_BUCKETS = 10000
+REDIS_TIMEOUT_SECONDS = 0.5
+CATALOG_PUBLISH_INTERVAL_SECONDS = 5
+CATALOG_PUBLISH_PING_SECONDS = 1
+# Канал NOTIFY, которым auction-admin сбрасывает кэши функций; TTL — на случай, если слушатель недоступен
+CACHE_CHANNEL = "auction_cache"
+LOT_CACHE_TTL_SECONDS = 60
+LOT_CACHE_MAX_ITEMS = 10000
+CACHE_STATS_LOG_SECONDS = 60
+ENGINE_LOTS_TTL_SECONDS = 5
+ENGINE_TIMEOUT_SECONDS = 3
+# SQLSTATE, которым place_bid / set_auto_bid отклоняют ставку в лот движка
+ENGINE_OWNED_SQLSTATE = "P0004"
+
+# Ответы по ключам идемпотентности, уже известные этому инстансу: {key: (expires_monotonic, body)}
+_idempotency_cache = {}
+
+# Лоты, которые обслуживает движок: (expires_monotonic, {lot_id: engine_url})
+_engine_lots = (0.0, {})
+
+# Когда этот инстанс последний раз будил catalog-publish
+_catalog_publish_requested_at = 0.0
+
+# Когда этот инстанс последний раз писал счётчики кэша в лог
+_cache_stats_logged_at = 0.0
 
 CORS = {
     "Access-Control-Allow-Origin": "*",
     "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-    "Access-Control-Allow-Headers": "Content-Type, X-User-Id, X-User-Name, X-User-Avatar",
+    "Access-Control-Allow-Headers": "Content-Type, X-User-Id, X-User-Name, X-User-Avatar, Idempotency-Key, X-Vk-Group-Id",
 }
 
 
 def get_conn():
+    import psycopg2
     return psycopg2.connect(os.environ["DATABASE_URL"])
 
 
-def is_notification_enabled(cur, key: str) -> bool:
-    cur.execute(f"SELECT enabled FROM {SCHEMA}.notification_config WHERE key = '{key}'")
-    row = cur.fetchone()
-    return row[0] if row else False
+# ── Сообщества ────────────────────────────────────────────────────────────────
 
+class TenantError(Exception):
+    """Запрос нельзя обслужить для этого сообщества; status — HTTP-код ответа."""
 
-def send_vk_notification(user_id: str, message: str):
-    """Отправить уведомление через VK API."""
-    raw = str(user_id).strip()
-    if raw.startswith("id") and raw[2:].isdigit():
-        numeric_id = raw[2:]
-    elif raw.isdigit():
-        numeric_id = raw
-    else:
-        print(f"[notify] cannot resolve numeric id from: {raw}")
-        return
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
 
-    service_key = os.environ.get("VK_SERVICE_KEY", "")
-    if not service_key:
-        return
 
-    params = urllib.parse.urlencode({
-        "user_ids": numeric_id,
-        "message": message,
-        "access_token": service_key,
-        "v": "5.131",
-    })
-    url = f"https://api.vk.com/method/notifications.sendMessage?{params}"
+def vk_group_id(event: dict):
+    """vk_group_id из параметров запуска: заголовок X-Vk-Group-Id или параметр vk_group_id."""
+    headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+    raw = headers.get("x-vk-group-id") or (event.get("queryStringParameters") or {}).get("vk_group_id")
     try:
-        with urllib.request.urlopen(urllib.request.Request(url), timeout=5) as resp:
-            result = json.loads(resp.read().decode())
-            print(f"[notify] VK response for {numeric_id}: {result}")
-    except Exception as e:
-        print(f"[notify] VK send error: {e}")
+        return int(raw) if raw else None
+    except (TypeError, ValueError):
+        return None
+
+
+def acquire_tenant(cur, group_id) -> int:
+    """Сообщество запроса и слот его квоты соединений до закрытия соединения: не подключено — 404, слоты заняты — 503."""
+    cur.execute(f"SELECT tenant_id, slot FROM {SCHEMA}.acquire_tenant_slot(%s)", (group_id,))
+    tenant_id, slot = cur.fetchone()
+    if tenant_id is None:
+        raise TenantError(404, "Сообщество не подключено к аукциону")
+    if slot is None:
+        raise TenantError(503, "Слишком много запросов, попробуйте через пару секунд")
+    return tenant_id
+
+
+def tenant_error_response(e: TenantError) -> dict:
+    headers = {**CORS, "Retry-After": "1"} if e.status == 503 else CORS
+    return {"statusCode": e.status, "headers": headers, "body": json.dumps({"error": str(e)})}
 
 
-def notify_outbid_users(conn, cur, lot_id: int, new_leader_id: str, lot_title: str, new_price: int):
+def get_tenant_conn(event: dict, lot_id: int):
     """
-    Обновляет outbid_tracking для всех кого перебили.
-    Отправляет уведомление тем, кто не лидер и чей таймер истёк (>= COOLDOWN).
+    Autocommit-соединение со слотом сообщества запроса. TenantError, если слот не достался
+    или лот принадлежит другому сообществу: процедуры ставок сообщество не проверяют.
     """
-    if not is_notification_enabled(cur, "outbid"):
-        return
-
-    now = datetime.now(timezone.utc)
-    uid = new_leader_id.replace("'", "''")
+    conn = get_conn()
+    # Процедура — единственный запрос, autocommit избавляет от отдельного COMMIT
+    conn.autocommit = True
+    try:
+        cur = conn.cursor()
+        tenant_id = acquire_tenant(cur, vk_group_id(event))
+        cur.execute(f"SELECT 1 FROM {SCHEMA}.lots WHERE id = %s AND tenant_id = %s", (lot_id, tenant_id))
+        if cur.fetchone() is None:
+            raise TenantError(404, "Лот не найден")
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+
+# ── Исходящие HTTP-запросы ──────────────────────────────────────────────────
+# Keep-alive соединения переживают тёплые вызовы. У каждого хоста свой circuit breaker:
+# после breaker_failures ошибок подряд запросы к нему отклоняются сразу, пока не пройдёт
+# breaker_reset_seconds; затем пропускается один пробный запрос.
+
+class OutboundError(Exception):
+    pass
+
+
+class HttpClient:
+    def __init__(self, max_idle_per_host: int = 4, breaker_failures: int = 5, breaker_reset_seconds: float = 30.0):
+        self.max_idle_per_host = max_idle_per_host
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self._idle = {}      # (scheme, host, port) -> [соединения]
+        self._breakers = {}  # host -> (ошибок подряд, открыт до monotonic)
+        self.metrics = {"requests": 0, "errors": 0, "timeouts": 0, "rejected": 0, "budget_exhausted": 0,
+                        "connected": 0, "reused": 0, "seconds": 0.0}
+
+    def request(self, method: str, url: str, body=None, headers=None, timeout: float = 5.0, deadline=None):
+        """
+        (status, bytes). deadline — момент time.monotonic(), к которому запрос должен завершиться:
+        таймаут урезается до остатка, а если его нет — запрос не отправляется.
+        Ошибки сети, таймауты, отказы breaker'а и бюджета — OutboundError.
+        """
+        import http.client
+        import urllib.parse
+        parts = urllib.parse.urlsplit(url)
+        host = parts.hostname
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        idle = self._idle.setdefault((parts.scheme, host, parts.port), [])
+
+        started = time.monotonic()
+        # Бюджет вызывающего проверяется до breaker'а: его исчерпание — не отказ хоста
+        clipped = deadline is not None and deadline - started < timeout
+        if clipped:
+            timeout = deadline - started
+            if timeout <= 0:
+                self.metrics["budget_exhausted"] += 1
+                raise OutboundError(f"deadline exceeded: {host}")
+        failures, open_until = self._breakers.get(host, (0, 0.0))
+        if failures >= self.breaker_failures and started < open_until:
+            self.metrics["rejected"] += 1
+            raise OutboundError(f"circuit open: {host}")
+
+        self.metrics["requests"] += 1
+        try:
+            while True:
+                if deadline is not None and deadline - time.monotonic() < timeout:
+                    clipped = True
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        raise TimeoutError("deadline exceeded")
+                reused = bool(idle)
+                if reused:
+                    conn = idle.pop()
+                    conn.sock.settimeout(timeout)
+                    self.metrics["reused"] += 1
+                else:
+                    conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+                    conn = conn_cls(host, parts.port, timeout=timeout)
+                    self.metrics["connected"] += 1
+                try:
+                    conn.request(method, path, body=body, headers=headers or {})
+                    resp = conn.getresponse()
+                    data = resp.read()
+                    break
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    conn.close()
+                    # Сервер закрыл простаивавшее соединение — GET повторяем на следующем
+                    if not reused or method != "GET":
+                        raise
+                except BaseException:
+                    conn.close()
+                    raise
+        except Exception as e:
+            self.metrics["errors"] += 1
+            if isinstance(e, TimeoutError):
+                self.metrics["timeouts"] += 1
+            # Таймаут, урезанный до остатка бюджета, ничего не говорит о хосте
+            if not (clipped and isinstance(e, TimeoutError)):
+                self._record(host, ok=False)
+            raise OutboundError(f"{method} {host}: {e!r}") from e
+        finally:
+            self.metrics["seconds"] += time.monotonic() - started
+
+        if resp.will_close or len(idle) >= self.max_idle_per_host:
+            conn.close()
+        else:
+            idle.append(conn)
+        self._record(host, ok=resp.status < 500)
+        return resp.status, data
+
+    def get_json(self, url: str, timeout: float = 5.0, deadline=None):
+        status, data = self.request("GET", url, timeout=timeout, deadline=deadline)
+        if status >= 400:
+            raise OutboundError(f"GET {url.split('?', 1)[0]}: HTTP {status}")
+        return json.loads(data.decode())
+
+    def _record(self, host: str, ok: bool):
+        failures, _ = self._breakers.get(host, (0, 0.0))
+        if ok:
+            if failures >= self.breaker_failures:
+                print(f"[http] circuit closed: {host}")
+            self._breakers[host] = (0, 0.0)
+            return
+        failures += 1
+        open_until = 0.0
+        if failures >= self.breaker_failures:
+            open_until = time.monotonic() + self.breaker_reset_seconds
+            print(f"[http] circuit open: {host} after {failures} failures")
+        self._breakers[host] = (failures, open_until)
 
-    # Все уникальные участники лота кроме нового лидера
-    cur.execute(f"""
-        SELECT DISTINCT user_id FROM {SCHEMA}.bids
-        WHERE lot_id = {lot_id} AND user_id != '{uid}'
-    """)
-    participants = [row[0] for row in cur.fetchall()]
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return dict(self.metrics, open=[h for h, (f, until) in self._breakers.items()
+                                        if f >= self.breaker_failures and now < until])
 
-    for p_uid in participants:
-        p_uid_safe = p_uid.replace("'", "''")
 
-        # Обновляем/создаём запись в outbid_tracking
-        cur.execute(f"""
-            INSERT INTO {SCHEMA}.outbid_tracking (lot_id, user_id, last_outbid_at)
-            VALUES ({lot_id}, '{p_uid_safe}', '{now.isoformat()}')
-            ON CONFLICT (lot_id, user_id) DO UPDATE
-              SET last_outbid_at = '{now.isoformat()}'
-        """)
+http_client = HttpClient()
 
-    conn.commit()
-
-    # Проверяем кому нужно отправить уведомление
-    cutoff = now - timedelta(minutes=OUTBID_COOLDOWN_MINUTES)
-    cur.execute(f"""
-        SELECT ot.user_id
-        FROM {SCHEMA}.outbid_tracking ot
-        JOIN {SCHEMA}.notification_settings ns ON ns.user_id = ot.user_id
-        WHERE ot.lot_id = {lot_id}
-          AND ot.user_id != '{uid}'
-          AND ns.allowed = true
-          AND ot.last_outbid_at >= '{cutoff.isoformat()}'
-          AND (ot.last_notified_at IS NULL OR ot.last_notified_at < ot.last_outbid_at - INTERVAL '{OUTBID_COOLDOWN_MINUTES} minutes')
-    """)
-    to_notify = [row[0] for row in cur.fetchall()]
-
-    for p_uid in to_notify:
-        p_uid_safe = p_uid.replace("'", "''")
-        message = f"Вашу ставку перебили в аукционе «{lot_title}»! Текущая цена: {new_price:,} ₽. Не упустите лот!".replace(",", " ")
-        send_vk_notification(p_uid, message)
-        cur.execute(f"""
-            UPDATE {SCHEMA}.outbid_tracking
-            SET last_notified_at = '{now.isoformat()}'
-            WHERE lot_id = {lot_id} AND user_id = '{p_uid_safe}'
-        """)
 
-    if to_notify:
-        conn.commit()
+def request_catalog_publish():
+    """Будит catalog-publish (CATALOG_PUBLISH_URL) не чаще раза в окно публикации на инстанс: запрос уходит, ответ не ждём."""
+    global _catalog_publish_requested_at
+    url = os.environ.get("CATALOG_PUBLISH_URL")
+    now = time.monotonic()
+    if not url or now - _catalog_publish_requested_at < CATALOG_PUBLISH_INTERVAL_SECONDS:
+        return
+    _catalog_publish_requested_at = now
+    import http.client
+    import urllib.parse
+    parts = urllib.parse.urlsplit(url)
+    conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    conn = conn_cls(parts.hostname, parts.port, timeout=CATALOG_PUBLISH_PING_SECONDS)
+    try:
+        conn.request("POST", parts.path or "/", body=b"{}", headers={"Content-Type": "application/json"})
+    except Exception as e:
+        print(f"[catalog-publish] ping: {e}")
+    finally:
+        conn.close()
 
 
-def place_bid_internal(cur, lot_id: int, amount: int, user_id: str, user_name: str, user_avatar: str, now: datetime):
-    """Разместить ставку. Возвращает (bid_id, new_ends_at, extended, lot_title) или бросает исключение."""
-    cur.execute(f"""
-        SELECT id, current_price, step, ends_at, status, anti_snipe, anti_snipe_minutes, title
-        FROM {SCHEMA}.lots WHERE id = {lot_id}
-        FOR UPDATE
-    """)
-    row = cur.fetchone()
-    if not row:
-        raise ValueError("Лот не найден")
+class EngineRejected(Exception):
+    """Движок отклонил ставку — текст для пользователя, как RAISE EXCEPTION в процедурах."""
+
+
+def db_error_message(e):
+    """Текст RAISE EXCEPTION из процедур ставок (SQLSTATE P0001) или отказа движка; None для прочих ошибок."""
+    if isinstance(e, EngineRejected):
+        return str(e)
+    if getattr(e, "pgcode", None) == "P0001":
+        return e.diag.message_primary
+    return None
+
+
+class MemoryRateLimiter:
+    """Token bucket в памяти инстанса."""
+
+    def __init__(self, max_buckets: int):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()  # от давно не использованных к недавним
+
+    def take(self, bucket: str, rate: float, capacity: float) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(bucket, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        if bucket in self._buckets:
+            self._buckets.move_to_end(bucket)
+        elif len(self._buckets) >= self.max_buckets:
+            # Корзины, к которым давно не обращались, успели наполниться — их можно забыть
+            for _ in range(max(1, self.max_buckets // 10)):
+                self._buckets.popitem(last=False)
+        if tokens < 1:
+            self._buckets[bucket] = (tokens, now)
+            return (1 - tokens) / rate
+        self._buckets[bucket] = (tokens - 1, now)
+        return 0.0
+
+
+class PostgresRateLimiter:
+    """Общий token bucket в UNLOGGED-таблице rate_limit_buckets (функция take_rate_token)."""
+
+    def __init__(self):
+        self._conn = None
+
+    def take(self, bucket: str, rate: float, capacity: float) -> float:
+        if self._conn is None or self._conn.closed:
+            self._conn = get_conn()
+            self._conn.autocommit = True
+        with self._conn.cursor() as cur:
+            cur.execute(f"SELECT {SCHEMA}.take_rate_token(%s, %s, %s)", (bucket, rate, capacity))
+            return cur.fetchone()[0]
+
+
+class RedisRateLimiter:
+    """Общий token bucket в Redis (или совместимой заглушке) — атомарно через Lua-скрипт."""
+
+    SCRIPT = """
+        local b = redis.call('HMGET', KEYS[1], 't', 'ts')
+        local rate, cap, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+        local tokens = math.min(cap, (tonumber(b[1]) or cap) + (now - (tonumber(b[2]) or now)) * rate)
+        local wait = 0
+        if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+        redis.call('HSET', KEYS[1], 't', tokens, 'ts', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(cap / rate) + 1)
+        return tostring(wait)
+    """
 
-    lid, current_price, step, ends_at, status, anti_snipe, anti_snipe_min, title = row
+    def __init__(self, url: str):
+        import redis
+        self.client = redis.Redis.from_url(
+            url, socket_timeout=REDIS_TIMEOUT_SECONDS, socket_connect_timeout=REDIS_TIMEOUT_SECONDS,
+        )
+        self.client.ping()
+        self._take = self.client.register_script(self.SCRIPT)
 
-    if status != 'active' or ends_at <= now:
-        raise ValueError("Аукцион уже завершён")
+    def take(self, bucket: str, rate: float, capacity: float) -> float:
+        return float(self._take(keys=[f"rate:{bucket}"], args=[rate, capacity, time.time()]))
 
-    min_bid = current_price + step
-    if int(amount) < min_bid:
-        raise ValueError(f"Ставка слишком маленькая. Минимум: {min_bid} ₽")
 
-    new_ends_at = ends_at
-    extended = False
-    if anti_snipe:
-        ms_left = (ends_at - now).total_seconds()
-        if 0 < ms_left < anti_snipe_min * 60:
-            new_ends_at = ends_at + timedelta(minutes=anti_snipe_min)
-            extended = True
+def make_rate_limiter():
+    backend = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+    if backend == "postgres":
+        return PostgresRateLimiter()
+    if backend == "redis":
+        # Лимитер создаётся при импорте: недоступный Redis не должен ронять каждый вызов функции
+        try:
+            return RedisRateLimiter(os.environ["RATE_LIMIT_REDIS_URL"])
+        except Exception as e:
+            print(f"[rate-limit] redis unavailable, using memory buckets: {e}")
+    return MemoryRateLimiter(RATE_LIMIT_MAX_BUCKETS)
 
-    uid = user_id.replace("'", "''")
-    uname = user_name.replace("'", "''")
-    uavatar = user_avatar.replace("'", "''")
 
-    cur.execute(f"""
-        INSERT INTO {SCHEMA}.bids (lot_id, user_id, user_name, user_avatar, amount)
-        VALUES ({lot_id}, '{uid}', '{uname}', '{uavatar}', {int(amount)})
-        RETURNING id
-    """)
-    bid_id = cur.fetchone()[0]
+rate_limiter = make_rate_limiter()
 
-    cur.execute(f"""
-        UPDATE {SCHEMA}.lots
-        SET current_price = {int(amount)}, ends_at = '{new_ends_at.isoformat()}'
-        WHERE id = {lot_id}
-    """)
 
-    return bid_id, new_ends_at, extended, title
+def check_rate_limit(user_id: str, lot_id: int):
+    """Сколько секунд ждать до следующей ставки (0 — можно). При сбое общего бэкенда ставки пропускаются."""
+    try:
+        wait = rate_limiter.take(f"user:{user_id}", USER_BID_RATE, USER_BID_BURST)
+        if wait > 0:
+            return wait
+        return rate_limiter.take(f"lot:{lot_id}", LOT_BID_RATE, LOT_BID_BURST)
+    except Exception as e:
+        print(f"[rate-limit] backend error, allowing: {e}")
+        return 0.0
 
 
-def process_auto_bids(conn, cur, lot_id: int, current_price: int, current_leader_id: str):
-    """После ставки проверяем автоставки в цикле, пока есть кому перебивать."""
-    leader_id = current_leader_id
-    MAX_ROUNDS = 20
+def too_many_requests(wait: float) -> dict:
+    retry_after = max(1, math.ceil(wait))
+    return {
+        "statusCode": 429,
+        "headers": {**CORS, "Retry-After": str(retry_after), "Access-Control-Expose-Headers": "Retry-After"},
+        "body": json.dumps({"error": f"Слишком много ставок. Повторите через {retry_after} с"}),
+    }
 
-    for _ in range(MAX_ROUNDS):
-        now = datetime.now(timezone.utc)
 
-        cur.execute(f"""
-            SELECT id, current_price, step, ends_at, status, title
-            FROM {SCHEMA}.lots WHERE id = {lot_id} FOR UPDATE
-        """)
-        row = cur.fetchone()
-        if not row:
+# ── Кэш с инвалидацией через LISTEN ─────────────────────────────────────────
+# Записи живут между тёплыми вызовами. auction-admin после правки или остановки лотов шлёт NOTIFY
+# 'lot:<id>,<id>' (или 'lot:*') в канал CACHE_CHANNEL — сбрасываются все виды записей лота: 'lot', 'lot.price'.
+# Каждое чтение кэша сначала забирает пришедшие уведомления (poll без ожидания). Пока слушателя нет,
+# записи живут не дольше TTL.
+# Слушает отдельное соединение: по одному на тёплый инстанс, вне квоты соединений сообществ
+# (acquire_tenant_slot) — их число ограничено числом инстансов функции. CACHE_LISTEN=0 отключает
+# слушателя: остаётся TTL, а подсказки минимальной ставки не используются.
+
+class NotifyCache:
+    def __init__(self, channel: str, ttl: int, max_items: int, listen: bool = True):
+        self.channel = channel
+        self.listen = listen
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items = {}  # (вид, ключ) -> (expires_monotonic, значение)
+        self._listen_conn = None
+        self._listen_retry_at = 0.0
+        # Когда кэш последний раз сбрасывался: значение, прочитанное до этого, могло устареть
+        self.invalidated_at = 0.0
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "listening": False}
+
+    def _drain(self):
+        conn = self._listen_conn
+        if conn is None:
+            if not self.listen or time.monotonic() < self._listen_retry_at:
+                return
+            try:
+                import psycopg2
+                conn = psycopg2.connect(os.environ["DATABASE_URL"])
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {self.channel}")
+            except Exception as e:
+                print(f"[cache] listen failed, TTL only: {e}")
+                self._listen_retry_at = time.monotonic() + self.ttl
+                return
+            self._listen_conn = conn
+            self.stats["listening"] = True
+            # Уведомления, пришедшие до LISTEN, потеряны
+            self._items.clear()
+            self.invalidated_at = time.monotonic()
+        try:
+            conn.poll()
+        except Exception as e:
+            print(f"[cache] listen connection lost: {e}")
+            self._listen_conn = None
+            self.stats["listening"] = False
+            self._items.clear()
+            self.invalidated_at = time.monotonic()
             return
-        _, cp, step, ends_at, status, lot_title = row
-        if status != 'active' or ends_at <= now:
+        while conn.notifies:
+            self.invalidate(conn.notifies.pop(0).payload)
+
+    def invalidate(self, payload: str):
+        self.stats["invalidations"] += 1
+        self.invalidated_at = time.monotonic()
+        scope, _, ids = payload.partition(":")
+        ids = None if ids in ("", "*") else {int(i) for i in ids.split(",") if i.isdigit()}
+        for key in [k for k in self._items if k[0].split(".")[0] == scope and (ids is None or k[1] in ids)]:
+            del self._items[key]
+
+    def get(self, kind: str, key):
+        self._drain()
+        item = self._items.get((kind, key))
+        if item is None or item[0] < time.monotonic():
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return item[1]
+
+    def set(self, kind: str, key, value, since: float = None):
+        """since — момент (monotonic) чтения значения из БД: если кэш с тех пор сбрасывали, значение не кладётся."""
+        self._drain()
+        if since is not None and self.invalidated_at >= since:
             return
+        if len(self._items) >= self.max_items:
+            self._items.clear()
+        self._items[(kind, key)] = (time.monotonic() + self.ttl, value)
+
+
+lot_meta_cache = NotifyCache(
+    CACHE_CHANNEL, LOT_CACHE_TTL_SECONDS, LOT_CACHE_MAX_ITEMS, listen=os.environ.get("CACHE_LISTEN", "1") != "0",
+)
+
+# Тексты отказов процедур и движка, после которых стоит проверить, не закрыт ли лот окончательно
+LOT_CLOSED_ERRORS = ("Аукцион уже завершён", "Аукцион не активен")
+
+
+def remember_closed_lot(conn, lot_id: int):
+    """
+    После отказа «аукцион завершён/не активен» запоминает лот, если он закрыт насовсем: такой же отказ
+    приходит и лоту с отложенным стартом, который таймер откроет без уведомления админки.
+    """
+    since = time.monotonic()
+    try:
+        conn.rollback()
+        cur = conn.cursor()
+        cur.execute(f"SELECT status, ends_at <= NOW() FROM {SCHEMA}.lots WHERE id = %s", (lot_id,))
+        row = cur.fetchone()
+    except Exception as e:
+        print(f"[cache] closed lot check failed: {e}")
+        return
+    if row and (row[0] in ("finished", "cancelled") or (row[0] == "active" and row[1])):
+        lot_meta_cache.set("lot", lot_id, row[0], since=since)
 
-        next_bid = cp + step
+
+def price_hint(lot_id: int):
+    """
+    Минимальная следующая ставка из последних ответов. Цену и шаг может понизить только правка в админке,
+    а она сбрасывает запись через NOTIFY — поэтому без слушателя подсказке не верим.
+    """
+    min_bid = lot_meta_cache.get("lot.price", lot_id)
+    return min_bid if lot_meta_cache.stats["listening"] else None
+
+
+def remember_price_hint(lot_id: int, min_bid: int, since: float):
+    current = lot_meta_cache.get("lot.price", lot_id)
+    lot_meta_cache.set("lot.price", lot_id, max(min_bid, current or 0), since=since)
+
+
+def log_cache_stats():
+    global _cache_stats_logged_at
+    now = time.monotonic()
+    if now - _cache_stats_logged_at >= CACHE_STATS_LOG_SECONDS:
+        _cache_stats_logged_at = now
+        print(f"[cache] {lot_meta_cache.stats}")
+
+
+def get_idempotency_key(event: dict, body: dict, user_id: str):
+    """Ключ из заголовка Idempotency-Key (или поля idempotencyKey), привязанный к пользователю."""
+    raw = body.get("idempotencyKey") or ""
+    for name, value in (event.get("headers") or {}).items():
+        if name.lower() == "idempotency-key":
+            raw = value
+            break
+    raw = str(raw).strip()
+    if not raw:
+        return None
+    return f"{user_id}:{raw[:IDEMPOTENCY_KEY_MAX_LEN]}"
+
+
+def cached_response(key):
+    """Ответ из локального кэша идемпотентности (без обращения к БД) или None."""
+    if key is None:
+        return None
+    item = _idempotency_cache.get(key)
+    if item is None:
+        return None
+    expires, body = item
+    if expires < time.monotonic():
+        del _idempotency_cache[key]
+        return None
+    return body
+
+
+def key_committed(key) -> bool:
+    """
+    Выполнена ли уже команда с этим ключом (idempotency_keys, в т.ч. на другом инстансе или в движке).
+    Отказы без БД (закрытый лот, подсказка минимума) проверяют это перед ответом: повтор принятой ставки
+    должен получить её исходный ответ, даже если цена уже ушла выше. Ошибка чтения — True: пусть решает БД.
+    """
+    if key is None:
+        return False
+    try:
+        conn = get_conn()
+    except Exception as e:
+        print(f"[idempotency] key check failed: {e}")
+        return True
+    try:
+        cur = conn.cursor()
         cur.execute(f"""
-            SELECT user_id, user_name, user_avatar, max_amount
-            FROM {SCHEMA}.auto_bids
-            WHERE lot_id = {lot_id}
-              AND user_id != '{leader_id.replace("'", "''")}'
-              AND max_amount >= {next_bid}
-            ORDER BY max_amount DESC, created_at ASC
-            LIMIT 1
-        """)
-        auto = cur.fetchone()
-        if not auto:
-            return
+            SELECT 1 FROM {SCHEMA}.idempotency_keys
+            WHERE key = %s AND created_at >= NOW() - make_interval(secs => %s)
+        """, (key, IDEMPOTENCY_TTL_SECONDS))
+        return cur.fetchone() is not None
+    except Exception as e:
+        print(f"[idempotency] key check failed: {e}")
+        return True
+    finally:
+        conn.close()
 
-        auto_uid, auto_uname, auto_uavatar, auto_max = auto
 
+def remember_response(key, body: str):
+    if key is None:
+        return
+    if len(_idempotency_cache) >= IDEMPOTENCY_CACHE_MAX_ITEMS:
+        now = time.monotonic()
+        for k in [k for k, (expires, _) in _idempotency_cache.items() if expires < now]:
+            del _idempotency_cache[k]
+        if len(_idempotency_cache) >= IDEMPOTENCY_CACHE_MAX_ITEMS:
+            _idempotency_cache.pop(next(iter(_idempotency_cache)))
+    _idempotency_cache[key] = (time.monotonic() + IDEMPOTENCY_TTL_SECONDS, body)
+
+
+def replay(body: str) -> dict:
+    return {"statusCode": 200, "headers": {**CORS, "Idempotent-Replayed": "true"}, "body": body}
+
+
+def place_bid(cur, key, lot_id: int, amount: int, user_id: str, user_name: str, user_avatar: str, now: datetime):
+    """
+    Ставка одной процедурой place_bid_once → place_bid: блокировка лота, валидация, антиснайпинг,
+    ответ автоставок и outbid-трекинг выполняются на сервере за один round-trip.
+    Возвращает (replayed, result): при повторе ключа — сохранённый результат первой ставки.
+    """
+    cur.execute(
+        f"SELECT * FROM {SCHEMA}.place_bid_once(%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+        (key, lot_id, amount, user_id, user_name, user_avatar, now, OUTBID_COOLDOWN_MINUTES, IDEMPOTENCY_TTL_SECONDS),
+    )
+    return cur.fetchone()
+
+
+def set_auto_bid(cur, key, lot_id: int, max_amount: int, user_id: str, user_name: str, user_avatar: str, now: datetime):
+    """Установка автоставки и немедленный ответ по ней — процедура set_auto_bid_once, один round-trip."""
+    cur.execute(
+        f"SELECT * FROM {SCHEMA}.set_auto_bid_once(%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+        (key, lot_id, max_amount, user_id, user_name, user_avatar, now, OUTBID_COOLDOWN_MINUTES, IDEMPOTENCY_TTL_SECONDS),
+    )
+    return cur.fetchone()
+
+
+def engine_url_for(conn, lot_id: int, refresh: bool = False):
+    """URL движка, если лот горячий. Список горячих лотов перечитывается раз в ENGINE_LOTS_TTL_SECONDS."""
+    global _engine_lots
+    expires, lots = _engine_lots
+    if refresh or expires < time.monotonic():
+        cur = conn.cursor()
+        cur.execute(f"SELECT lot_id, engine_url FROM {SCHEMA}.engine_lots")
+        lots = dict(cur.fetchall())
+        _engine_lots = (time.monotonic() + ENGINE_LOTS_TTL_SECONDS, lots)
+    return lots.get(lot_id)
+
+
+def engine_command(engine_url: str, action: str, payload: dict):
+    """(replayed, result) от движка; отказ валидации — EngineRejected, недоступность — OutboundError."""
+    status, data = http_client.request(
+        "POST", f"{engine_url.rstrip('/')}/{action}", body=json.dumps(payload),
+        headers={"Content-Type": "application/json"}, timeout=ENGINE_TIMEOUT_SECONDS,
+    )
+    body = json.loads(data.decode() or "{}")
+    if status == 400:
+        raise EngineRejected(body.get("error", "Ставка отклонена"))
+    if status != 200:
+        raise OutboundError(f"engine {action}: HTTP {status}")
+    return body["replayed"], body["result"]
+
+
+def submit(conn, action: str, key, lot_id: int, value: int, user_id: str, user_name: str, user_avatar: str, now: datetime):
+    """Ставка (action="bid") или автоставка ("auto_bid"): процедурой БД или через движок, если лот горячий."""
+    payload = {"lotId": lot_id, "userId": user_id, "userName": user_name, "userAvatar": user_avatar, "idempotencyKey": key}
+    payload["amount" if action == "bid" else "maxAmount"] = value
+    engine_url = engine_url_for(conn, lot_id)
+    if engine_url is None:
+        call = place_bid if action == "bid" else set_auto_bid
         try:
-            cur.execute("BEGIN")
-            place_bid_internal(cur, lot_id, next_bid, auto_uid, auto_uname, auto_uavatar, now)
-            cur.execute(f"""
-                DELETE FROM {SCHEMA}.auto_bids
-                WHERE lot_id = {lot_id} AND max_amount < {next_bid}
-            """)
-            conn.commit()
-            print(f"[auto-bid] auto bid placed: lot={lot_id} user={auto_uid} amount={next_bid}")
-            notify_outbid_users(conn, cur, lot_id, auto_uid, lot_title, next_bid)
-            leader_id = auto_uid
+            return call(conn.cursor(), key, lot_id, value, user_id, user_name, user_avatar, now)
         except Exception as e:
-            print(f"[auto-bid] skip: {e}")
-            try:
-                conn.rollback()
-            except Exception:
-                pass
-            return
+            if getattr(e, "pgcode", None) != ENGINE_OWNED_SQLSTATE:
+                raise
+        # Лот стал горячим позже, чем мы перечитали список
+        engine_url = engine_url_for(conn, lot_id, refresh=True)
+        if engine_url is None:
+            raise EngineRejected("Лот временно недоступен, повторите ставку")
+    return engine_command(engine_url, action, payload)
 
 
 def handler(event: dict, context) -> dict:
@@ -256,103 +689,122 @@ def handler(event: dict, context) -> dict:
         conn.close()
         return {"statusCode": 200, "headers": CORS, "body": json.dumps({"ok": True})}
 
+    key = get_idempotency_key(event, body, user_id)
+    cached = cached_response(key)
+    if cached is not None:
+        return replay(cached)
+
+    # Закрытый лот отклоняется без блокировки лота и без расхода жетонов: открыть его снова может только
+    # правка из админки, а она сбрасывает кэш. Повтор по ключу уже принятой команды идёт обычным путём
+    log_cache_stats()
+    if lot_meta_cache.get("lot", int(lot_id)) and not key_committed(key):
+        error = "Аукцион не активен" if action == "auto_bid" else "Аукцион уже завершён"
+        return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": error})}
+
     # ── Установить/обновить автоставку ───────────────────────────────────────
     if action == "auto_bid":
         max_amount = body.get("maxAmount")
         if not max_amount:
             return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": "Не указан максимум"})}
 
-        conn = get_conn()
-        cur = conn.cursor()
-
-        uid = user_id.replace("'", "''")
-        uname = user_name.replace("'", "''")
-        uavatar = user_avatar.replace("'", "''")
+        wait = check_rate_limit(user_id, int(lot_id))
+        if wait > 0:
+            return too_many_requests(wait)
 
-        cur.execute(f"SELECT status FROM {SCHEMA}.lots WHERE id = {int(lot_id)}")
-        row = cur.fetchone()
-        if not row or row[0] != 'active':
+        try:
+            conn = get_tenant_conn(event, int(lot_id))
+        except TenantError as e:
+            return tenant_error_response(e)
+        try:
+            replayed, r = submit(
+                conn, "auto_bid", key, int(lot_id), int(max_amount), user_id, user_name, user_avatar, datetime.now(timezone.utc)
+            )
+        except OutboundError as e:
+            print(f"[engine] {e}")
+            return {"statusCode": 503, "headers": CORS, "body": json.dumps({"error": "Сервис ставок временно недоступен"})}
+        except Exception as e:
+            msg = db_error_message(e)
+            if msg in LOT_CLOSED_ERRORS:
+                remember_closed_lot(conn, int(lot_id))
+            if msg is None:
+                raise
+            return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": msg})}
+        finally:
             conn.close()
-            return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": "Аукцион не активен"})}
 
-        cur.execute(f"""
-            INSERT INTO {SCHEMA}.auto_bids (lot_id, user_id, user_name, user_avatar, max_amount)
-            VALUES ({int(lot_id)}, '{uid}', '{uname}', '{uavatar}', {int(max_amount)})
-            ON CONFLICT (lot_id, user_id) DO UPDATE
-              SET max_amount = EXCLUDED.max_amount,
-                  user_name = EXCLUDED.user_name,
-                  user_avatar = EXCLUDED.user_avatar
-        """)
-        conn.commit()
+        response_body = json.dumps({"ok": True, "readToken": f"{int(lot_id)}:{r['lot_version']}"})
+        remember_response(key, response_body)
+        if replayed:
+            return replay(response_body)
 
-        cur.execute(f"""
-            SELECT current_price, step, title
-            FROM {SCHEMA}.lots WHERE id = {int(lot_id)} FOR UPDATE
-        """)
-        lot_row = cur.fetchone()
-        if lot_row:
-            cp, step, lot_title = lot_row
-            cur.execute(f"""
-                SELECT user_id FROM {SCHEMA}.bids
-                WHERE lot_id = {int(lot_id)}
-                ORDER BY amount DESC, created_at ASC
-                LIMIT 1
-            """)
-            leader_row = cur.fetchone()
-            current_leader_id = leader_row[0] if leader_row else None
-            if current_leader_id != user_id and int(max_amount) >= cp + step:
-                try:
-                    cur.execute("BEGIN")
-                    place_bid_internal(cur, int(lot_id), cp + step, user_id, user_name, user_avatar, datetime.now(timezone.utc))
-                    conn.commit()
-                    notify_outbid_users(conn, cur, int(lot_id), user_id, lot_title, cp + step)
-                    print(f"[auto-bid] immediate auto bid: lot={lot_id} user={user_id} amount={cp + step}")
-                except Exception as e:
-                    print(f"[auto-bid] immediate skip: {e}")
-                    try:
-                        conn.rollback()
-                    except Exception:
-                        pass
+        request_catalog_publish()
+        if r["rounds"]:
+            print(f"[auto-bid] lot={lot_id} rounds={r['rounds']} leader={r['leader_id']} price={r['final_price']}")
+        if r["notify_user_ids"]:
+            print(f"[notify] lot={lot_id} outbid queued for {len(r['notify_user_ids'])} users")
 
-        conn.close()
-        return {"statusCode": 200, "headers": CORS, "body": json.dumps({"ok": True})}
+        return {"statusCode": 200, "headers": CORS, "body": response_body}
 
     # ── Разместить обычную ставку ─────────────────────────────────────────────
     amount = body.get("amount")
     if not amount:
         return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": "Не указана сумма"})}
 
-    conn = get_conn()
-    cur = conn.cursor()
+    # Заведомо проигрышная ставка отклоняется до блокировки лота и без расхода жетонов — но не повтор
+    # уже принятой ставки: цена могла уйти выше именно из-за неё
+    min_bid = price_hint(int(lot_id))
+    if min_bid is not None and int(amount) < min_bid and not key_committed(key):
+        return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": f"Ставка слишком маленькая. Минимум: {min_bid} ₽"})}
+
+    wait = check_rate_limit(user_id, int(lot_id))
+    if wait > 0:
+        return too_many_requests(wait)
+
+    try:
+        conn = get_tenant_conn(event, int(lot_id))
+    except TenantError as e:
+        return tenant_error_response(e)
     now = datetime.now(timezone.utc)
+    started = time.monotonic()
 
     try:
-        bid_id, new_ends_at, extended, lot_title = place_bid_internal(
-            cur, int(lot_id), int(amount), user_id, user_name, user_avatar, now
-        )
-        conn.commit()
-    except ValueError as e:
-        conn.rollback()
+        replayed, r = submit(conn, "bid", key, int(lot_id), int(amount), user_id, user_name, user_avatar, now)
+    except OutboundError as e:
+        print(f"[engine] {e}")
+        return {"statusCode": 503, "headers": CORS, "body": json.dumps({"error": "Сервис ставок временно недоступен"})}
+    except Exception as e:
+        msg = db_error_message(e)
+        if msg in LOT_CLOSED_ERRORS:
+            remember_closed_lot(conn, int(lot_id))
+        if msg is None:
+            raise
+        return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": msg})}
+    finally:
         conn.close()
-        return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": str(e)})}
 
     result = {
         "ok": True,
-        "bidId": bid_id,
-        "newPrice": int(amount),
-        "extended": extended,
-        "newEndsAt": new_ends_at.isoformat(),
+        "bidId": r["bid_id"],
+        "newPrice": r["new_price"],
+        "extended": r["extended"],
+        "newEndsAt": r["new_ends_at"],
+        "currentPrice": r["final_price"],
+        "leaderId": r["leader_id"],
+        # Передаётся в auction-lots, чтобы свежая ставка была видна даже при чтении с реплики
+        "readToken": f"{int(lot_id)}:{r['lot_version']}",
     }
+    response_body = json.dumps(result)
+    remember_response(key, response_body)
+    if r.get("min_next_bid"):
+        remember_price_hint(int(lot_id), r["min_next_bid"], since=started)
+    if replayed:
+        return replay(response_body)
 
-    try:
-        process_auto_bids(conn, cur, int(lot_id), int(amount), user_id)
-    except Exception as e:
-        print(f"[auto-bid] error: {e}")
+    request_catalog_publish()
+    if r["leader_id"] != user_id:
+        print(f"[auto-bid] lot={lot_id} outbid by auto bid: leader={r['leader_id']} price={r['final_price']}")
 
-    try:
-        notify_outbid_users(conn, cur, int(lot_id), user_id, lot_title, int(amount))
-    except Exception as e:
-        print(f"[notify] outbid error: {e}")
+    if r["notify_user_ids"]:
+        print(f"[notify] lot={lot_id} outbid queued for {len(r['notify_user_ids'])} users")
 
-    conn.close()
-    return {"statusCode": 200, "headers": CORS, "body": json.dumps(result)}
+    return {"statusCode": 200, "headers": CORS, "body": response_body}
@@ -3,90 +3,543 @@
 GET /  — список всех лотов (с последними ставками)
 GET /?id=1 — один лот с полной историей ставок
 GET /?id=1&userId=xxx — один лот + myAutoBid для данного пользователя
+  Общая часть карточки кэшируется по (id, version) лота; myAutoBid добавляется отдельно.
+GET /?action=schedule — время ближайшего события таймеров (завершение, старт, уведомление)
+GET /?action=bids&id=1[&limit=50][&cursor=...] — история ставок лота постранично
+GET /?action=bids&id=1&since=<bidId> — новые ставки после bidId (для live-обновления)
+  Ответ компактный: пользователи в словаре users, ставки ссылаются на них по индексу.
+GET /?action=me&userId=xxx — лоты, где пользователь ставил или держит автоставку, с его статусом
+  (leading / outbid / auto_bid / won / lost / cancelled) и остатком автоставки
+GET /?action=search&q=...[&limit=20][&offset=0] — поиск по названию и описанию с ранжированием
+Чтение идёт с реплики (DATABASE_REPLICA_URL), если она не отстаёт больше maxStaleness секунд
+и уже содержит readToken ("lotId:version" из ответа auction-bid); иначе — с primary.
+Анонимный каталог раздаётся снимком из CDN (catalog-publish); таймеры будят публикатор при смене статусов.
+Таймеры же рассылают уведомления из notification_queue: одно сообщение VK на пользователя за окно
+DIGEST_WINDOW_SECONDS, не чаще DIGEST_MIN_INTERVAL_SECONDS.
+Сообщество определяется по vk_group_id (заголовок X-Vk-Group-Id): каталог, поиск, «мои аукционы»
+и карточка видят только его лоты; запрос занимает слот из квоты соединений сообщества.
 """
+import base64
 import json
 import os
-import urllib.request
-import urllib.parse
-import psycopg2
+import re
+import time
+from collections import OrderedDict
 from datetime import datetime, timezone, timedelta
 
 SCHEMA = "t_p68201414_vk_auction_app_1"
+# За сколько минут до конца лота участникам приходит напоминание, например "60,15,5"
+REMINDER_WINDOWS_MINUTES = tuple(
+    int(m) for m in os.environ.get("REMINDER_WINDOWS_MINUTES", "60,15,5").split(",") if m.strip()
+)
+SWEEP_MAX_SLEEP_SECONDS = 30
+CATALOG_PUBLISH_INTERVAL_SECONDS = 5
+CATALOG_PUBLISH_PING_SECONDS = 1
+REPLICA_MAX_LAG_SECONDS = 5
+REPLICA_MAX_LAG_LIMIT_SECONDS = 60
+
+BID_HISTORY_DEFAULT_LIMIT = 50
+BID_HISTORY_MAX_LIMIT = 200
+BID_HISTORY_COLUMNS = ["id", "user", "amount", "createdAt"]
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 50
+
+LOT_CACHE_TTL_SECONDS = 60
+LOT_CACHE_MAX_ITEMS = 256
+REDIS_TIMEOUT_SECONDS = 0.5
+
+VK_TIMEOUT_SECONDS = 2
+# Рассылка дайджестов в одном вызове не дольше этого: иначе чтение каталога ждёт медленный VK
+NOTIFY_BUDGET_SECONDS = 5
+# Уведомления пользователя копятся столько секунд с первого события и уходят одним сообщением
+DIGEST_WINDOW_SECONDS = 30
+DIGEST_MIN_INTERVAL_SECONDS = 120
+# Сколько пользователей забирается из очереди за раз: следующая порция — только если остался бюджет
+DIGEST_CLAIM_USERS = 10
+DIGEST_MAX_LENGTH = 254  # предел message у notifications.sendMessage
+
+# Время следующей проверки таймеров; живёт между тёплыми вызовами функции
+_next_sweep_at = None
+
+# Когда этот инстанс последний раз будил catalog-publish
+_catalog_publish_requested_at = 0.0
 
 CORS = {
     "Access-Control-Allow-Origin": "*",
     "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-    "Access-Control-Allow-Headers": "Content-Type, X-User-Id, X-User-Name, X-User-Avatar",
+    "Access-Control-Allow-Headers": "Content-Type, X-User-Id, X-User-Name, X-User-Avatar, X-Vk-Group-Id",
 }
 
 
 def get_conn():
+    import psycopg2
     return psycopg2.connect(os.environ["DATABASE_URL"])
 
 
-def send_vk_notification(user_id: str, message: str):
+def parse_read_token(token: str):
+    """'lotId:version' → (lot_id, version); пустой или битый токен → (None, None)."""
+    try:
+        lot_id, version = token.split(":", 1)
+        return int(lot_id), int(version)
+    except (AttributeError, ValueError):
+        return None, None
+
+
+def get_read_conn(max_lag: float, read_token: str = ""):
+    """
+    Соединение для чтения и флаг «это реплика».
+    Реплика годится, если отстаёт не больше max_lag секунд и уже содержит версию лота из read_token —
+    так участник сразу видит свою ставку (read-your-writes). Иначе читаем с primary.
+    """
+    url = os.environ.get("DATABASE_REPLICA_URL")
+    if not url:
+        return get_conn(), False
+
+    import psycopg2
+    try:
+        conn = psycopg2.connect(url, connect_timeout=2)
+    except Exception as e:
+        print(f"[replica] connect failed, using primary: {e}")
+        return get_conn(), False
+
+    token_lot_id, token_version = parse_read_token(read_token)
+    try:
+        cur = conn.cursor()
+        # Если реплика всё применила, отставания нет, даже когда на primary давно не было записей
+        cur.execute(f"""
+            SELECT
+                CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                     ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+                END,
+                COALESCE((SELECT version >= %s FROM {SCHEMA}.lots WHERE id = %s), true)
+        """, (token_version, token_lot_id))
+        lag, has_token_version = cur.fetchone()
+        cur.close()
+        if lag <= max_lag and has_token_version:
+            return conn, True
+        print(f"[replica] lag={lag:.1f}s token_ok={has_token_version}, using primary")
+    except Exception as e:
+        print(f"[replica] lag check failed, using primary: {e}")
+    conn.close()
+    return get_conn(), False
+
+
+# ── Сообщества ────────────────────────────────────────────────────────────────
+
+class TenantError(Exception):
+    """Запрос нельзя обслужить для этого сообщества; status — HTTP-код ответа."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def vk_group_id(event: dict):
+    """vk_group_id из параметров запуска: заголовок X-Vk-Group-Id или параметр vk_group_id."""
+    headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+    raw = headers.get("x-vk-group-id") or (event.get("queryStringParameters") or {}).get("vk_group_id")
+    try:
+        return int(raw) if raw else None
+    except (TypeError, ValueError):
+        return None
+
+
+def acquire_tenant(cur, group_id) -> int:
+    """Сообщество запроса и слот его квоты соединений до закрытия соединения: не подключено — 404, слоты заняты — 503."""
+    cur.execute(f"SELECT tenant_id, slot FROM {SCHEMA}.acquire_tenant_slot(%s)", (group_id,))
+    tenant_id, slot = cur.fetchone()
+    if tenant_id is None:
+        raise TenantError(404, "Сообщество не подключено к аукциону")
+    if slot is None:
+        raise TenantError(503, "Слишком много запросов, попробуйте через пару секунд")
+    return tenant_id
+
+
+def tenant_error_response(e: TenantError) -> dict:
+    headers = {**CORS, "Retry-After": "1"} if e.status == 503 else CORS
+    return {"statusCode": e.status, "headers": headers, "body": json.dumps({"error": str(e)})}
+
+
+class LotCache:
+    """LRU-кэш готовых JSON-карточек лотов в памяти процесса, с TTL."""
+
+    def __init__(self, max_items: int, ttl: int):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._items = OrderedDict()
+
+    def get(self, key: str):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str):
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+
+class RedisLotCache:
+    """
+    Тот же интерфейс поверх Redis (или совместимой заглушки) — общий кэш для всех инстансов.
+    Ошибка Redis не роняет запрос: чтение и запись уходят в кэш памяти fallback.
+    """
+
+    def __init__(self, url: str, ttl: int, fallback: LotCache):
+        import redis
+        self.client = redis.Redis.from_url(
+            url, socket_timeout=REDIS_TIMEOUT_SECONDS, socket_connect_timeout=REDIS_TIMEOUT_SECONDS,
+        )
+        self.client.ping()
+        self.ttl = ttl
+        self.fallback = fallback
+
+    def get(self, key: str):
+        try:
+            value = self.client.get(key)
+        except Exception as e:
+            print(f"[lot-cache] redis get failed: {e}")
+            return self.fallback.get(key)
+        return value.decode() if value is not None else None
+
+    def set(self, key: str, value: str):
+        try:
+            self.client.set(key, value, ex=self.ttl)
+        except Exception as e:
+            print(f"[lot-cache] redis set failed: {e}")
+            self.fallback.set(key, value)
+
+
+def make_lot_cache():
+    """Кэш карточек: Redis из LOT_CACHE_REDIS_URL, а если он не задан, не установлен или недоступен — память инстанса."""
+    memory = LotCache(LOT_CACHE_MAX_ITEMS, LOT_CACHE_TTL_SECONDS)
+    url = os.environ.get("LOT_CACHE_REDIS_URL")
+    if not url:
+        return memory
+    try:
+        return RedisLotCache(url, LOT_CACHE_TTL_SECONDS, memory)
+    except Exception as e:
+        print(f"[lot-cache] redis unavailable, using memory cache: {e}")
+        return memory
+
+
+lot_cache = make_lot_cache()
+
+
+# ── Исходящие HTTP-запросы ──────────────────────────────────────────────────
+# Keep-alive соединения переживают тёплые вызовы. У каждого хоста свой circuit breaker:
+# после breaker_failures ошибок подряд запросы к нему отклоняются сразу, пока не пройдёт
+# breaker_reset_seconds; затем пропускается один пробный запрос.
+
+class OutboundError(Exception):
+    pass
+
+
+class HttpClient:
+    def __init__(self, max_idle_per_host: int = 4, breaker_failures: int = 5, breaker_reset_seconds: float = 30.0):
+        self.max_idle_per_host = max_idle_per_host
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self._idle = {}      # (scheme, host, port) -> [соединения]
+        self._breakers = {}  # host -> (ошибок подряд, открыт до monotonic)
+        self.metrics = {"requests": 0, "errors": 0, "timeouts": 0, "rejected": 0, "budget_exhausted": 0,
+                        "connected": 0, "reused": 0, "seconds": 0.0}
+
+    def request(self, method: str, url: str, body=None, headers=None, timeout: float = 5.0, deadline=None):
+        """
+        (status, bytes). deadline — момент time.monotonic(), к которому запрос должен завершиться:
+        таймаут урезается до остатка, а если его нет — запрос не отправляется.
+        Ошибки сети, таймауты, отказы breaker'а и бюджета — OutboundError.
+        """
+        import http.client
+        import urllib.parse
+        parts = urllib.parse.urlsplit(url)
+        host = parts.hostname
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        idle = self._idle.setdefault((parts.scheme, host, parts.port), [])
+
+        started = time.monotonic()
+        # Бюджет вызывающего проверяется до breaker'а: его исчерпание — не отказ хоста
+        clipped = deadline is not None and deadline - started < timeout
+        if clipped:
+            timeout = deadline - started
+            if timeout <= 0:
+                self.metrics["budget_exhausted"] += 1
+                raise OutboundError(f"deadline exceeded: {host}")
+        failures, open_until = self._breakers.get(host, (0, 0.0))
+        if failures >= self.breaker_failures and started < open_until:
+            self.metrics["rejected"] += 1
+            raise OutboundError(f"circuit open: {host}")
+
+        self.metrics["requests"] += 1
+        try:
+            while True:
+                if deadline is not None and deadline - time.monotonic() < timeout:
+                    clipped = True
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        raise TimeoutError("deadline exceeded")
+                reused = bool(idle)
+                if reused:
+                    conn = idle.pop()
+                    conn.sock.settimeout(timeout)
+                    self.metrics["reused"] += 1
+                else:
+                    conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+                    conn = conn_cls(host, parts.port, timeout=timeout)
+                    self.metrics["connected"] += 1
+                try:
+                    conn.request(method, path, body=body, headers=headers or {})
+                    resp = conn.getresponse()
+                    data = resp.read()
+                    break
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    conn.close()
+                    # Сервер закрыл простаивавшее соединение — GET повторяем на следующем
+                    if not reused or method != "GET":
+                        raise
+                except BaseException:
+                    conn.close()
+                    raise
+        except Exception as e:
+            self.metrics["errors"] += 1
+            if isinstance(e, TimeoutError):
+                self.metrics["timeouts"] += 1
+            # Таймаут, урезанный до остатка бюджета, ничего не говорит о хосте
+            if not (clipped and isinstance(e, TimeoutError)):
+                self._record(host, ok=False)
+            raise OutboundError(f"{method} {host}: {e!r}") from e
+        finally:
+            self.metrics["seconds"] += time.monotonic() - started
+
+        if resp.will_close or len(idle) >= self.max_idle_per_host:
+            conn.close()
+        else:
+            idle.append(conn)
+        self._record(host, ok=resp.status < 500)
+        return resp.status, data
+
+    def get_json(self, url: str, timeout: float = 5.0, deadline=None):
+        status, data = self.request("GET", url, timeout=timeout, deadline=deadline)
+        if status >= 400:
+            raise OutboundError(f"GET {url.split('?', 1)[0]}: HTTP {status}")
+        return json.loads(data.decode())
+
+    def _record(self, host: str, ok: bool):
+        failures, _ = self._breakers.get(host, (0, 0.0))
+        if ok:
+            if failures >= self.breaker_failures:
+                print(f"[http] circuit closed: {host}")
+            self._breakers[host] = (0, 0.0)
+            return
+        failures += 1
+        open_until = 0.0
+        if failures >= self.breaker_failures:
+            open_until = time.monotonic() + self.breaker_reset_seconds
+            print(f"[http] circuit open: {host} after {failures} failures")
+        self._breakers[host] = (failures, open_until)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return dict(self.metrics, open=[h for h, (f, until) in self._breakers.items()
+                                        if f >= self.breaker_failures and now < until])
+
+
+http_client = HttpClient()
+
+
+def send_vk_notification(user_id: str, message: str, deadline=None) -> bool:
+    """False — VK недоступен (сеть, breaker, бюджет) и отправку стоит повторить; иначе True, даже если VK отказал."""
     raw = str(user_id).strip()
     if raw.startswith("id") and raw[2:].isdigit():
         numeric_id = raw[2:]
     elif raw.isdigit():
         numeric_id = raw
     else:
-        return
+        return True
     service_key = os.environ.get("VK_SERVICE_KEY", "")
     if not service_key:
-        return
+        return True
+    import urllib.parse
     params = urllib.parse.urlencode({"user_ids": numeric_id, "message": message, "access_token": service_key, "v": "5.131"})
     try:
-        with urllib.request.urlopen(urllib.request.Request(f"https://api.vk.com/method/notifications.sendMessage?{params}"), timeout=5) as resp:
-            print(f"[notify-15min] VK: {json.loads(resp.read().decode())}")
+        result = http_client.get_json(f"https://api.vk.com/method/notifications.sendMessage?{params}",
+                                      timeout=VK_TIMEOUT_SECONDS, deadline=deadline)
+        print(f"[notify] VK: {result}")
+    except OutboundError as e:
+        print(f"[notify] error: {e}")
+        return False
     except Exception as e:
-        print(f"[notify-15min] error: {e}")
+        print(f"[notify] error: {e}")
+    return True
 
 
-def notify_ending_soon(conn, cur):
-    """Уведомляем участников лотов которые заканчиваются через 10-15 минут (один раз на лот)."""
-    cur.execute(f"""
-        SELECT enabled FROM t_p68201414_vk_auction_app_1.notification_config WHERE key = 'ending_15min'
-    """)
-    row = cur.fetchone()
-    if not row or not row[0]:
+def request_catalog_publish():
+    """Будит catalog-publish (CATALOG_PUBLISH_URL) не чаще раза в окно публикации на инстанс: запрос уходит, ответ не ждём."""
+    global _catalog_publish_requested_at
+    url = os.environ.get("CATALOG_PUBLISH_URL")
+    now = time.monotonic()
+    if not url or now - _catalog_publish_requested_at < CATALOG_PUBLISH_INTERVAL_SECONDS:
         return
+    _catalog_publish_requested_at = now
+    import http.client
+    import urllib.parse
+    parts = urllib.parse.urlsplit(url)
+    conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    conn = conn_cls(parts.hostname, parts.port, timeout=CATALOG_PUBLISH_PING_SECONDS)
+    try:
+        conn.request("POST", parts.path or "/", body=b"{}", headers={"Content-Type": "application/json"})
+    except Exception as e:
+        print(f"[catalog-publish] ping: {e}")
+    finally:
+        conn.close()
 
-    now = datetime.now(timezone.utc)
-    window_end = now + timedelta(minutes=15)
-    window_start = now + timedelta(minutes=10)
 
+def notify_ending_soon(conn, cur, now: datetime):
+    """
+    Ставит в очередь дайджестов участников всех лотов, у которых началось очередное окно напоминания
+    (REMINDER_WINDOWS_MINUTES), — одним запросом. Если у лота разом подошло несколько окон
+    (лот создан незадолго до конца), участники получают одно напоминание, а окна отмечаются все.
+    Выключенные напоминания (notification_config) проверяются тем же запросом.
+    Окно снова становится должным, только если лот из него вышел (например, админка отодвинула конец):
+    продление антиснайпингом внутри окна напоминание не повторяет.
+    """
+    # Отметка окна снимается, пока лот вне окна; повторно она появится, когда окно начнётся заново.
+    # Завершённым и отменённым лотам отметки больше не нужны: без этого таблица росла бы на лот за окно
     cur.execute(f"""
-        SELECT id, title FROM {SCHEMA}.lots
-        WHERE status = 'active'
-          AND notified_15min = false
-          AND ends_at BETWEEN '{window_start.isoformat()}' AND '{window_end.isoformat()}'
-    """)
-    lots_to_notify = cur.fetchall()
+        DELETE FROM {SCHEMA}.lot_reminders r
+        USING {SCHEMA}.lots l
+        WHERE l.id = r.lot_id
+          AND (l.status IN ('finished', 'cancelled') OR l.ends_at - make_interval(mins => r.window_minutes) > %s)
+    """, (now,))
+    # Параллельный таймер, успевший отметить окно первым, оставит этому вызову пустой RETURNING
+    cur.execute(f"""
+        WITH due AS (
+            SELECT l.id, l.title, l.current_price, l.ends_at, w.minutes
+            FROM {SCHEMA}.lots l
+            CROSS JOIN unnest(%(windows)s::int[]) AS w (minutes)
+            WHERE l.status = 'active'
+              AND EXISTS (SELECT 1 FROM {SCHEMA}.notification_config c WHERE c.key = 'ending_15min' AND c.enabled)
+              AND l.ends_at > %(now)s
+              AND l.ends_at <= %(now)s + make_interval(mins => w.minutes)
+              AND NOT EXISTS (
+                  SELECT 1 FROM {SCHEMA}.lot_reminders r WHERE r.lot_id = l.id AND r.window_minutes = w.minutes
+              )
+        ), marked AS (
+            INSERT INTO {SCHEMA}.lot_reminders (lot_id, window_minutes, ends_at, sent_at)
+            SELECT id, minutes, ends_at, %(now)s FROM due
+            ON CONFLICT (lot_id, window_minutes) DO NOTHING
+            RETURNING lot_id
+        ), lots_due AS (
+            SELECT DISTINCT d.id, d.title, d.current_price, d.ends_at
+            FROM due d JOIN marked m ON m.lot_id = d.id
+        )
+        INSERT INTO {SCHEMA}.notification_queue AS q (user_id, kind, lot_id, lot_title, price, ends_at)
+        SELECT DISTINCT b.user_id, 'ending', d.id, d.title, d.current_price, d.ends_at
+        FROM lots_due d
+        JOIN {SCHEMA}.bids b ON b.lot_id = d.id
+        JOIN {SCHEMA}.notification_settings ns ON ns.user_id = b.user_id
+        WHERE ns.allowed = true
+        ON CONFLICT (user_id, kind, lot_id) DO UPDATE SET price = EXCLUDED.price, ends_at = EXCLUDED.ends_at
+    """, {"windows": list(REMINDER_WINDOWS_MINUTES), "now": now})
+    queued = cur.rowcount
+    conn.commit()
+    if queued:
+        print(f"[notify-ending] queued {queued} notifications")
 
-    for lot_id, lot_title in lots_to_notify:
-        cur.execute(f"""
-            SELECT DISTINCT b.user_id
-            FROM {SCHEMA}.bids b
-            JOIN {SCHEMA}.notification_settings ns ON ns.user_id = b.user_id
-            WHERE b.lot_id = {lot_id} AND ns.allowed = true
-        """)
-        participants = [r[0] for r in cur.fetchall()]
 
-        cur.execute(f"""
-            SELECT ends_at FROM {SCHEMA}.lots WHERE id = {lot_id}
-        """)
-        ends_at = cur.fetchone()[0]
-        minutes_left = int((ends_at - now).total_seconds() / 60)
-        message = f"⏰ До окончания аукциона «{lot_title}» осталось ~{minutes_left} мин! Успейте сделать ставку."
+def format_price(price) -> str:
+    return f"{price or 0:,}".replace(",", " ")
+
+
+def digest_message(events: list, now: datetime) -> str:
+    """
+    Одно сообщение на все накопленные события пользователя: [(kind, lot_title, price, ends_at)].
+    Одиночное событие звучит как раньше; длинный список обрезается до DIGEST_MAX_LENGTH с «и ещё N».
+    """
+    def minutes_left(ends_at):
+        return max(int((ends_at - now).total_seconds() / 60), 0) if ends_at else 0
 
-        for uid in participants:
-            send_vk_notification(uid, message)
+    if len(events) == 1:
+        kind, title, price, ends_at = events[0]
+        if kind == "outbid":
+            return f"Вашу ставку перебили в аукционе «{title}»! Текущая цена: {format_price(price)} ₽. Не упустите лот!"
+        return f"⏰ До окончания аукциона «{title}» осталось ~{minutes_left(ends_at)} мин! Успейте сделать ставку."
 
-        cur.execute(f"UPDATE {SCHEMA}.lots SET notified_15min = true WHERE id = {lot_id}")
+    sections = [
+        ("Вашу ставку перебили", [f"«{t}» — {format_price(p)} ₽" for k, t, p, _ in events if k == "outbid"]),
+        ("⏰ Скоро завершатся", [f"«{t}» — ~{minutes_left(e)} мин" for k, t, _, e in events if k == "ending"]),
+    ]
+    sections = [(head, items) for head, items in sections if items]
+    # Сколько пунктов каждой секции влезает: урезаем самую длинную, пока сообщение не уложится
+    shown = [len(items) for _, items in sections]
+    while True:
+        parts = []
+        for (head, items), n in zip(sections, shown):
+            rest = f" и ещё {len(items) - n}" if n < len(items) else ""
+            parts.append(f"{head}: {', '.join(items[:n])}{rest}.")
+        message = " ".join(parts)
+        if len(message) <= DIGEST_MAX_LENGTH or max(shown) <= 1:
+            return message[:DIGEST_MAX_LENGTH]
+        shown[shown.index(max(shown))] -= 1
 
-    if lots_to_notify:
+
+def send_digests(conn, cur):
+    """
+    Отправляет накопленные уведомления: одно сообщение VK на пользователя за окно DIGEST_WINDOW_SECONDS
+    и не чаще раза в DIGEST_MIN_INTERVAL_SECONDS. Пользователи забираются порциями по DIGEST_CLAIM_USERS,
+    пока не выйдет NOTIFY_BUDGET_SECONDS; параллельные инстансы делят их через claim_notification_digests.
+    События удаляются из очереди только после отправки (ack_notification_digest): если VK недоступен,
+    дайджест повторится через DIGEST_MIN_INTERVAL_SECONDS, а не дошедших в бюджете пользователей
+    сразу получает следующий вызов.
+    """
+    deadline = time.monotonic() + NOTIFY_BUDGET_SECONDS
+    sent = 0
+    vk_down = False
+    while not vk_down and time.monotonic() < deadline:
+        now = datetime.now(timezone.utc)
+        cur.execute(f"SELECT * FROM {SCHEMA}.claim_notification_digests(%s, %s, %s, %s)",
+                    (now, DIGEST_WINDOW_SECONDS, DIGEST_MIN_INTERVAL_SECONDS, DIGEST_CLAIM_USERS))
+        rows = cur.fetchall()
         conn.commit()
+        if not rows:
+            break
+
+        by_user = OrderedDict()
+        for row in sorted(rows, key=lambda r: (r[0], r[1] != "outbid", r[2])):
+            by_user.setdefault(row[0], []).append(row[1:])
+        users = list(by_user)
+        for i, user_id in enumerate(users):
+            if time.monotonic() >= deadline:
+                cur.execute(f"SELECT {SCHEMA}.release_notification_digests(%s::text[], %s)", (users[i:], now))
+                conn.commit()
+                break
+            events = by_user[user_id]
+            if not send_vk_notification(user_id, digest_message([(k, t, p, e) for k, _, t, p, e in events], now), deadline):
+                # Этот пользователь повторится после паузы; остальных не держим, пока VK не ответит
+                cur.execute(f"SELECT {SCHEMA}.release_notification_digests(%s::text[], %s)", (users[i + 1:], now))
+                conn.commit()
+                vk_down = True
+                break
+            # Пустые ends_at у outbid: без приведения ARRAY[NULL] не подойдёт под timestamptz[]
+            cur.execute(
+                f"SELECT {SCHEMA}.ack_notification_digest(%s, %s::text[], %s::int[], %s::int[], %s::timestamptz[])",
+                (user_id, [e[0] for e in events], [e[1] for e in events], [e[3] for e in events], [e[4] for e in events]),
+            )
+            conn.commit()
+            sent += 1
+        if len(users) < DIGEST_CLAIM_USERS:
+            break
+    if sent or vk_down:
+        print(f"[digest] vk_calls={sent} vk_down={vk_down} {http_client.snapshot()}")
 
 
 def finish_expired_lots(cur):
@@ -95,53 +548,344 @@ def finish_expired_lots(cur):
         UPDATE {SCHEMA}.lots l
         SET status = 'finished',
             winner_id   = (SELECT user_id  FROM {SCHEMA}.bids WHERE lot_id = l.id ORDER BY amount DESC, created_at ASC LIMIT 1),
-            winner_name = (SELECT user_name FROM {SCHEMA}.bids WHERE lot_id = l.id ORDER BY amount DESC, created_at ASC LIMIT 1),
-            payment_status = COALESCE(l.payment_status, 'pending')
+            winner_name = (SELECT u.name FROM {SCHEMA}.bids b JOIN {SCHEMA}.users u ON u.id = b.user_key
+                           WHERE b.lot_id = l.id ORDER BY b.amount DESC, b.created_at ASC LIMIT 1),
+            payment_status = COALESCE(l.payment_status, 'pending'),
+            version = nextval('{SCHEMA}.lot_version_seq')
         WHERE l.status = 'active' AND l.ends_at <= NOW()
     """)
+    return cur.rowcount
 
 
 def activate_scheduled_lots(cur):
     """Активируем лоты с отложенным стартом, если время пришло."""
     cur.execute(f"""
         UPDATE {SCHEMA}.lots
-        SET status = 'active', starts_at = starts_at
+        SET status = 'active', starts_at = starts_at, version = nextval('{SCHEMA}.lot_version_seq')
         WHERE status = 'upcoming' AND starts_at IS NOT NULL AND starts_at <= NOW()
     """)
+    return cur.rowcount
 
 
-def row_to_lot(row):
-    return {
-        "id": row[0],
-        "title": row[1],
-        "description": row[2],
-        "image": row[3],
-        "startPrice": row[4],
-        "currentPrice": row[5],
-        "step": row[6],
-        "endsAt": row[7].isoformat() if row[7] else None,
-        "status": row[8],
-        "winnerId": row[9],
-        "winnerName": row[10],
-        "antiSnipe": row[11],
-        "antiSnipeMinutes": row[12],
-        "paymentStatus": row[13],
-        "createdAt": row[14].isoformat() if row[14] else None,
-        "video": row[15] or "",
-        "videoDuration": row[16],
-        "startsAt": row[17].isoformat() if row[17] else None,
-    }
+def next_due_at(cur, now: datetime):
+    """Ближайший момент, когда одному из таймеров появится работа (или None, если ждать нечего)."""
+    # Начало ближайшего ещё не наступившего окна напоминания; каждое окно — отдельный проход по индексу ends_at
+    reminders = "".join(f"""
+            (SELECT MIN(ends_at) FROM {SCHEMA}.lots
+             WHERE status = 'active' AND ends_at > '{(now + timedelta(minutes=m)).isoformat()}')
+              - INTERVAL '{m} minutes',""" for m in REMINDER_WINDOWS_MINUTES)
+    cur.execute(f"""
+        SELECT LEAST(
+            (SELECT MIN(ends_at) FROM {SCHEMA}.lots WHERE status = 'active'),
+            (SELECT MIN(starts_at) FROM {SCHEMA}.lots WHERE status = 'upcoming'),{reminders}
+            {SCHEMA}.next_notification_digest_at({DIGEST_WINDOW_SECONDS})
+        )
+    """)
+    return cur.fetchone()[0]
+
 
+def sweep_if_due(conn, cur, on_replica: bool = False):
+    """
+    Запускает таймеры только когда подошло время ближайшего события.
+    Ставки лишь отодвигают ends_at, поэтому сохранённое время может быть только раньше нужного;
+    изменения из админки подхватываются не позже чем через SWEEP_MAX_SLEEP_SECONDS.
+    Таймеры пишут в БД, поэтому при чтении с реплики для них открывается соединение с primary.
+    """
+    global _next_sweep_at
+    now = datetime.now(timezone.utc)
+    if _next_sweep_at is not None and now < _next_sweep_at:
+        return
+
+    if on_replica:
+        conn = get_conn()
+        cur = conn.cursor()
+    try:
+        changed = finish_expired_lots(cur) + activate_scheduled_lots(cur)
+        conn.commit()
+        if changed:
+            request_catalog_publish()
+        notify_ending_soon(conn, cur, now)
+        send_digests(conn, cur)
+        due = next_due_at(cur, now)
+    finally:
+        if on_replica:
+            conn.close()
 
-def row_to_bid(row):
+    _next_sweep_at = now + timedelta(seconds=SWEEP_MAX_SLEEP_SECONDS)
+    if due is not None and due < _next_sweep_at:
+        _next_sweep_at = due
+
+
+# ── Сериализация ────────────────────────────────────────────────────────────
+# Строки из БД кодируются в JSON напрямую, без промежуточных dict: для каждой формы ответа
+# один раз собирается функция row -> str. orjson (если установлен) ускоряет прочие ответы.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_json_str = json.encoder.encode_basestring_ascii
+
+
+def _enc_int(v):
+    return "null" if v is None else str(v)
+
+
+def _enc_str(v):
+    return "null" if v is None else _json_str(v)
+
+
+def _enc_bool(v):
+    return "null" if v is None else ("true" if v else "false")
+
+
+def _enc_ts(v):
+    return "null" if v is None else f'"{v.isoformat()}"'
+
+
+_ENCODERS = {"int": _enc_int, "str": _enc_str, "bool": _enc_bool, "ts": _enc_ts}
+
+
+def make_row_encoder(fields: list, extra_keys: tuple = ()):
+    """
+    fields — [(ключ JSON, тип int|str|bool|ts)] в порядке колонок строки;
+    extra_keys — ключи, значения которых передаются готовым JSON дополнительными аргументами.
+    Шаблон '{"id":%s,...}' собирается один раз, encode лишь подставляет закодированные колонки.
+    """
+    keys = [key for key, _ in fields] + list(extra_keys)
+    template = "{" + ",".join(json.dumps(key).replace("%", "%%") + ":%s" for key in keys) + "}"
+    encoders = [_ENCODERS[kind] for _, kind in fields]
+
+    def encode(row, *extra):
+        return template % (*[enc(value) for enc, value in zip(encoders, row)], *extra)
+
+    return encode
+
+
+def dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+
+LOT_FIELDS = [
+    ("id", "int"), ("title", "str"), ("description", "str"), ("image", "str"),
+    ("startPrice", "int"), ("currentPrice", "int"), ("step", "int"), ("endsAt", "ts"),
+    ("status", "str"), ("winnerId", "str"), ("winnerName", "str"), ("antiSnipe", "bool"),
+    ("antiSnipeMinutes", "int"), ("paymentStatus", "str"), ("createdAt", "ts"), ("video", "str"),
+    ("videoDuration", "int"), ("startsAt", "ts"),
+]
+CATALOG_LOT_FIELDS = LOT_FIELDS + [
+    ("leaderId", "str"), ("leaderName", "str"), ("leaderAvatar", "str"), ("bidCount", "int"),
+]
+BID_FIELDS = [
+    ("id", "int"), ("lotId", "int"), ("userId", "str"), ("userName", "str"),
+    ("userAvatar", "str"), ("amount", "int"), ("createdAt", "ts"),
+]
+
+encode_lot = make_row_encoder(LOT_FIELDS, extra_keys=("bids",))
+encode_catalog_lot = make_row_encoder(CATALOG_LOT_FIELDS, extra_keys=("bids",))
+encode_bid = make_row_encoder(BID_FIELDS)
+
+
+def encode_catalog(rows, recent_bids: dict) -> str:
+    """Каталог одной строкой: память растёт на закодированные лоты, а не на дерево dict-ов."""
+    return "[" + ",".join(encode_catalog_lot(r, "[" + ",".join(recent_bids.get(r[0], ())) + "]") for r in rows) + "]"
+
+
+def load_users(cur, user_keys) -> dict:
+    """{user_key: (vk_user_id, name, avatar)} — участники ответа одним запросом."""
+    keys = sorted(set(user_keys))
+    if not keys:
+        return {}
+    cur.execute(f"SELECT id, vk_user_id, name, avatar FROM {SCHEMA}.users WHERE id = ANY(%s)", (keys,))
+    return {r[0]: r[1:] for r in cur.fetchall()}
+
+
+def bid_row(r, users: dict) -> tuple:
+    """(id, lot_id, user_key, amount, created_at) → строка для encode_bid с данными участника."""
+    return (r[0], r[1]) + users[r[2]] + (r[3], r[4])
+
+
+def load_lot_json(cur, lot_id: int):
+    """Общая (одинаковая для всех зрителей) часть карточки лота в виде JSON."""
+    cur.execute(f"""
+        SELECT id, title, description, image, start_price, current_price, step,
+               ends_at, status, winner_id, winner_name, anti_snipe, anti_snipe_minutes,
+               payment_status, created_at, COALESCE(video, '') as video, video_duration, starts_at
+        FROM {SCHEMA}.lots WHERE id = {lot_id}
+    """)
+    row = cur.fetchone()
+    if not row:
+        return None
+
+    cur.execute(f"""
+        SELECT id, lot_id, user_key, amount, created_at
+        FROM {SCHEMA}.bids WHERE lot_id = {lot_id}
+        ORDER BY amount DESC, created_at ASC
+        LIMIT 50
+    """)
+    bid_rows = cur.fetchall()
+    users = load_users(cur, (r[2] for r in bid_rows))
+    bids_json = "[" + ",".join(encode_bid(bid_row(r, users)) for r in bid_rows) + "]"
+    return encode_lot(row, bids_json)
+
+
+def encode_cursor(amount: int, created_at: datetime, bid_id: int) -> str:
+    raw = json.dumps([amount, created_at.isoformat(), bid_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    amount, created_at, bid_id = json.loads(raw)
+    return int(amount), datetime.fromisoformat(created_at), int(bid_id)
+
+
+def bid_history(cur, lot_id: int, limit: int, cursor=None, since=None) -> dict:
+    """
+    Страница истории ставок. Порядок как в карточке лота: amount DESC, created_at, id.
+    В режиме since — ставки с id > since по возрастанию id.
+    """
+    if since is not None:
+        cur.execute(f"""
+            SELECT id, user_key, amount, created_at
+            FROM {SCHEMA}.bids
+            WHERE lot_id = %s AND id > %s
+            ORDER BY id
+            LIMIT %s
+        """, (lot_id, since, limit + 1))
+    elif cursor is not None:
+        amount, created_at, bid_id = cursor
+        cur.execute(f"""
+            SELECT id, user_key, amount, created_at
+            FROM {SCHEMA}.bids
+            WHERE lot_id = %s AND amount <= %s
+              AND (amount < %s OR (created_at, id) > (%s, %s))
+            ORDER BY amount DESC, created_at, id
+            LIMIT %s
+        """, (lot_id, amount, amount, created_at, bid_id, limit + 1))
+    else:
+        cur.execute(f"""
+            SELECT id, user_key, amount, created_at
+            FROM {SCHEMA}.bids
+            WHERE lot_id = %s
+            ORDER BY amount DESC, created_at, id
+            LIMIT %s
+        """, (lot_id, limit + 1))
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    known_users = load_users(cur, (r[1] for r in rows))
+    users = []
+    user_index = {}
+    bids = []
+    for bid_id, user_key, amount, created_at in rows:
+        idx = user_index.get(user_key)
+        if idx is None:
+            idx = user_index[user_key] = len(users)
+            user_id, user_name, user_avatar = known_users[user_key]
+            users.append({"id": user_id, "name": user_name, "avatar": user_avatar})
+        bids.append([bid_id, idx, amount, created_at.isoformat() if created_at else None])
+
+    result = {"lotId": lot_id, "users": users, "columns": BID_HISTORY_COLUMNS, "bids": bids, "hasMore": has_more}
+    if since is not None:
+        result["lastBidId"] = rows[-1][0] if rows else since
+    elif has_more:
+        last = rows[-1]
+        result["nextCursor"] = encode_cursor(last[2], last[3], last[0])
+    return result
+
+
+def my_lot_status(status: str, winner_id, leader_id, user_id: str, my_max_bid) -> str:
+    if status == "finished":
+        return "won" if winner_id == user_id else "lost"
+    if status == "cancelled":
+        return "cancelled"
+    if leader_id == user_id:
+        return "leading"
+    return "outbid" if my_max_bid is not None else "auto_bid"
+
+
+def my_lots(cur, user_id: str, tenant_id: int) -> list:
+    """Лоты пользователя одним запросом — работа пропорциональна его активности, а не размеру каталога."""
+    cur.execute(f"""
+        WITH my_bids AS (
+            SELECT lot_id, MAX(amount) AS my_max_bid, COUNT(*) AS my_bid_count
+            FROM {SCHEMA}.bids WHERE user_id = %s
+            GROUP BY lot_id
+        ), my_auto AS (
+            SELECT lot_id, max_amount FROM {SCHEMA}.auto_bids WHERE user_id = %s
+        )
+        SELECT l.id, l.title, l.image, l.current_price, l.step, l.ends_at, l.status, l.winner_id,
+               b.my_max_bid, COALESCE(b.my_bid_count, 0), a.max_amount, lead.user_id
+        FROM my_bids b
+        FULL JOIN my_auto a ON a.lot_id = b.lot_id
+        JOIN {SCHEMA}.lots l ON l.id = COALESCE(b.lot_id, a.lot_id) AND l.tenant_id = %s
+        LEFT JOIN LATERAL (
+            SELECT user_id FROM {SCHEMA}.bids
+            WHERE lot_id = l.id ORDER BY amount DESC, created_at ASC LIMIT 1
+        ) lead ON true
+        ORDER BY (l.status = 'active') DESC, l.ends_at DESC
+    """, (user_id, user_id, tenant_id))
+
+    result = []
+    for (lid, title, image, current_price, step, ends_at, status, winner_id,
+         my_max_bid, my_bid_count, auto_max, leader_id) in cur.fetchall():
+        auto_active = auto_max is not None and status in ("active", "upcoming") and auto_max >= current_price
+        result.append({
+            "id": lid,
+            "title": title,
+            "image": image,
+            "currentPrice": current_price,
+            "minNextBid": current_price + step,
+            "endsAt": ends_at.isoformat() if ends_at else None,
+            "status": status,
+            "myStatus": my_lot_status(status, winner_id, leader_id, user_id, my_max_bid),
+            "myMaxBid": my_max_bid,
+            "myBidCount": my_bid_count,
+            "autoBidMax": auto_max if auto_active else None,
+            "autoBidRemaining": auto_max - current_price if auto_active else None,
+        })
+    return result
+
+
+def search_lots(cur, tenant_id: int, query: str, limit: int, offset: int) -> dict:
+    """
+    Ранжированный поиск: префиксный tsquery по search_vector (русская морфология, GIN)
+    плюс подстрока в названии через триграммный индекс — для поиска по мере ввода.
+    """
+    words = re.findall(r"\w+", query.lower())
+    tsquery = " & ".join(f"{w}:*" for w in words)
+    needle = query.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    cur.execute(f"""
+        WITH q AS (SELECT to_tsquery('russian', %s) AS tsq)
+        SELECT l.id, l.title, l.image, l.current_price, l.ends_at, l.status,
+               COUNT(*) OVER () AS total
+        FROM {SCHEMA}.lots l, q
+        WHERE l.tenant_id = %s AND (l.search_vector @@ q.tsq OR lower(l.title) LIKE %s)
+        ORDER BY ts_rank(l.search_vector, q.tsq) + similarity(lower(l.title), %s) DESC, l.id DESC
+        LIMIT %s OFFSET %s
+    """, (tsquery, tenant_id, f"%{needle}%", query.lower(), limit, offset))
+    rows = cur.fetchall()
+    total = rows[0][6] if rows else 0
     return {
-        "id": row[0],
-        "lotId": row[1],
-        "userId": row[2],
-        "userName": row[3],
-        "userAvatar": row[4],
-        "amount": row[5],
-        "createdAt": row[6].isoformat() if row[6] else None,
+        "query": query,
+        "total": total,
+        "items": [
+            {
+                "id": r[0],
+                "title": r[1],
+                "image": r[2],
+                "currentPrice": r[3],
+                "endsAt": r[4].isoformat() if r[4] else None,
+                "status": r[5],
+            }
+            for r in rows
+        ],
+        "nextOffset": offset + len(rows) if offset + len(rows) < total else None,
     }
 
 
@@ -152,104 +896,144 @@ def handler(event: dict, context) -> dict:
     params = event.get("queryStringParameters") or {}
     lot_id = params.get("id")
     user_id = params.get("userId", "")
+    action = params.get("action")
 
-    conn = get_conn()
-    cur = conn.cursor()
+    if action == "bids":
+        try:
+            history_lot_id = int(lot_id)
+            limit = min(max(int(params.get("limit") or BID_HISTORY_DEFAULT_LIMIT), 1), BID_HISTORY_MAX_LIMIT)
+            cursor = decode_cursor(params["cursor"]) if params.get("cursor") else None
+            since = int(params["since"]) if params.get("since") else None
+        except (TypeError, ValueError):
+            return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": "Некорректные параметры истории ставок"})}
 
-    finish_expired_lots(cur)
-    activate_scheduled_lots(cur)
-    conn.commit()
-    notify_ending_soon(conn, cur)
+    try:
+        max_lag = min(float(params.get("maxStaleness") or REPLICA_MAX_LAG_SECONDS), REPLICA_MAX_LAG_LIMIT_SECONDS)
+    except ValueError:
+        max_lag = REPLICA_MAX_LAG_SECONDS
 
-    if lot_id:
-        cur.execute(f"""
-            SELECT id, title, description, image, start_price, current_price, step,
-                   ends_at, status, winner_id, winner_name, anti_snipe, anti_snipe_minutes,
-                   payment_status, created_at, COALESCE(video, '') as video, video_duration, starts_at
-            FROM {SCHEMA}.lots WHERE id = {int(lot_id)}
-        """)
-        row = cur.fetchone()
-        if not row:
-            conn.close()
-            return {"statusCode": 404, "headers": CORS, "body": json.dumps({"error": "Лот не найден"})}
+    if action == "search":
+        search_query = (params.get("q") or "").strip()[:200]
+        try:
+            limit = min(max(int(params.get("limit") or SEARCH_DEFAULT_LIMIT), 1), SEARCH_MAX_LIMIT)
+            offset = max(int(params.get("offset") or 0), 0)
+        except ValueError:
+            return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": "Некорректные параметры поиска"})}
+        if not re.search(r"\w", search_query):
+            return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": "Пустой поисковый запрос"})}
 
-        lot = row_to_lot(row)
+    if action == "me" and (not user_id or user_id == "guest"):
+        return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": "Не указан пользователь"})}
 
-        cur.execute(f"""
-            SELECT id, lot_id, user_id, user_name, user_avatar, amount, created_at
-            FROM {SCHEMA}.bids WHERE lot_id = {int(lot_id)}
-            ORDER BY amount DESC, created_at ASC
-            LIMIT 50
-        """)
-        lot["bids"] = [row_to_bid(r) for r in cur.fetchall()]
-
-        # Автоставка текущего пользователя
-        if user_id and user_id != "guest":
-            uid = user_id.replace("'", "''")
+    conn, on_replica = get_read_conn(max_lag, params.get("readToken", ""))
+    # Слот сообщества держится до закрытия соединения — закрываем и при ошибке
+    try:
+        cur = conn.cursor()
+
+        if action == "schedule":
+            now = datetime.now(timezone.utc)
+            due = next_due_at(cur, now)
+            return {"statusCode": 200, "headers": CORS, "body": json.dumps({
+                "now": now.isoformat(),
+                "nextDueAt": due.isoformat() if due else None,
+                "sleepSeconds": max(0.0, (due - now).total_seconds()) if due else None,
+            })}
+
+        try:
+            tenant_id = acquire_tenant(cur, vk_group_id(event))
+        except TenantError as e:
+            return tenant_error_response(e)
+
+        sweep_if_due(conn, cur, on_replica)
+
+        if action == "search":
+            found = search_lots(cur, tenant_id, search_query, limit, offset)
+            return {"statusCode": 200, "headers": CORS, "body": dumps(found)}
+
+        if action == "me":
+            lots = my_lots(cur, user_id, tenant_id)
+            return {"statusCode": 200, "headers": CORS, "body": dumps({"userId": user_id, "lots": lots})}
+
+        if action == "bids":
+            cur.execute(f"SELECT 1 FROM {SCHEMA}.lots WHERE id = %s AND tenant_id = %s", (history_lot_id, tenant_id))
+            if cur.fetchone() is None:
+                return {"statusCode": 404, "headers": CORS, "body": json.dumps({"error": "Лот не найден"})}
+            history = bid_history(cur, history_lot_id, limit, cursor=cursor, since=since)
+            return {"statusCode": 200, "headers": CORS, "body": dumps(history)}
+
+        if lot_id:
+            # Дешёвая проверка по PK: версия определяет, годится ли кэшированная карточка
             cur.execute(f"""
-                SELECT max_amount, user_id FROM {SCHEMA}.auto_bids
-                WHERE lot_id = {int(lot_id)} AND user_id = '{uid}'
+                SELECT version, current_price FROM {SCHEMA}.lots
+                WHERE id = {int(lot_id)} AND tenant_id = {tenant_id}
             """)
-            ab = cur.fetchone()
-            if ab:
-                current_price = lot.get("currentPrice") or lot.get("current_price", 0)
-                if int(ab[0]) < int(current_price):
-                    # Автоставка исчерпана — удаляем
-                    cur.execute(f"""
-                        DELETE FROM {SCHEMA}.auto_bids
-                        WHERE lot_id = {int(lot_id)} AND user_id = '{uid}'
-                    """)
-                    conn.commit()
-                else:
-                    lot["myAutoBid"] = {"maxAmount": ab[0], "userId": ab[1]}
+            head = cur.fetchone()
+            if not head:
+                return {"statusCode": 404, "headers": CORS, "body": json.dumps({"error": "Лот не найден"})}
+            version, current_price = head
 
-        conn.close()
-        return {"statusCode": 200, "headers": CORS, "body": json.dumps(lot)}
+            cache_key = f"lot:{int(lot_id)}:v{version}"
+            lot_json = lot_cache.get(cache_key)
+            if lot_json is None:
+                lot_json = load_lot_json(cur, int(lot_id))
+                if lot_json is None:
+                    return {"statusCode": 404, "headers": CORS, "body": json.dumps({"error": "Лот не найден"})}
+                lot_cache.set(cache_key, lot_json)
 
-    # List all lots with top bid info
-    cur.execute(f"""
-        SELECT l.id, l.title, l.description, l.image, l.start_price, l.current_price, l.step,
-               l.ends_at, l.status, l.winner_id, l.winner_name, l.anti_snipe, l.anti_snipe_minutes,
-               l.payment_status, l.created_at, COALESCE(l.video, '') as video, l.video_duration, l.starts_at,
-               b.user_id as leader_id, b.user_name as leader_name, b.user_avatar as leader_avatar,
-               (SELECT COUNT(*) FROM {SCHEMA}.bids WHERE lot_id = l.id) as bid_count
-        FROM {SCHEMA}.lots l
-        LEFT JOIN LATERAL (
-            SELECT user_id, user_name, user_avatar FROM {SCHEMA}.bids
-            WHERE lot_id = l.id ORDER BY amount DESC, created_at ASC LIMIT 1
-        ) b ON true
-        ORDER BY l.created_at DESC
-    """)
-    rows = cur.fetchall()
+            # Автоставка текущего пользователя — персональная часть, не кэшируется
+            if user_id and user_id != "guest":
+                uid = user_id.replace("'", "''")
+                cur.execute(f"""
+                    SELECT max_amount, user_id FROM {SCHEMA}.auto_bids
+                    WHERE lot_id = {int(lot_id)} AND user_id = '{uid}'
+                """)
+                ab = cur.fetchone()
+                # Исчерпанные автоставки удаляются при ставке; здесь их просто не показываем
+                if ab and int(ab[0]) >= int(current_price):
+                    my_auto_bid = json.dumps({"maxAmount": ab[0], "userId": ab[1]})
+                    lot_json = f'{lot_json[:-1]},"myAutoBid":{my_auto_bid}}}'
 
-    lot_ids = [r[0] for r in rows]
-    recent_bids = {}
-    if lot_ids:
-        ids_str = ",".join(str(i) for i in lot_ids)
+            return {"statusCode": 200, "headers": CORS, "body": lot_json}
+
+        # List all lots with top bid info
         cur.execute(f"""
-            SELECT id, lot_id, user_id, user_name, user_avatar, amount, created_at
-            FROM (
-                SELECT *, ROW_NUMBER() OVER (PARTITION BY lot_id ORDER BY amount DESC, created_at ASC) as rn
-                FROM {SCHEMA}.bids WHERE lot_id IN ({ids_str})
-            ) ranked WHERE rn <= 3
-            ORDER BY lot_id, amount DESC, created_at ASC
-        """)
-        for row in cur.fetchall():
-            lid = row[1]
-            if lid not in recent_bids:
-                recent_bids[lid] = []
-            recent_bids[lid].append(row_to_bid(row))
+            SELECT l.id, l.title, l.description, l.image, l.start_price, l.current_price, l.step,
+                   l.ends_at, l.status, l.winner_id, l.winner_name, l.anti_snipe, l.anti_snipe_minutes,
+                   l.payment_status, l.created_at, COALESCE(l.video, '') as video, l.video_duration, l.starts_at,
+                   (SELECT COUNT(*) FROM {SCHEMA}.bids WHERE lot_id = l.id) as bid_count
+            FROM {SCHEMA}.lots l
+            WHERE l.tenant_id = %s
+            ORDER BY l.created_at DESC
+        """, (tenant_id,))
+        lot_rows = cur.fetchall()
 
-    conn.close()
+        lot_ids = [r[0] for r in lot_rows]
+        bid_rows = []
+        if lot_ids:
+            ids_str = ",".join(str(i) for i in lot_ids)
+            cur.execute(f"""
+                SELECT id, lot_id, user_key, amount, created_at
+                FROM (
+                    SELECT *, ROW_NUMBER() OVER (PARTITION BY lot_id ORDER BY amount DESC, created_at ASC) as rn
+                    FROM {SCHEMA}.bids WHERE lot_id IN ({ids_str})
+                ) ranked WHERE rn <= 3
+                ORDER BY lot_id, amount DESC, created_at ASC
+            """)
+            bid_rows = cur.fetchall()
+        users = load_users(cur, (r[2] for r in bid_rows))
+    finally:
+        conn.close()
+
+    # Лидер — первая из трёх верхних ставок лота, отдельный подзапрос для него не нужен
+    recent_bids = {}
+    leaders = {}
+    for row in bid_rows:
+        lid = row[1]
+        if lid not in recent_bids:
+            recent_bids[lid] = []
+            leaders[lid] = users[row[2]]
+        recent_bids[lid].append(encode_bid(bid_row(row, users)))
+    no_leader = (None, None, None)
+    rows = [r[:18] + leaders.get(r[0], no_leader) + r[18:] for r in lot_rows]
 
-    lots = []
-    for r in rows:
-        lot = row_to_lot(r[:18])
-        lot["leaderId"] = r[18]
-        lot["leaderName"] = r[19]
-        lot["leaderAvatar"] = r[20]
-        lot["bidCount"] = r[21]
-        lot["bids"] = recent_bids.get(lot["id"], [])
-        lots.append(lot)
-
-    return {"statusCode": 200, "headers": CORS, "body": json.dumps(lots)}
\ No newline at end of file
+    return {"statusCode": 200, "headers": CORS, "body": encode_catalog(rows, recent_bids)}
\ No newline at end of file
@@ -0,0 +1,365 @@
+"""
+Публикация статического каталога в S3 (тот же бакет, что у upload-video) для раздачи через CDN.
+POST / (или GET /) — выложить каталог, если с прошлой публикации что-то изменилось:
+  catalog/lots.json       — список лотов в формате auction-lots GET /
+  catalog/lots/<id>.json  — карточки «горячих» лотов (активные, со свежими ставками или скоро заканчиваются)
+  catalog/version.json    — { version, lotCount, publishedAt, lots: {id: version} } для дешёвой проверки свежести
+У каждого сообщества свой каталог: catalog/<vk_group_id>/...; сообщество по умолчанию без vk_group_id — в catalog/.
+Изменения берутся из журнала auction_events (потребитель catalog-publish): есть непрочитанные события —
+каталог перевыкладывается, удалённые лоты убираются из lots/. Смещение двигается только после публикации.
+Публикации идут не чаще раза в CATALOG_PUBLISH_INTERVAL_SECONDS: вызов внутри окна ждёт его конца,
+а после публикации функция ещё одно окно следит за изменениями и выкладывает их (хвост серии ставок).
+Вызывается из auction-bid, auction-admin и таймеров auction-lots (CATALOG_PUBLISH_URL): они только
+отправляют запрос и ответа не ждут — он приходит лишь после публикации.
+Для проверки на локальном MinIO: S3_ENDPOINT_URL=http://localhost:9000, CATALOG_BUCKET=files.
+"""
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+SCHEMA = "t_p68201414_vk_auction_app_1"
+BUCKET = "files"
+PREFIX = "catalog"
+
+CATALOG_PUBLISH_INTERVAL_SECONDS = 5
+# Общий бюджет одного вызова: функция не должна упереться в таймаут платформы
+PUBLISH_MAX_SECONDS = 25
+HOT_LOT_WINDOW_MINUTES = 30
+HOT_LOTS_MAX = 20
+EVENT_CONSUMER = "catalog-publish"
+EVENT_BATCH_SIZE = 500
+
+# version.json проверяется клиентами часто — почти не кэшируем; снимки живут одно окно публикации
+VERSION_CACHE_CONTROL = "public, max-age=1"
+SNAPSHOT_CACHE_CONTROL = f"public, max-age={CATALOG_PUBLISH_INTERVAL_SECONDS}, stale-while-revalidate=30"
+
+CORS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type",
+}
+
+_s3 = None
+
+
+def get_conn():
+    import psycopg2
+    return psycopg2.connect(os.environ["DATABASE_URL"])
+
+
+def get_s3():
+    global _s3
+    if _s3 is None:
+        import boto3
+        from botocore.config import Config
+        _s3 = boto3.client(
+            "s3",
+            endpoint_url=os.environ.get("S3_ENDPOINT_URL", "https://bucket.poehali.dev"),
+            aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
+            aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"],
+            config=Config(connect_timeout=3, read_timeout=10, retries={"max_attempts": 2, "mode": "standard"}),
+        )
+    return _s3
+
+
+def cdn_base_url() -> str:
+    if os.environ.get("S3_ENDPOINT_URL"):
+        return f"{os.environ['S3_ENDPOINT_URL'].rstrip('/')}/{os.environ.get('CATALOG_BUCKET', BUCKET)}/{PREFIX}"
+    return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{PREFIX}"
+
+
+def put_json(key: str, body: str, cache_control: str):
+    get_s3().put_object(
+        Bucket=os.environ.get("CATALOG_BUCKET", BUCKET),
+        Key=f"{PREFIX}/{key}",
+        Body=body.encode(),
+        ContentType="application/json; charset=utf-8",
+        CacheControl=cache_control,
+    )
+
+
+def delete_json(key: str):
+    get_s3().delete_object(Bucket=os.environ.get("CATALOG_BUCKET", BUCKET), Key=f"{PREFIX}/{key}")
+
+
+# ── Журнал событий ────────────────────────────────────────────────────────────
+
+class EventConsumer:
+    """
+    Читает auction_events пачками по смещению потребителя. poll() идёт дальше по журналу,
+    не трогая сохранённое смещение; ack() фиксирует всё прочитанное. Без ack() следующий
+    вызов функции перечитает те же события.
+    """
+
+    def __init__(self, cur, name: str, batch_size: int = EVENT_BATCH_SIZE):
+        self.cur = cur
+        self.name = name
+        self.batch_size = batch_size
+        self.position = None  # (txid, id) последнего прочитанного события
+
+    def poll(self) -> list:
+        after_txid, after_id = self.position or (None, None)
+        self.cur.execute(f"""
+            SELECT id, txid::text, lot_id, kind, payload, tenant_id
+            FROM {SCHEMA}.read_auction_events(%s, %s, %s::xid8, %s)
+        """, (self.name, self.batch_size, after_txid, after_id))
+        rows = self.cur.fetchall()
+        if rows:
+            self.position = (rows[-1][1], rows[-1][0])
+        return [{"id": r[0], "lotId": r[2], "tenantId": r[5], "kind": r[3], "payload": r[4]} for r in rows]
+
+    def drain(self) -> list:
+        """Все непрочитанные на сейчас события."""
+        events = []
+        while True:
+            batch = self.poll()
+            events.extend(batch)
+            if len(batch) < self.batch_size:
+                return events
+
+    def ack(self):
+        if self.position is not None:
+            self.cur.execute(f"SELECT {SCHEMA}.ack_auction_events(%s, %s::xid8, %s)",
+                             (self.name, self.position[0], self.position[1]))
+
+
+# ── Сериализация ──────────────────────────────────────────────────────────────
+# Та же форма, что у auction-lots GET /. Публикация идёт не чаще раза в окно, поэтому обычного
+# json.dumps по словарям достаточно.
+
+LOT_KEYS = [
+    "id", "title", "description", "image", "startPrice", "currentPrice", "step", "endsAt",
+    "status", "winnerId", "winnerName", "antiSnipe", "antiSnipeMinutes", "paymentStatus", "createdAt", "video",
+    "videoDuration", "startsAt",
+]
+CATALOG_LOT_KEYS = LOT_KEYS + ["leaderId", "leaderName", "leaderAvatar", "bidCount"]
+BID_KEYS = ["id", "lotId", "userId", "userName", "userAvatar", "amount", "createdAt"]
+
+
+def row_dict(keys: list, row) -> dict:
+    return {k: v.isoformat() if isinstance(v, datetime) else v for k, v in zip(keys, row)}
+
+
+def load_users(cur, user_keys) -> dict:
+    keys = sorted(set(user_keys))
+    if not keys:
+        return {}
+    cur.execute(f"SELECT id, vk_user_id, name, avatar FROM {SCHEMA}.users WHERE id = ANY(%s)", (keys,))
+    return {r[0]: r[1:] for r in cur.fetchall()}
+
+
+def bid_row(r, users: dict) -> tuple:
+    return (r[0], r[1]) + users[r[2]] + (r[3], r[4])
+
+
+def tenant_prefix(vk_group_id) -> str:
+    """Подкаталог снимков сообщества внутри catalog/."""
+    return f"{vk_group_id}/" if vk_group_id else ""
+
+
+def render_catalog(cur, tenant_id: int) -> str:
+    cur.execute(f"""
+        SELECT l.id, l.title, l.description, l.image, l.start_price, l.current_price, l.step,
+               l.ends_at, l.status, l.winner_id, l.winner_name, l.anti_snipe, l.anti_snipe_minutes,
+               l.payment_status, l.created_at, COALESCE(l.video, '') as video, l.video_duration, l.starts_at,
+               (SELECT COUNT(*) FROM {SCHEMA}.bids WHERE lot_id = l.id) as bid_count
+        FROM {SCHEMA}.lots l
+        WHERE l.tenant_id = %s
+        ORDER BY l.created_at DESC
+    """, (tenant_id,))
+    lot_rows = cur.fetchall()
+
+    cur.execute(f"""
+        SELECT id, lot_id, user_key, amount, created_at
+        FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY lot_id ORDER BY amount DESC, created_at ASC) as rn
+            FROM {SCHEMA}.bids
+            WHERE lot_id IN (SELECT id FROM {SCHEMA}.lots WHERE tenant_id = %s)
+        ) ranked WHERE rn <= 3
+        ORDER BY lot_id, amount DESC, created_at ASC
+    """, (tenant_id,))
+    bid_rows = cur.fetchall()
+    users = load_users(cur, (r[2] for r in bid_rows))
+
+    recent_bids = {}
+    leaders = {}
+    for row in bid_rows:
+        if row[1] not in recent_bids:
+            recent_bids[row[1]] = []
+            leaders[row[1]] = users[row[2]]
+        recent_bids[row[1]].append(row_dict(BID_KEYS, bid_row(row, users)))
+
+    return json.dumps([
+        dict(row_dict(CATALOG_LOT_KEYS, r[:18] + leaders.get(r[0], (None, None, None)) + r[18:]),
+             bids=recent_bids.get(r[0], []))
+        for r in lot_rows
+    ])
+
+
+def render_lot(cur, lot_id: int):
+    cur.execute(f"""
+        SELECT id, title, description, image, start_price, current_price, step,
+               ends_at, status, winner_id, winner_name, anti_snipe, anti_snipe_minutes,
+               payment_status, created_at, COALESCE(video, '') as video, video_duration, starts_at
+        FROM {SCHEMA}.lots WHERE id = {lot_id}
+    """)
+    row = cur.fetchone()
+    if not row:
+        return None
+    cur.execute(f"""
+        SELECT id, lot_id, user_key, amount, created_at
+        FROM {SCHEMA}.bids WHERE lot_id = {lot_id}
+        ORDER BY amount DESC, created_at ASC
+        LIMIT 50
+    """)
+    bid_rows = cur.fetchall()
+    users = load_users(cur, (r[2] for r in bid_rows))
+    return json.dumps(dict(row_dict(LOT_KEYS, row), bids=[row_dict(BID_KEYS, bid_row(r, users)) for r in bid_rows]))
+
+
+def hot_lots(cur, tenant_id: int) -> list:
+    """(id, version) активных лотов со ставками за последние полчаса или заканчивающихся в ближайшие полчаса."""
+    cur.execute(f"""
+        SELECT l.id, l.version FROM {SCHEMA}.lots l
+        WHERE l.tenant_id = %s AND l.status = 'active'
+          AND (l.ends_at <= NOW() + INTERVAL '{HOT_LOT_WINDOW_MINUTES} minutes'
+               OR EXISTS (SELECT 1 FROM {SCHEMA}.bids b
+                          WHERE b.lot_id = l.id AND b.created_at >= NOW() - INTERVAL '{HOT_LOT_WINDOW_MINUTES} minutes'))
+        ORDER BY l.ends_at ASC
+        LIMIT {HOT_LOTS_MAX}
+    """, (tenant_id,))
+    return cur.fetchall()
+
+
+def catalog_fingerprint(cur, tenant_id: int):
+    cur.execute(f"SELECT COALESCE(MAX(version), 0), COUNT(*) FROM {SCHEMA}.lots WHERE tenant_id = %s", (tenant_id,))
+    return cur.fetchone()
+
+
+def publish(cur, tenant_id: int, vk_group_id, published_version: int, deleted_lot_ids: set) -> dict:
+    """
+    Выкладывает каталог сообщества, изменившиеся горячие лоты и последним — version.json;
+    снимки удалённых лотов убирает.
+    """
+    prefix = tenant_prefix(vk_group_id)
+    cur.execute("BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY")
+    version, lot_count = catalog_fingerprint(cur, tenant_id)
+    catalog_json = render_catalog(cur, tenant_id)
+    hot = hot_lots(cur, tenant_id)
+    lot_jsons = {}
+    for lot_id, lot_version in hot:
+        if lot_version > published_version:
+            lot_jsons[lot_id] = render_lot(cur, lot_id)
+    cur.execute("COMMIT")
+
+    put_json(f"{prefix}lots.json", catalog_json, SNAPSHOT_CACHE_CONTROL)
+    for lot_id, lot_json in lot_jsons.items():
+        if lot_json is not None:
+            put_json(f"{prefix}lots/{lot_id}.json", lot_json, SNAPSHOT_CACHE_CONTROL)
+    for lot_id in deleted_lot_ids:
+        delete_json(f"{prefix}lots/{lot_id}.json")
+
+    published_at = datetime.now(timezone.utc)
+    # version.json выкладывается последним: кто увидел новую версию, найдёт и новые снимки
+    put_json(f"{prefix}version.json", json.dumps({
+        "version": version,
+        "lotCount": lot_count,
+        "publishedAt": published_at.isoformat(),
+        "lots": {str(lot_id): lot_version for lot_id, lot_version in hot},
+    }), VERSION_CACHE_CONTROL)
+
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.catalog_publish_state (id, published_version, published_lot_count, published_at)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (id) DO UPDATE
+        SET published_version = EXCLUDED.published_version,
+            published_lot_count = EXCLUDED.published_lot_count,
+            published_at = EXCLUDED.published_at
+    """, (tenant_id, version, lot_count, published_at))
+    print(f"[catalog-publish] tenant={tenant_id} version={version} lots={lot_count} hot={len(hot)} uploaded_lots={len(lot_jsons)}")
+    return {"tenantId": tenant_id, "version": version, "lotCount": lot_count, "publishedAt": published_at.isoformat()}
+
+
+def publish_while_changing(cur, deadline: float) -> list:
+    """
+    Публикует, пока каталог меняется, но не чаще раза в окно: первый вызов — сразу (или по
+    окончании окна), дальше — раз в окно, пока за окно ничего не изменилось или не вышел бюджет.
+    """
+    published = []
+    consumer = EventConsumer(cur, EVENT_CONSUMER)
+    # Сообщества с непрочитанными событиями → их удалённые лоты
+    pending = {}
+    while True:
+        for e in consumer.drain():
+            deleted = pending.setdefault(e["tenantId"], set())
+            if e["kind"] == "lot_deleted":
+                deleted.add(e["lotId"])
+        if not pending:
+            return published
+
+        cur.execute(f"""
+            SELECT t.id, t.vk_group_id, COALESCE(s.published_version, 0), s.published_at
+            FROM {SCHEMA}.tenants t
+            LEFT JOIN {SCHEMA}.catalog_publish_state s ON s.id = t.id
+            WHERE t.id = ANY(%s)
+        """, (list(pending),))
+        tenants = cur.fetchall()
+
+        published_at = max((t[3] for t in tenants if t[3] is not None), default=None)
+        if published_at is not None:
+            wait = CATALOG_PUBLISH_INTERVAL_SECONDS - (datetime.now(timezone.utc) - published_at).total_seconds()
+            if wait > 0:
+                if time.monotonic() + wait > deadline:
+                    return published
+                time.sleep(wait)
+                continue
+
+        for tenant_id, group_id, published_version, _ in tenants:
+            published.append(publish(cur, tenant_id, group_id, published_version, pending[tenant_id]))
+        # Смещение двигается после выкладки: упавшая публикация повторится на тех же событиях
+        consumer.ack()
+        consumer.position = None
+        pending = {}
+        if time.monotonic() + CATALOG_PUBLISH_INTERVAL_SECONDS > deadline:
+            return published
+
+
+def handler(event: dict, context) -> dict:
+    if event.get("httpMethod") == "OPTIONS":
+        return {"statusCode": 200, "headers": CORS, "body": ""}
+
+    deadline = time.monotonic() + PUBLISH_MAX_SECONDS
+    conn = get_conn()
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    # Публикует один вызов за раз; остальные выходят сразу — держатель блокировки
+    # перепроверит каталог после своей публикации и подхватит их изменения
+    cur.execute("SELECT pg_try_advisory_lock(hashtext('catalog-publish'))")
+    if not cur.fetchone()[0]:
+        # Держатель мог уже закончить последнюю проверку: одна повторная попытка через окно
+        time.sleep(CATALOG_PUBLISH_INTERVAL_SECONDS)
+        cur.execute("SELECT pg_try_advisory_lock(hashtext('catalog-publish'))")
+        if not cur.fetchone()[0]:
+            conn.close()
+            return {"statusCode": 200, "headers": CORS, "body": json.dumps({"published": [], "busy": True})}
+
+    try:
+        published = publish_while_changing(cur, deadline)
+    finally:
+        try:
+            # Упавшая публикация могла оставить прерванной транзакцию снимка (publish): до отката unlock не выполнится
+            import psycopg2.extensions
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                cur.execute("ROLLBACK")
+            cur.execute("SELECT pg_advisory_unlock(hashtext('catalog-publish'))")
+        except Exception as e:
+            # Блокировка сессионная — закрытие соединения её снимет; исходная ошибка важнее
+            print(f"[catalog-publish] unlock failed: {e}")
+        conn.close()
+
+    return {"statusCode": 200, "headers": CORS, "body": json.dumps({
+        "published": published,
+        "baseUrl": cdn_base_url(),
+    })}
@@ -2,10 +2,10 @@
 Логирование уникальных посещений VK-приложения.
 POST / — записать визит пользователя (upsert по user_id + дата)
 GET /  — получить статистику (только для админов)
+Визиты и статистика — по сообществу запроса (vk_group_id, заголовок X-Vk-Group-Id).
 """
 import json
 import os
-import psycopg2
 from datetime import datetime, timezone, timedelta
 
 MSK = timezone(timedelta(hours=3))
@@ -16,17 +16,76 @@ HARDCODED_ADMINS = {"32129039", "100411622", "dev"}
 CORS = {
     "Access-Control-Allow-Origin": "*",
     "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-    "Access-Control-Allow-Headers": "Content-Type",
+    "Access-Control-Allow-Headers": "Content-Type, X-Vk-Group-Id",
 }
 
+STATS_MAX_LAG_SECONDS = 60
+
+
+class TenantError(Exception):
+    """Запрос нельзя обслужить для этого сообщества; status — HTTP-код ответа."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def vk_group_id(event: dict):
+    """vk_group_id из параметров запуска: заголовок X-Vk-Group-Id или параметр vk_group_id."""
+    headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+    raw = headers.get("x-vk-group-id") or (event.get("queryStringParameters") or {}).get("vk_group_id")
+    try:
+        return int(raw) if raw else None
+    except (TypeError, ValueError):
+        return None
+
+
+def acquire_tenant(cur, group_id) -> int:
+    """Сообщество запроса и слот его квоты соединений до закрытия соединения: не подключено — 404, слоты заняты — 503."""
+    cur.execute(f"SELECT tenant_id, slot FROM {SCHEMA}.acquire_tenant_slot(%s)", (group_id,))
+    tenant_id, slot = cur.fetchone()
+    if tenant_id is None:
+        raise TenantError(404, "Сообщество не подключено к аукциону")
+    if slot is None:
+        raise TenantError(503, "Слишком много запросов, попробуйте через пару секунд")
+    return tenant_id
+
+
+def get_read_conn(max_lag: float):
+    """Соединение для чтения: реплика (DATABASE_REPLICA_URL), если отстаёт не больше max_lag секунд, иначе primary."""
+    import psycopg2
+    url = os.environ.get("DATABASE_REPLICA_URL")
+    if not url:
+        return psycopg2.connect(os.environ["DATABASE_URL"])
+
+    try:
+        conn = psycopg2.connect(url, connect_timeout=2)
+    except Exception as e:
+        print(f"[replica] connect failed, using primary: {e}")
+        return psycopg2.connect(os.environ["DATABASE_URL"])
+
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                        ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+                   END
+        """)
+        lag = cur.fetchone()[0]
+        cur.close()
+        if lag <= max_lag:
+            return conn
+        print(f"[replica] lag={lag:.1f}s, using primary")
+    except Exception as e:
+        print(f"[replica] lag check failed, using primary: {e}")
+    conn.close()
+    return psycopg2.connect(os.environ["DATABASE_URL"])
+
 
 def handler(event: dict, context) -> dict:
     if event.get("httpMethod") == "OPTIONS":
         return {"statusCode": 200, "headers": CORS, "body": ""}
 
-    conn = psycopg2.connect(os.environ["DATABASE_URL"])
-    cur = conn.cursor()
-
     if event.get("httpMethod") == "POST":
         body = json.loads(event.get("body") or "{}")
         vk_user_id = str(body.get("vkUserId", "")).strip()
@@ -34,18 +93,28 @@ def handler(event: dict, context) -> dict:
         if not vk_user_id:
             return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": "vkUserId required"})}
 
-        today_msk = datetime.now(MSK).date()
-        cur.execute(
-            f"""
-            INSERT INTO {SCHEMA}.visits (vk_user_id, user_name, visit_date)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (vk_user_id, visit_date) DO NOTHING
-            """,
-            (vk_user_id, user_name, today_msk),
-        )
-        conn.commit()
-        cur.close()
-        conn.close()
+        import psycopg2
+        conn = psycopg2.connect(os.environ["DATABASE_URL"])
+        # Слот сообщества держится до закрытия соединения — закрываем и при ошибке
+        try:
+            cur = conn.cursor()
+            try:
+                tenant_id = acquire_tenant(cur, vk_group_id(event))
+            except TenantError as e:
+                return {"statusCode": e.status, "headers": CORS, "body": json.dumps({"error": str(e)})}
+
+            today_msk = datetime.now(MSK).date()
+            cur.execute(
+                f"""
+                INSERT INTO {SCHEMA}.visits (tenant_id, vk_user_id, user_name, visit_date)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (tenant_id, vk_user_id, visit_date) DO NOTHING
+                """,
+                (tenant_id, vk_user_id, user_name, today_msk),
+            )
+            conn.commit()
+        finally:
+            conn.close()
         return {"statusCode": 200, "headers": CORS, "body": json.dumps({"ok": True})}
 
     if event.get("httpMethod") == "GET":
@@ -54,32 +123,43 @@ def handler(event: dict, context) -> dict:
         if requester_id not in HARDCODED_ADMINS:
             return {"statusCode": 403, "headers": CORS, "body": json.dumps({"error": "forbidden"})}
 
-        cur.execute(f"SELECT COUNT(DISTINCT vk_user_id) FROM {SCHEMA}.visits")
-        total_unique = cur.fetchone()[0]
-
-        today_msk = datetime.now(MSK).date()
-        cur.execute(
-            f"SELECT COUNT(DISTINCT vk_user_id) FROM {SCHEMA}.visits WHERE visit_date = %s",
-            (today_msk,),
-        )
-        today_unique = cur.fetchone()[0]
-
-        cur.execute(
-            f"""
-            SELECT DISTINCT ON (vk_user_id) vk_user_id, user_name, visited_at
-            FROM {SCHEMA}.visits
-            ORDER BY vk_user_id, visited_at DESC
-            """
-        )
-        rows = cur.fetchall()
+        # Статистика только читает — её можно отдавать с реплики
+        conn = get_read_conn(STATS_MAX_LAG_SECONDS)
+        try:
+            cur = conn.cursor()
+            try:
+                tenant_id = acquire_tenant(cur, vk_group_id(event))
+            except TenantError as e:
+                return {"statusCode": e.status, "headers": CORS, "body": json.dumps({"error": str(e)})}
+
+            cur.execute(f"SELECT COUNT(DISTINCT vk_user_id) FROM {SCHEMA}.visits WHERE tenant_id = %s", (tenant_id,))
+            total_unique = cur.fetchone()[0]
+
+            today_msk = datetime.now(MSK).date()
+            cur.execute(
+                f"SELECT COUNT(DISTINCT vk_user_id) FROM {SCHEMA}.visits WHERE tenant_id = %s AND visit_date = %s",
+                (tenant_id, today_msk),
+            )
+            today_unique = cur.fetchone()[0]
+
+            cur.execute(
+                f"""
+                SELECT DISTINCT ON (vk_user_id) vk_user_id, user_name, visited_at
+                FROM {SCHEMA}.visits
+                WHERE tenant_id = %s
+                ORDER BY vk_user_id, visited_at DESC
+                """,
+                (tenant_id,),
+            )
+            rows = cur.fetchall()
+        finally:
+            conn.close()
         rows.sort(key=lambda r: r[2], reverse=True)
         recent = [
             {"vkUserId": r[0], "userName": r[1], "visitedAt": r[2].isoformat()}
             for r in rows[:10]
         ]
 
-        cur.close()
-        conn.close()
         return {
             "statusCode": 200,
             "headers": CORS,
@@ -1,16 +1,25 @@
 """
-Загрузка видео в S3 чанками (5МБ base64 JSON).
-action=init     — начать { filename, contentType } → { uploadId, key }
-action=chunk    — { uploadId, key, partNumber, data(base64) } → { ok }
-action=complete — { uploadId, key, contentType } → { url }
-action=abort    — { uploadId, key } → { ok }
+Загрузка видео в S3 чанками (base64 JSON) с сессией загрузки в БД (upload_sessions / upload_parts).
+action=init     — начать { filename, contentType, totalParts? } → { uploadId, key }
+action=chunk    — { uploadId, partNumber, data(base64), sha256? } → { ok, part, size, sha256 }
+  Части можно слать параллельно и в любом порядке; повтор части перезаписывает её.
+  Если передан sha256 и он не совпал с данными — 400, часть не сохраняется.
+action=status   — { uploadId } → { status, totalParts, received, missing, bytes } — что докачать после обрыва
+action=complete — { uploadId, totalParts, contentType, sha256s? } → { url, size, checksum }
+  Целостность проверяется по записям частей (все 1..totalParts на месте, хэши совпадают с sha256s клиента),
+  без повторного чтения данных; checksum — SHA-256 от склеенных хэшей частей. Не хватает частей — 409 с missing.
+  Сборка, не завершённая за COMPLETE_LEASE_MINUTES (инстанс упал посреди неё), перезапускается повторным complete.
+action=abort    — { uploadId } → { ok }
+action=gc       — убрать брошенные сессии, их части, незавершённые multipart-загрузки и старые файлы в /tmp
+  (запускается и сам, не чаще раза в GC_INTERVAL_SECONDS, при init).
 """
 import json
 import os
+import time
 import uuid
 import base64
+import hashlib
 import glob as _glob
-import boto3
 
 CORS = {
     "Access-Control-Allow-Origin": "*",
@@ -18,23 +27,325 @@ CORS = {
     "Access-Control-Allow-Headers": "Content-Type",
 }
 
+SCHEMA = "t_p68201414_vk_auction_app_1"
 BUCKET = "files"
 TMP = "/tmp"
+PARTS_PREFIX = "uploads"
+PROXY_TIMEOUT_SECONDS = 15
+
+# Минимальный размер части multipart-загрузки S3 (кроме последней): мелкие чанки склеиваются в группы
+MULTIPART_MIN_PART_BYTES = 5 * 1024 * 1024
+ASSEMBLE_WORKERS = 8
+UPLOAD_SESSION_TTL_HOURS = 24
+# Сколько complete держит сессию в completing; дольше сборка не идёт — значит, её вызов умер
+COMPLETE_LEASE_MINUTES = 15
+GC_INTERVAL_SECONDS = 3600
+
+# Клиент S3 создаётся один раз на инстанс и переиспользуется тёплыми вызовами
+_s3 = None
+
+# Когда этот инстанс в следующий раз уберёт брошенные загрузки
+_next_gc_at = 0.0
+
+
+def get_conn():
+    import psycopg2
+    return psycopg2.connect(os.environ["DATABASE_URL"])
 
 
 def get_s3():
-    return boto3.client(
-        "s3",
-        endpoint_url="https://bucket.poehali.dev",
-        aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
-        aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"],
-    )
+    global _s3
+    if _s3 is None:
+        # boto3 импортируется лениво: init и status к S3 не обращаются
+        import boto3
+        from botocore.config import Config
+        _s3 = boto3.client(
+            "s3",
+            endpoint_url="https://bucket.poehali.dev",
+            aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
+            aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"],
+            # Явные таймауты вместо минутных по умолчанию; пул keep-alive соединений у botocore свой
+            config=Config(connect_timeout=3, read_timeout=30, retries={"max_attempts": 2, "mode": "standard"}),
+        )
+    return _s3
+
+
+# ── Исходящие HTTP-запросы ──────────────────────────────────────────────────
+# Keep-alive соединения переживают тёплые вызовы. У каждого хоста свой circuit breaker:
+# после breaker_failures ошибок подряд запросы к нему отклоняются сразу, пока не пройдёт
+# breaker_reset_seconds; затем пропускается один пробный запрос.
+
+class OutboundError(Exception):
+    pass
+
+
+class HttpClient:
+    def __init__(self, max_idle_per_host: int = 4, breaker_failures: int = 5, breaker_reset_seconds: float = 30.0):
+        self.max_idle_per_host = max_idle_per_host
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self._idle = {}      # (scheme, host, port) -> [соединения]
+        self._breakers = {}  # host -> (ошибок подряд, открыт до monotonic)
+        self.metrics = {"requests": 0, "errors": 0, "timeouts": 0, "rejected": 0, "budget_exhausted": 0,
+                        "connected": 0, "reused": 0, "seconds": 0.0}
+
+    def request(self, method: str, url: str, body=None, headers=None, timeout: float = 5.0, deadline=None):
+        """
+        (status, bytes). deadline — момент time.monotonic(), к которому запрос должен завершиться:
+        таймаут урезается до остатка, а если его нет — запрос не отправляется.
+        Ошибки сети, таймауты, отказы breaker'а и бюджета — OutboundError.
+        """
+        import http.client
+        import urllib.parse
+        parts = urllib.parse.urlsplit(url)
+        host = parts.hostname
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        idle = self._idle.setdefault((parts.scheme, host, parts.port), [])
+
+        started = time.monotonic()
+        # Бюджет вызывающего проверяется до breaker'а: его исчерпание — не отказ хоста
+        clipped = deadline is not None and deadline - started < timeout
+        if clipped:
+            timeout = deadline - started
+            if timeout <= 0:
+                self.metrics["budget_exhausted"] += 1
+                raise OutboundError(f"deadline exceeded: {host}")
+        failures, open_until = self._breakers.get(host, (0, 0.0))
+        if failures >= self.breaker_failures and started < open_until:
+            self.metrics["rejected"] += 1
+            raise OutboundError(f"circuit open: {host}")
+
+        self.metrics["requests"] += 1
+        try:
+            while True:
+                if deadline is not None and deadline - time.monotonic() < timeout:
+                    clipped = True
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        raise TimeoutError("deadline exceeded")
+                reused = bool(idle)
+                if reused:
+                    conn = idle.pop()
+                    conn.sock.settimeout(timeout)
+                    self.metrics["reused"] += 1
+                else:
+                    conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+                    conn = conn_cls(host, parts.port, timeout=timeout)
+                    self.metrics["connected"] += 1
+                try:
+                    conn.request(method, path, body=body, headers=headers or {})
+                    resp = conn.getresponse()
+                    data = resp.read()
+                    break
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    conn.close()
+                    # Сервер закрыл простаивавшее соединение — GET повторяем на следующем
+                    if not reused or method != "GET":
+                        raise
+                except BaseException:
+                    conn.close()
+                    raise
+        except Exception as e:
+            self.metrics["errors"] += 1
+            if isinstance(e, TimeoutError):
+                self.metrics["timeouts"] += 1
+            # Таймаут, урезанный до остатка бюджета, ничего не говорит о хосте
+            if not (clipped and isinstance(e, TimeoutError)):
+                self._record(host, ok=False)
+            raise OutboundError(f"{method} {host}: {e!r}") from e
+        finally:
+            self.metrics["seconds"] += time.monotonic() - started
+
+        if resp.will_close or len(idle) >= self.max_idle_per_host:
+            conn.close()
+        else:
+            idle.append(conn)
+        self._record(host, ok=resp.status < 500)
+        return resp.status, data
+
+    def get_json(self, url: str, timeout: float = 5.0, deadline=None):
+        status, data = self.request("GET", url, timeout=timeout, deadline=deadline)
+        if status >= 400:
+            raise OutboundError(f"GET {url.split('?', 1)[0]}: HTTP {status}")
+        return json.loads(data.decode())
+
+    def _record(self, host: str, ok: bool):
+        failures, _ = self._breakers.get(host, (0, 0.0))
+        if ok:
+            if failures >= self.breaker_failures:
+                print(f"[http] circuit closed: {host}")
+            self._breakers[host] = (0, 0.0)
+            return
+        failures += 1
+        open_until = 0.0
+        if failures >= self.breaker_failures:
+            open_until = time.monotonic() + self.breaker_reset_seconds
+            print(f"[http] circuit open: {host} after {failures} failures")
+        self._breakers[host] = (failures, open_until)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return dict(self.metrics, open=[h for h, (f, until) in self._breakers.items()
+                                        if f >= self.breaker_failures and now < until])
+
+
+http_client = HttpClient()
 
 
 def ok(data: dict):
     return {"statusCode": 200, "headers": CORS, "body": json.dumps(data)}
 
 
+def error(status: int, msg: str, **extra):
+    return {"statusCode": status, "headers": CORS, "body": json.dumps({"error": msg, **extra})}
+
+
+def cdn_url(key: str) -> str:
+    return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
+
+
+# ── Сессии загрузки ─────────────────────────────────────────────────────────
+
+def part_key(upload_id: str, part_number: int) -> str:
+    return f"{PARTS_PREFIX}/{upload_id}/{part_number:05d}.part"
+
+
+def manifest_checksum(hashes: list) -> str:
+    """Контрольная сумма файла по хэшам частей — считается без чтения данных."""
+    return hashlib.sha256("".join(hashes).encode()).hexdigest()
+
+
+def delete_objects(s3, keys: list):
+    for i in range(0, len(keys), 1000):
+        s3.delete_objects(Bucket=BUCKET, Delete={"Objects": [{"Key": k} for k in keys[i:i + 1000]], "Quiet": True})
+
+
+def delete_parts(s3, upload_id: str):
+    """Удаляет все объекты частей сессии, включая те, что не успели попасть в upload_parts."""
+    keys = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=BUCKET, Prefix=f"{PARTS_PREFIX}/{upload_id}/"):
+        keys.extend(o["Key"] for o in page.get("Contents", ()))
+    delete_objects(s3, keys)
+
+
+def part_groups(parts: list) -> list:
+    """Подряд идущие части [(номер, размер)], сгруппированные до MULTIPART_MIN_PART_BYTES."""
+    groups, current, size = [], [], 0
+    for number, part_size in parts:
+        current.append(number)
+        size += part_size
+        if size >= MULTIPART_MIN_PART_BYTES:
+            groups.append(current)
+            current, size = [], 0
+    if current:
+        groups.append(current)
+    return groups
+
+
+def assemble(s3, upload_id: str, key: str, content_type: str, parts: list):
+    """
+    Собирает объект из частей: мелкий файл — одним put_object, крупный — multipart-загрузкой,
+    где каждая часть S3 склеена из своей группы чанков (чанки группы читаются параллельно).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def read_part(number):
+        return s3.get_object(Bucket=BUCKET, Key=part_key(upload_id, number))["Body"].read()
+
+    groups = part_groups(parts)
+    with ThreadPoolExecutor(ASSEMBLE_WORKERS) as pool:
+        if len(groups) == 1:
+            s3.put_object(Bucket=BUCKET, Key=key, Body=b"".join(pool.map(read_part, groups[0])), ContentType=content_type)
+            return
+
+        mpu = s3.create_multipart_upload(Bucket=BUCKET, Key=key, ContentType=content_type)
+        try:
+            etags = []
+            for i, group in enumerate(groups, start=1):
+                resp = s3.upload_part(
+                    Bucket=BUCKET, Key=key, UploadId=mpu["UploadId"], PartNumber=i,
+                    Body=b"".join(pool.map(read_part, group)),
+                )
+                etags.append({"PartNumber": i, "ETag": resp["ETag"]})
+            s3.complete_multipart_upload(
+                Bucket=BUCKET, Key=key, UploadId=mpu["UploadId"], MultipartUpload={"Parts": etags},
+            )
+        except Exception:
+            s3.abort_multipart_upload(Bucket=BUCKET, Key=key, UploadId=mpu["UploadId"])
+            raise
+
+
+def collect_garbage(conn) -> dict:
+    """
+    Брошенные сессии (без новых частей дольше UPLOAD_SESSION_TTL_HOURS) помечаются expired, их части удаляются.
+    Заодно: объекты частей без живой сессии, незавершённые multipart-загрузки в videos/ и файлы /tmp от старой схемы.
+    """
+    from datetime import datetime, timezone, timedelta
+    s3 = get_s3()
+    cur = conn.cursor()
+    cur.execute(f"""
+        UPDATE {SCHEMA}.upload_sessions
+        SET status = 'expired', updated_at = NOW()
+        WHERE status IN ('open', 'completing')
+          AND updated_at < NOW() - make_interval(hours => %s)
+        RETURNING id::text
+    """, (UPLOAD_SESSION_TTL_HOURS,))
+    expired = [r[0] for r in cur.fetchall()]
+    if expired:
+        cur.execute(f"DELETE FROM {SCHEMA}.upload_parts WHERE upload_id = ANY(%s::uuid[])", (expired,))
+    conn.commit()
+    for upload_id in expired:
+        delete_parts(s3, upload_id)
+
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+    stale = {}
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=BUCKET, Prefix=f"{PARTS_PREFIX}/"):
+        for o in page.get("Contents", ()):
+            if o["LastModified"] < cutoff:
+                stale.setdefault(o["Key"].split("/")[1], []).append(o["Key"])
+    if stale:
+        cur.execute(f"""
+            SELECT id::text FROM {SCHEMA}.upload_sessions
+            WHERE id::text = ANY(%s) AND status IN ('open', 'completing')
+        """, (list(stale),))
+        for upload_id in {r[0] for r in cur.fetchall()}:
+            del stale[upload_id]
+    orphan_keys = [k for keys in stale.values() for k in keys]
+    delete_objects(s3, orphan_keys)
+    conn.commit()
+
+    aborted = 0
+    for page in s3.get_paginator("list_multipart_uploads").paginate(Bucket=BUCKET, Prefix="videos/"):
+        for u in page.get("Uploads", ()):
+            if u["Initiated"] < cutoff:
+                s3.abort_multipart_upload(Bucket=BUCKET, Key=u["Key"], UploadId=u["UploadId"])
+                aborted += 1
+
+    tmp_removed = 0
+    for path in _glob.glob(f"{TMP}/*.part") + _glob.glob(f"{TMP}/*.bin"):
+        if os.path.getmtime(path) < cutoff.timestamp():
+            os.remove(path)
+            tmp_removed += 1
+
+    result = {"expiredSessions": len(expired), "orphanParts": len(orphan_keys),
+              "abortedMultipart": aborted, "tmpFiles": tmp_removed}
+    print(f"[upload-gc] {result}")
+    return result
+
+
+def gc_if_due(conn):
+    global _next_gc_at
+    now = time.monotonic()
+    if now < _next_gc_at:
+        return
+    _next_gc_at = now + GC_INTERVAL_SECONDS
+    try:
+        collect_garbage(conn)
+    except Exception as e:
+        conn.rollback()
+        print(f"[upload-gc] failed: {e}")
+
+
 def handler(event: dict, context) -> dict:
     if event.get("httpMethod") == "OPTIONS":
         return {"statusCode": 200, "headers": CORS, "body": ""}
@@ -42,55 +353,162 @@ def handler(event: dict, context) -> dict:
     body = json.loads(event.get("body") or "{}")
     action = body.get("action")
 
+    if action in ("chunk", "status", "complete", "abort"):
+        try:
+            upload_id = str(uuid.UUID(str(body.get("uploadId", ""))))
+        except ValueError:
+            return error(400, "invalid uploadId")
+
     if action == "init":
         filename = body.get("filename", "video.mp4")
         ext = filename.rsplit(".", 1)[-1] if "." in filename else "mp4"
         upload_id = str(uuid.uuid4())
         key = f"videos/{uuid.uuid4()}.{ext}"
+        total_parts = int(body["totalParts"]) if body.get("totalParts") else None
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute(f"""
+            INSERT INTO {SCHEMA}.upload_sessions (id, key, filename, content_type, total_parts)
+            VALUES (%s, %s, %s, %s, %s)
+        """, (upload_id, key, filename, body.get("contentType") or "video/mp4", total_parts))
+        conn.commit()
+        gc_if_due(conn)
+        conn.close()
         return ok({"uploadId": upload_id, "key": key})
 
     elif action == "chunk":
-        upload_id = body["uploadId"]
         part_number = int(body["partNumber"])
+        if part_number < 1:
+            return error(400, "partNumber must be >= 1")
         data = base64.b64decode(body["data"])
-        chunk_path = f"{TMP}/{upload_id}_{part_number:04d}.part"
-        with open(chunk_path, "wb") as f:
-            f.write(data)
-        return ok({"ok": True, "part": part_number})
+        sha256 = hashlib.sha256(data).hexdigest()
+        if body.get("sha256") and body["sha256"].lower() != sha256:
+            return error(400, "checksum mismatch", part=part_number, sha256=sha256)
+
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute(f"SELECT status FROM {SCHEMA}.upload_sessions WHERE id = %s", (upload_id,))
+        row = cur.fetchone()
+        if not row or row[0] != "open":
+            conn.close()
+            return error(404 if not row else 409, "upload session is not open", status=row[0] if row else None)
+
+        # Сначала объект, потом запись: запись о части гарантирует, что данные уже в S3
+        get_s3().put_object(Bucket=BUCKET, Key=part_key(upload_id, part_number), Body=data)
+        cur.execute(f"""
+            INSERT INTO {SCHEMA}.upload_parts (upload_id, part_number, size, sha256)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (upload_id, part_number) DO UPDATE
+            SET size = EXCLUDED.size, sha256 = EXCLUDED.sha256, created_at = NOW()
+        """, (upload_id, part_number, len(data), sha256))
+        cur.execute(f"UPDATE {SCHEMA}.upload_sessions SET updated_at = NOW() WHERE id = %s", (upload_id,))
+        conn.commit()
+        conn.close()
+        return ok({"ok": True, "part": part_number, "size": len(data), "sha256": sha256})
+
+    elif action == "status":
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT s.status, s.total_parts, s.url,
+                   COALESCE(array_agg(p.part_number ORDER BY p.part_number)
+                            FILTER (WHERE p.part_number IS NOT NULL), '{{}}'),
+                   COALESCE(SUM(p.size), 0)
+            FROM {SCHEMA}.upload_sessions s
+            LEFT JOIN {SCHEMA}.upload_parts p ON p.upload_id = s.id
+            WHERE s.id = %s
+            GROUP BY s.id
+        """, (upload_id,))
+        row = cur.fetchone()
+        conn.close()
+        if not row:
+            return error(404, "upload session not found")
+        status, total_parts, url, received, size = row
+        total_parts = int(body.get("totalParts") or 0) or total_parts
+        missing = sorted(set(range(1, total_parts + 1)) - set(received)) if total_parts else None
+        return ok({"uploadId": upload_id, "status": status, "totalParts": total_parts, "received": received,
+                   "missing": missing, "bytes": int(size), "url": url})
 
     elif action == "complete":
-        upload_id = body["uploadId"]
-        key = body["key"]
-        content_type = body.get("contentType", "video/mp4")
-        total_parts = int(body.get("totalParts", 0))
-
-        # Собираем чанки в правильном порядке
-        parts = sorted(
-            _glob.glob(f"{TMP}/{upload_id}_*.part"),
-            key=lambda p: int(p.rsplit("_", 1)[-1].replace(".part", ""))
-        )
-        if not parts:
-            return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": "no parts found"})}
+        expected = body.get("sha256s")
+        if expected is not None and not (isinstance(expected, list) and all(isinstance(h, str) for h in expected)):
+            return error(400, "sha256s must be a list of hex strings")
+        try:
+            total_parts = int(body["totalParts"]) if body.get("totalParts") else None
+        except (TypeError, ValueError):
+            return error(400, "totalParts must be an integer")
 
-        # Конкатенируем в один файл
-        merged_path = f"{TMP}/{upload_id}.bin"
-        with open(merged_path, "wb") as out:
-            for p in parts:
-                with open(p, "rb") as f:
-                    out.write(f.read())
+        conn = get_conn()
+        cur = conn.cursor()
+        # Переводим в completing, чтобы параллельный complete или поздний chunk не вмешались в сборку;
+        # completing с истёкшей арендой забираем — иначе сессия упавшей сборки навсегда отвечала бы 409
+        cur.execute(f"""
+            UPDATE {SCHEMA}.upload_sessions
+            SET status = 'completing', updated_at = NOW(),
+                total_parts = COALESCE(%s, total_parts),
+                content_type = COALESCE(%s, content_type)
+            WHERE id = %s
+              AND (status = 'open'
+                   OR (status = 'completing' AND updated_at < NOW() - make_interval(mins => %s)))
+            RETURNING key, content_type, total_parts
+        """, (total_parts, body.get("contentType"), upload_id, COMPLETE_LEASE_MINUTES))
+        row = cur.fetchone()
+        if not row:
+            cur.execute(f"SELECT status, url, checksum FROM {SCHEMA}.upload_sessions WHERE id = %s", (upload_id,))
+            current = cur.fetchone()
+            conn.close()
+            if current and current[0] == "completed":
+                # Повтор complete после обрыва связи — отдаём готовый результат
+                return ok({"url": current[1], "checksum": current[2]})
+            return error(404 if not current else 409, "upload session is not open", status=current[0] if current else None)
+        key, content_type, total_parts = row
 
-        # Заливаем в S3
-        s3 = get_s3()
-        with open(merged_path, "rb") as f:
-            s3.put_object(Bucket=BUCKET, Key=key, Body=f.read(), ContentType=content_type)
+        cur.execute(f"""
+            SELECT part_number, size, sha256 FROM {SCHEMA}.upload_parts
+            WHERE upload_id = %s ORDER BY part_number
+        """, (upload_id,))
+        parts = cur.fetchall()
+        numbers = [p[0] for p in parts]
+        total_parts = total_parts or len(parts)
+        missing = sorted(set(range(1, total_parts + 1)) - set(numbers))
+        extra = [n for n in numbers if n > total_parts]
+        mismatched = []
+        if expected is not None and not missing:
+            mismatched = [n for n, _, h in parts if n <= total_parts and (n > len(expected) or expected[n - 1].lower() != h)]
+        if not parts or missing or extra or mismatched:
+            cur.execute(f"UPDATE {SCHEMA}.upload_sessions SET status = 'open' WHERE id = %s", (upload_id,))
+            conn.commit()
+            conn.close()
+            return error(409, "upload is incomplete", missing=missing, extra=extra, mismatched=mismatched)
+        conn.commit()
 
-        # Чистим временные файлы
-        for p in parts:
-            os.remove(p)
-        os.remove(merged_path)
+        parts = parts[:total_parts]
+        checksum = manifest_checksum([p[2] for p in parts])
+        s3 = get_s3()
+        try:
+            assemble(s3, upload_id, key, content_type, [(p[0], p[1]) for p in parts])
+        except Exception as e:
+            cur.execute(f"UPDATE {SCHEMA}.upload_sessions SET status = 'open' WHERE id = %s", (upload_id,))
+            conn.commit()
+            conn.close()
+            print(f"[upload] assemble {upload_id} failed: {e}")
+            return error(502, "storage error, retry complete")
 
-        cdn_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
-        return ok({"url": cdn_url})
+        url = cdn_url(key)
+        cur.execute(f"""
+            UPDATE {SCHEMA}.upload_sessions
+            SET status = 'completed', url = %s, checksum = %s, updated_at = NOW()
+            WHERE id = %s
+        """, (url, checksum, upload_id))
+        cur.execute(f"DELETE FROM {SCHEMA}.upload_parts WHERE upload_id = %s", (upload_id,))
+        conn.commit()
+        conn.close()
+        try:
+            delete_parts(s3, upload_id)
+        except Exception as e:
+            # Оставшиеся части уберёт gc
+            print(f"[upload] cleanup {upload_id} failed: {e}")
+        return ok({"url": url, "size": sum(p[1] for p in parts), "checksum": checksum})
 
     elif action == "upload_image":
         filename = body.get("filename", "photo.jpg")
@@ -100,24 +518,44 @@ def handler(event: dict, context) -> dict:
         key = f"images/{uuid.uuid4()}.{ext}"
         s3 = get_s3()
         s3.put_object(Bucket=BUCKET, Key=key, Body=data, ContentType=content_type)
-        cdn_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
-        return ok({"url": cdn_url})
+        return ok({"url": cdn_url(key)})
 
     elif action == "abort":
-        upload_id = body.get("uploadId", "")
-        for p in _glob.glob(f"{TMP}/{upload_id}_*.part"):
-            os.remove(p)
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute(f"""
+            UPDATE {SCHEMA}.upload_sessions SET status = 'aborted', updated_at = NOW()
+            WHERE id = %s AND status = 'open'
+        """, (upload_id,))
+        aborted = cur.rowcount > 0
+        if aborted:
+            cur.execute(f"DELETE FROM {SCHEMA}.upload_parts WHERE upload_id = %s", (upload_id,))
+        conn.commit()
+        conn.close()
+        if aborted:
+            delete_parts(get_s3(), upload_id)
         return ok({"ok": True})
 
+    elif action == "gc":
+        conn = get_conn()
+        result = collect_garbage(conn)
+        conn.close()
+        return ok(result)
+
     elif action == "proxy_video_chunk":
         # Скачиваем первые 512KB видео и возвращаем base64 — достаточно для seeked-кадра
-        import urllib.request
         video_url = body.get("url", "")
         if not video_url.startswith("https://cdn.poehali.dev"):
             return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": "invalid url"})}
-        req = urllib.request.Request(video_url, headers={"Range": "bytes=0-524288"})
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            chunk = resp.read()
+        try:
+            status, chunk = http_client.request(
+                "GET", video_url, headers={"Range": "bytes=0-524288"}, timeout=PROXY_TIMEOUT_SECONDS
+            )
+        except OutboundError as e:
+            print(f"[http] {e} {http_client.snapshot()}")
+            return {"statusCode": 503, "headers": CORS, "body": json.dumps({"error": "video unavailable"})}
+        if status >= 400:
+            return {"statusCode": 502, "headers": CORS, "body": json.dumps({"error": f"cdn status {status}"})}
         return ok({"data": base64.b64encode(chunk).decode(), "contentType": "video/mp4"})
 
     return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": "unknown action"})}
\ No newline at end of file
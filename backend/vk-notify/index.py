@@ -4,10 +4,12 @@ POST / — { userId, message } — отправить уведомление п
 """
 import os
 import json
-import urllib.request
+import time
 import urllib.parse
 
 
+VK_TIMEOUT_SECONDS = 5
+
 CORS = {
     "Access-Control-Allow-Origin": "*",
     "Access-Control-Allow-Methods": "POST, OPTIONS",
@@ -16,6 +18,128 @@ CORS = {
 }
 
 
+# ── Исходящие HTTP-запросы ──────────────────────────────────────────────────
+# Keep-alive соединения переживают тёплые вызовы. У каждого хоста свой circuit breaker:
+# после breaker_failures ошибок подряд запросы к нему отклоняются сразу, пока не пройдёт
+# breaker_reset_seconds; затем пропускается один пробный запрос.
+
+class OutboundError(Exception):
+    pass
+
+
+class HttpClient:
+    def __init__(self, max_idle_per_host: int = 4, breaker_failures: int = 5, breaker_reset_seconds: float = 30.0):
+        self.max_idle_per_host = max_idle_per_host
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self._idle = {}      # (scheme, host, port) -> [соединения]
+        self._breakers = {}  # host -> (ошибок подряд, открыт до monotonic)
+        self.metrics = {"requests": 0, "errors": 0, "timeouts": 0, "rejected": 0, "budget_exhausted": 0,
+                        "connected": 0, "reused": 0, "seconds": 0.0}
+
+    def request(self, method: str, url: str, body=None, headers=None, timeout: float = 5.0, deadline=None):
+        """
+        (status, bytes). deadline — момент time.monotonic(), к которому запрос должен завершиться:
+        таймаут урезается до остатка, а если его нет — запрос не отправляется.
+        Ошибки сети, таймауты, отказы breaker'а и бюджета — OutboundError.
+        """
+        import http.client
+        import urllib.parse
+        parts = urllib.parse.urlsplit(url)
+        host = parts.hostname
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        idle = self._idle.setdefault((parts.scheme, host, parts.port), [])
+
+        started = time.monotonic()
+        # Бюджет вызывающего проверяется до breaker'а: его исчерпание — не отказ хоста
+        clipped = deadline is not None and deadline - started < timeout
+        if clipped:
+            timeout = deadline - started
+            if timeout <= 0:
+                self.metrics["budget_exhausted"] += 1
+                raise OutboundError(f"deadline exceeded: {host}")
+        failures, open_until = self._breakers.get(host, (0, 0.0))
+        if failures >= self.breaker_failures and started < open_until:
+            self.metrics["rejected"] += 1
+            raise OutboundError(f"circuit open: {host}")
+
+        self.metrics["requests"] += 1
+        try:
+            while True:
+                if deadline is not None and deadline - time.monotonic() < timeout:
+                    clipped = True
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        raise TimeoutError("deadline exceeded")
+                reused = bool(idle)
+                if reused:
+                    conn = idle.pop()
+                    conn.sock.settimeout(timeout)
+                    self.metrics["reused"] += 1
+                else:
+                    conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+                    conn = conn_cls(host, parts.port, timeout=timeout)
+                    self.metrics["connected"] += 1
+                try:
+                    conn.request(method, path, body=body, headers=headers or {})
+                    resp = conn.getresponse()
+                    data = resp.read()
+                    break
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    conn.close()
+                    # Сервер закрыл простаивавшее соединение — GET повторяем на следующем
+                    if not reused or method != "GET":
+                        raise
+                except BaseException:
+                    conn.close()
+                    raise
+        except Exception as e:
+            self.metrics["errors"] += 1
+            if isinstance(e, TimeoutError):
+                self.metrics["timeouts"] += 1
+            # Таймаут, урезанный до остатка бюджета, ничего не говорит о хосте
+            if not (clipped and isinstance(e, TimeoutError)):
+                self._record(host, ok=False)
+            raise OutboundError(f"{method} {host}: {e!r}") from e
+        finally:
+            self.metrics["seconds"] += time.monotonic() - started
+
+        if resp.will_close or len(idle) >= self.max_idle_per_host:
+            conn.close()
+        else:
+            idle.append(conn)
+        self._record(host, ok=resp.status < 500)
+        return resp.status, data
+
+    def get_json(self, url: str, timeout: float = 5.0, deadline=None):
+        status, data = self.request("GET", url, timeout=timeout, deadline=deadline)
+        if status >= 400:
+            raise OutboundError(f"GET {url.split('?', 1)[0]}: HTTP {status}")
+        return json.loads(data.decode())
+
+    def _record(self, host: str, ok: bool):
+        failures, _ = self._breakers.get(host, (0, 0.0))
+        if ok:
+            if failures >= self.breaker_failures:
+                print(f"[http] circuit closed: {host}")
+            self._breakers[host] = (0, 0.0)
+            return
+        failures += 1
+        open_until = 0.0
+        if failures >= self.breaker_failures:
+            open_until = time.monotonic() + self.breaker_reset_seconds
+            print(f"[http] circuit open: {host} after {failures} failures")
+        self._breakers[host] = (failures, open_until)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return dict(self.metrics, open=[h for h, (f, until) in self._breakers.items()
+                                        if f >= self.breaker_failures and now < until])
+
+
+http_client = HttpClient()
+
+
 def handler(event: dict, context) -> dict:
     if event.get("httpMethod") == "OPTIONS":
         return {"statusCode": 200, "headers": CORS, "body": ""}
@@ -45,9 +169,11 @@ def handler(event: dict, context) -> dict:
         "v": "5.131",
     })
     url = f"https://api.vk.com/method/notifications.sendMessage?{params}"
-    req = urllib.request.Request(url)
-    with urllib.request.urlopen(req, timeout=10) as resp:
-        vk_resp = json.loads(resp.read().decode())
+    try:
+        vk_resp = http_client.get_json(url, timeout=VK_TIMEOUT_SECONDS)
+    except OutboundError as e:
+        print(f"[http] {e} {http_client.snapshot()}")
+        return {"statusCode": 503, "headers": CORS, "body": json.dumps({"error": "VK API unavailable"})}
 
     print("VK response:", json.dumps(vk_resp, ensure_ascii=False))
 
@@ -2,46 +2,268 @@
 VK Widget API — отдаёт активные лоты аукциона в формате списка для виджета сообщества ВКонтакте.
 GET  / — данные виджета (используется VK для отображения)
 POST / — обновить виджет в сообществе (требует community_token и group_id)
+Лоты берутся из снимка каталога в CDN (CATALOG_SNAPSHOT_URL — базовый URL catalog-publish), если он задан
+и доступен; иначе — из БД. Виджет показывает лоты своего сообщества: group_id из тела POST,
+для GET — параметр vk_group_id или заголовок X-Vk-Group-Id.
 """
 import os
 import json
-import urllib.request
-import psycopg2
+import time
 
+SCHEMA = "t_p68201414_vk_auction_app_1"
 
 CORS = {
     "Access-Control-Allow-Origin": "*",
     "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-    "Access-Control-Allow-Headers": "Content-Type",
+    "Access-Control-Allow-Headers": "Content-Type, X-Vk-Group-Id",
     "Content-Type": "application/json",
 }
 
+# Виджет обновляется раз в несколько минут — небольшое отставание реплики допустимо
+WIDGET_MAX_LAG_SECONDS = 30
+SNAPSHOT_TIMEOUT_SECONDS = 3
+VK_TIMEOUT_SECONDS = 8
 
-def get_widget_data(schema):
-    conn = psycopg2.connect(os.environ["DATABASE_URL"])
-    cur = conn.cursor()
-
-    cur.execute(f"""
-        SELECT
-            l.id,
-            l.title,
-            l.current_price,
-            l.status,
-            l.ends_at,
-            l.image,
-            COUNT(b.id) AS bid_count
-        FROM {schema}.lots l
-        LEFT JOIN {schema}.bids b ON b.lot_id = l.id
-        WHERE l.status IN ('active', 'upcoming')
-        GROUP BY l.id
-        ORDER BY l.status DESC, l.ends_at ASC
-        LIMIT 6
-    """)
-
-    rows = cur.fetchall()
-    cur.close()
+
+# ── Исходящие HTTP-запросы ──────────────────────────────────────────────────
+# Keep-alive соединения переживают тёплые вызовы. У каждого хоста свой circuit breaker:
+# после breaker_failures ошибок подряд запросы к нему отклоняются сразу, пока не пройдёт
+# breaker_reset_seconds; затем пропускается один пробный запрос.
+
+class OutboundError(Exception):
+    pass
+
+
+class HttpClient:
+    def __init__(self, max_idle_per_host: int = 4, breaker_failures: int = 5, breaker_reset_seconds: float = 30.0):
+        self.max_idle_per_host = max_idle_per_host
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self._idle = {}      # (scheme, host, port) -> [соединения]
+        self._breakers = {}  # host -> (ошибок подряд, открыт до monotonic)
+        self.metrics = {"requests": 0, "errors": 0, "timeouts": 0, "rejected": 0, "budget_exhausted": 0,
+                        "connected": 0, "reused": 0, "seconds": 0.0}
+
+    def request(self, method: str, url: str, body=None, headers=None, timeout: float = 5.0, deadline=None):
+        """
+        (status, bytes). deadline — момент time.monotonic(), к которому запрос должен завершиться:
+        таймаут урезается до остатка, а если его нет — запрос не отправляется.
+        Ошибки сети, таймауты, отказы breaker'а и бюджета — OutboundError.
+        """
+        import http.client
+        import urllib.parse
+        parts = urllib.parse.urlsplit(url)
+        host = parts.hostname
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        idle = self._idle.setdefault((parts.scheme, host, parts.port), [])
+
+        started = time.monotonic()
+        # Бюджет вызывающего проверяется до breaker'а: его исчерпание — не отказ хоста
+        clipped = deadline is not None and deadline - started < timeout
+        if clipped:
+            timeout = deadline - started
+            if timeout <= 0:
+                self.metrics["budget_exhausted"] += 1
+                raise OutboundError(f"deadline exceeded: {host}")
+        failures, open_until = self._breakers.get(host, (0, 0.0))
+        if failures >= self.breaker_failures and started < open_until:
+            self.metrics["rejected"] += 1
+            raise OutboundError(f"circuit open: {host}")
+
+        self.metrics["requests"] += 1
+        try:
+            while True:
+                if deadline is not None and deadline - time.monotonic() < timeout:
+                    clipped = True
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        raise TimeoutError("deadline exceeded")
+                reused = bool(idle)
+                if reused:
+                    conn = idle.pop()
+                    conn.sock.settimeout(timeout)
+                    self.metrics["reused"] += 1
+                else:
+                    conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+                    conn = conn_cls(host, parts.port, timeout=timeout)
+                    self.metrics["connected"] += 1
+                try:
+                    conn.request(method, path, body=body, headers=headers or {})
+                    resp = conn.getresponse()
+                    data = resp.read()
+                    break
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    conn.close()
+                    # Сервер закрыл простаивавшее соединение — GET повторяем на следующем
+                    if not reused or method != "GET":
+                        raise
+                except BaseException:
+                    conn.close()
+                    raise
+        except Exception as e:
+            self.metrics["errors"] += 1
+            if isinstance(e, TimeoutError):
+                self.metrics["timeouts"] += 1
+            # Таймаут, урезанный до остатка бюджета, ничего не говорит о хосте
+            if not (clipped and isinstance(e, TimeoutError)):
+                self._record(host, ok=False)
+            raise OutboundError(f"{method} {host}: {e!r}") from e
+        finally:
+            self.metrics["seconds"] += time.monotonic() - started
+
+        if resp.will_close or len(idle) >= self.max_idle_per_host:
+            conn.close()
+        else:
+            idle.append(conn)
+        self._record(host, ok=resp.status < 500)
+        return resp.status, data
+
+    def get_json(self, url: str, timeout: float = 5.0, deadline=None):
+        status, data = self.request("GET", url, timeout=timeout, deadline=deadline)
+        if status >= 400:
+            raise OutboundError(f"GET {url.split('?', 1)[0]}: HTTP {status}")
+        return json.loads(data.decode())
+
+    def _record(self, host: str, ok: bool):
+        failures, _ = self._breakers.get(host, (0, 0.0))
+        if ok:
+            if failures >= self.breaker_failures:
+                print(f"[http] circuit closed: {host}")
+            self._breakers[host] = (0, 0.0)
+            return
+        failures += 1
+        open_until = 0.0
+        if failures >= self.breaker_failures:
+            open_until = time.monotonic() + self.breaker_reset_seconds
+            print(f"[http] circuit open: {host} after {failures} failures")
+        self._breakers[host] = (failures, open_until)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return dict(self.metrics, open=[h for h, (f, until) in self._breakers.items()
+                                        if f >= self.breaker_failures and now < until])
+
+
+http_client = HttpClient()
+
+
+def get_read_conn(max_lag: float):
+    """Соединение для чтения: реплика (DATABASE_REPLICA_URL), если отстаёт не больше max_lag секунд, иначе primary."""
+    import psycopg2
+    url = os.environ.get("DATABASE_REPLICA_URL")
+    if not url:
+        return psycopg2.connect(os.environ["DATABASE_URL"])
+
+    try:
+        conn = psycopg2.connect(url, connect_timeout=2)
+    except Exception as e:
+        print(f"[replica] connect failed, using primary: {e}")
+        return psycopg2.connect(os.environ["DATABASE_URL"])
+
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                        ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+                   END
+        """)
+        lag = cur.fetchone()[0]
+        cur.close()
+        if lag <= max_lag:
+            return conn
+        print(f"[replica] lag={lag:.1f}s, using primary")
+    except Exception as e:
+        print(f"[replica] lag check failed, using primary: {e}")
     conn.close()
-    return rows
+    return psycopg2.connect(os.environ["DATABASE_URL"])
+
+
+# ── Сообщества ────────────────────────────────────────────────────────────────
+
+class TenantError(Exception):
+    """Запрос нельзя обслужить для этого сообщества; status — HTTP-код ответа."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def vk_group_id(event: dict):
+    """vk_group_id из параметров запуска: заголовок X-Vk-Group-Id или параметр vk_group_id."""
+    headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+    raw = headers.get("x-vk-group-id") or (event.get("queryStringParameters") or {}).get("vk_group_id")
+    try:
+        return int(raw) if raw else None
+    except (TypeError, ValueError):
+        return None
+
+
+def acquire_tenant(cur, group_id) -> int:
+    """Сообщество запроса и слот его квоты соединений до закрытия соединения: не подключено — 404, слоты заняты — 503."""
+    cur.execute(f"SELECT tenant_id, slot FROM {SCHEMA}.acquire_tenant_slot(%s)", (group_id,))
+    tenant_id, slot = cur.fetchone()
+    if tenant_id is None:
+        raise TenantError(404, "Сообщество не подключено к аукциону")
+    if slot is None:
+        raise TenantError(503, "Слишком много запросов, попробуйте через пару секунд")
+    return tenant_id
+
+
+def get_snapshot_widget_data(group_id):
+    """
+    Те же строки, что и get_widget_data, но из снимка каталога в CDN; None — снимок недоступен.
+    Снимок сообщества лежит в <vk_group_id>/lots.json, снимок сообщества по умолчанию — в lots.json.
+    """
+    base_url = os.environ.get("CATALOG_SNAPSHOT_URL")
+    if not base_url:
+        return None
+    from datetime import datetime
+    path = f"{group_id}/lots.json" if group_id else "lots.json"
+    try:
+        lots = http_client.get_json(f"{base_url.rstrip('/')}/{path}", timeout=SNAPSHOT_TIMEOUT_SECONDS)
+    except Exception as e:
+        print(f"[snapshot] unavailable, using DB: {e}")
+        return None
+
+    rows = [
+        (l["id"], l["title"], l["currentPrice"], l["status"],
+         datetime.fromisoformat(l["endsAt"]), l.get("image"), l.get("bidCount") or 0)
+        for l in lots if l["status"] in ("active", "upcoming") and l.get("endsAt")
+    ]
+    rows.sort(key=lambda r: r[4])
+    rows.sort(key=lambda r: r[3], reverse=True)
+    return rows[:6]
+
+
+def get_widget_data(group_id):
+    rows = get_snapshot_widget_data(group_id)
+    if rows is not None:
+        return rows
+
+    conn = get_read_conn(WIDGET_MAX_LAG_SECONDS)
+    # Слот сообщества держится до закрытия соединения — закрываем и при ошибке
+    try:
+        cur = conn.cursor()
+        tenant_id = acquire_tenant(cur, group_id)
+        cur.execute(f"""
+            SELECT
+                l.id,
+                l.title,
+                l.current_price,
+                l.status,
+                l.ends_at,
+                l.image,
+                COUNT(b.id) AS bid_count
+            FROM {SCHEMA}.lots l
+            LEFT JOIN {SCHEMA}.bids b ON b.lot_id = l.id
+            WHERE l.tenant_id = %s AND l.status IN ('active', 'upcoming')
+            GROUP BY l.id
+            ORDER BY l.status DESC, l.ends_at ASC
+            LIMIT 6
+        """, (tenant_id,))
+        return cur.fetchall()
+    finally:
+        conn.close()
 
 
 def format_price(n):
@@ -104,11 +326,13 @@ def handler(event: dict, context) -> dict:
     if event.get("httpMethod") == "OPTIONS":
         return {"statusCode": 200, "headers": CORS, "body": ""}
 
-    schema = os.environ.get("MAIN_DB_SCHEMA", "public")
     app_id = os.environ.get("VK_APP_ID", "")
 
     if event.get("httpMethod") == "GET":
-        rows = get_widget_data(schema)
+        try:
+            rows = get_widget_data(vk_group_id(event))
+        except TenantError as e:
+            return {"statusCode": e.status, "headers": CORS, "body": json.dumps({"error": str(e)})}
         widget = build_widget(rows, app_id)
         return {"statusCode": 200, "headers": CORS, "body": json.dumps(widget, ensure_ascii=False)}
 
@@ -120,7 +344,12 @@ def handler(event: dict, context) -> dict:
         if not community_token or not group_id:
             return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": "communityToken and groupId required"})}
 
-        rows = get_widget_data(schema)
+        try:
+            rows = get_widget_data(int(group_id))
+        except ValueError:
+            return {"statusCode": 400, "headers": CORS, "body": json.dumps({"error": "groupId must be a number"})}
+        except TenantError as e:
+            return {"statusCode": e.status, "headers": CORS, "body": json.dumps({"error": str(e)})}
         widget = build_widget(rows, app_id)
         widget_code = json.dumps(widget, ensure_ascii=False)
 
@@ -133,9 +362,11 @@ def handler(event: dict, context) -> dict:
             "access_token": community_token,
         })
         url = f"https://api.vk.com/method/appWidgets.update?{params}"
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            vk_resp = json.loads(resp.read().decode())
+        try:
+            vk_resp = http_client.get_json(url, timeout=VK_TIMEOUT_SECONDS)
+        except OutboundError as e:
+            print(f"[http] {e} {http_client.snapshot()}")
+            return {"statusCode": 503, "headers": CORS, "body": json.dumps({"error": "VK API unavailable"})}
 
         if vk_resp.get("error"):
             err = vk_resp["error"]
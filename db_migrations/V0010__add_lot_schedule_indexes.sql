@@ -0,0 +1,12 @@
+-- Частичные индексы под таймеры: завершение, отложенный старт и уведомление за 15 минут
+CREATE INDEX IF NOT EXISTS idx_lots_active_ends_at
+    ON t_p68201414_vk_auction_app_1.lots (ends_at)
+    WHERE status = 'active';
+
+CREATE INDEX IF NOT EXISTS idx_lots_upcoming_starts_at
+    ON t_p68201414_vk_auction_app_1.lots (starts_at)
+    WHERE status = 'upcoming';
+
+CREATE INDEX IF NOT EXISTS idx_lots_active_not_notified_ends_at
+    ON t_p68201414_vk_auction_app_1.lots (ends_at)
+    WHERE status = 'active' AND notified_15min = false;
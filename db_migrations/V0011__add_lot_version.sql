@@ -0,0 +1,5 @@
+-- Версия лота: растёт при каждой ставке и изменении лота, служит ключом кэша карточки
+CREATE SEQUENCE IF NOT EXISTS t_p68201414_vk_auction_app_1.lot_version_seq;
+
+ALTER TABLE t_p68201414_vk_auction_app_1.lots
+    ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT nextval('t_p68201414_vk_auction_app_1.lot_version_seq');
@@ -0,0 +1,7 @@
+-- Курсорная пагинация истории ставок в порядке (amount DESC, created_at, id)
+CREATE INDEX IF NOT EXISTS idx_bids_lot_amount_created
+    ON t_p68201414_vk_auction_app_1.bids (lot_id, amount DESC, created_at, id);
+
+-- Инкрементальный режим since=bidId
+CREATE INDEX IF NOT EXISTS idx_bids_lot_id_id
+    ON t_p68201414_vk_auction_app_1.bids (lot_id, id);
@@ -0,0 +1,248 @@
+-- Ставка целиком на стороне БД: валидация, антиснайпинг, автоставки и outbid-трекинг за один вызов
+
+-- Цикл автоставок: пока есть автоставка, способная перебить лидера, ставим за неё шаг.
+-- Ожидает, что лот уже заблокирован вызывающей функцией.
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.resolve_auto_bids(
+    p_lot_id INTEGER,
+    p_now TIMESTAMPTZ
+) RETURNS TABLE (
+    leader_id TEXT,
+    final_price INTEGER,
+    final_ends_at TIMESTAMPTZ,
+    rounds INTEGER
+) LANGUAGE plpgsql AS $$
+DECLARE
+    v_lot RECORD;
+    v_auto RECORD;
+    v_leader TEXT;
+    v_price INTEGER;
+    v_ends TIMESTAMPTZ;
+    v_rounds INTEGER := 0;
+BEGIN
+    SELECT l.current_price, l.step, l.ends_at, l.status, l.anti_snipe, l.anti_snipe_minutes
+      INTO v_lot
+      FROM t_p68201414_vk_auction_app_1.lots l
+     WHERE l.id = p_lot_id
+       FOR UPDATE;
+
+    SELECT b.user_id INTO v_leader
+      FROM t_p68201414_vk_auction_app_1.bids b
+     WHERE b.lot_id = p_lot_id
+     ORDER BY b.amount DESC, b.created_at ASC
+     LIMIT 1;
+
+    v_price := v_lot.current_price;
+    v_ends := v_lot.ends_at;
+
+    WHILE v_lot.status = 'active' AND v_ends > p_now AND v_rounds < 20 LOOP
+        SELECT a.user_id, a.user_name, a.user_avatar
+          INTO v_auto
+          FROM t_p68201414_vk_auction_app_1.auto_bids a
+         WHERE a.lot_id = p_lot_id
+           AND a.user_id IS DISTINCT FROM v_leader
+           AND a.max_amount >= v_price + v_lot.step
+         ORDER BY a.max_amount DESC, a.created_at ASC
+         LIMIT 1;
+        EXIT WHEN NOT FOUND;
+
+        v_price := v_price + v_lot.step;
+        IF v_lot.anti_snipe AND v_ends - p_now < make_interval(mins => v_lot.anti_snipe_minutes) THEN
+            v_ends := v_ends + make_interval(mins => v_lot.anti_snipe_minutes);
+        END IF;
+
+        INSERT INTO t_p68201414_vk_auction_app_1.bids (lot_id, user_id, user_name, user_avatar, amount)
+        VALUES (p_lot_id, v_auto.user_id, v_auto.user_name, v_auto.user_avatar, v_price);
+
+        v_leader := v_auto.user_id;
+        v_rounds := v_rounds + 1;
+    END LOOP;
+
+    IF v_rounds > 0 THEN
+        UPDATE t_p68201414_vk_auction_app_1.lots
+           SET current_price = v_price,
+               ends_at = v_ends,
+               version = nextval('t_p68201414_vk_auction_app_1.lot_version_seq')
+         WHERE id = p_lot_id;
+
+        DELETE FROM t_p68201414_vk_auction_app_1.auto_bids
+         WHERE lot_id = p_lot_id AND max_amount < v_price;
+    END IF;
+
+    leader_id := v_leader;
+    final_price := v_price;
+    final_ends_at := v_ends;
+    rounds := v_rounds;
+    RETURN NEXT;
+END;
+$$;
+
+-- Отмечает перебитых участников в outbid_tracking и возвращает тех, кому пора отправить уведомление
+-- (не чаще раза в p_cooldown_minutes на лот). Возвращённые сразу помечаются как уведомлённые.
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.track_outbid(
+    p_lot_id INTEGER,
+    p_leader_id TEXT,
+    p_now TIMESTAMPTZ,
+    p_cooldown_minutes INTEGER
+) RETURNS TEXT[] LANGUAGE plpgsql AS $$
+DECLARE
+    v_notify TEXT[];
+BEGIN
+    IF NOT COALESCE((SELECT enabled FROM t_p68201414_vk_auction_app_1.notification_config WHERE key = 'outbid'), false) THEN
+        RETURN '{}';
+    END IF;
+
+    INSERT INTO t_p68201414_vk_auction_app_1.outbid_tracking (lot_id, user_id, last_outbid_at)
+    SELECT DISTINCT p_lot_id, b.user_id, p_now
+      FROM t_p68201414_vk_auction_app_1.bids b
+     WHERE b.lot_id = p_lot_id AND b.user_id <> p_leader_id
+    ON CONFLICT (lot_id, user_id) DO UPDATE SET last_outbid_at = EXCLUDED.last_outbid_at;
+
+    WITH due AS (
+        UPDATE t_p68201414_vk_auction_app_1.outbid_tracking ot
+           SET last_notified_at = p_now
+          FROM t_p68201414_vk_auction_app_1.notification_settings ns
+         WHERE ns.user_id = ot.user_id
+           AND ns.allowed = true
+           AND ot.lot_id = p_lot_id
+           AND ot.user_id <> p_leader_id
+           AND ot.last_outbid_at >= p_now - make_interval(mins => p_cooldown_minutes)
+           AND (ot.last_notified_at IS NULL
+                OR ot.last_notified_at < ot.last_outbid_at - make_interval(mins => p_cooldown_minutes))
+        RETURNING ot.user_id
+    )
+    SELECT array_agg(user_id) INTO v_notify FROM due;
+
+    RETURN COALESCE(v_notify, '{}');
+END;
+$$;
+
+-- Обычная ставка: ошибки валидации поднимаются как RAISE EXCEPTION (SQLSTATE P0001) с текстом для пользователя.
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.place_bid(
+    p_lot_id INTEGER,
+    p_amount INTEGER,
+    p_user_id TEXT,
+    p_user_name TEXT,
+    p_user_avatar TEXT,
+    p_now TIMESTAMPTZ,
+    p_cooldown_minutes INTEGER DEFAULT 5
+) RETURNS TABLE (
+    bid_id INTEGER,
+    new_price INTEGER,
+    new_ends_at TIMESTAMPTZ,
+    extended BOOLEAN,
+    leader_id TEXT,
+    final_price INTEGER,
+    final_ends_at TIMESTAMPTZ,
+    lot_title TEXT,
+    notify_user_ids TEXT[]
+) LANGUAGE plpgsql AS $$
+DECLARE
+    v_lot RECORD;
+    v_auto RECORD;
+BEGIN
+    SELECT l.current_price, l.step, l.ends_at, l.status, l.anti_snipe, l.anti_snipe_minutes, l.title
+      INTO v_lot
+      FROM t_p68201414_vk_auction_app_1.lots l
+     WHERE l.id = p_lot_id
+       FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Лот не найден';
+    END IF;
+    IF v_lot.status <> 'active' OR v_lot.ends_at <= p_now THEN
+        RAISE EXCEPTION 'Аукцион уже завершён';
+    END IF;
+    IF p_amount < v_lot.current_price + v_lot.step THEN
+        RAISE EXCEPTION 'Ставка слишком маленькая. Минимум: % ₽', v_lot.current_price + v_lot.step;
+    END IF;
+
+    new_ends_at := v_lot.ends_at;
+    extended := false;
+    IF v_lot.anti_snipe AND v_lot.ends_at - p_now < make_interval(mins => v_lot.anti_snipe_minutes) THEN
+        new_ends_at := v_lot.ends_at + make_interval(mins => v_lot.anti_snipe_minutes);
+        extended := true;
+    END IF;
+
+    INSERT INTO t_p68201414_vk_auction_app_1.bids (lot_id, user_id, user_name, user_avatar, amount)
+    VALUES (p_lot_id, p_user_id, p_user_name, p_user_avatar, p_amount)
+    RETURNING id INTO bid_id;
+
+    UPDATE t_p68201414_vk_auction_app_1.lots
+       SET current_price = p_amount,
+           ends_at = new_ends_at,
+           version = nextval('t_p68201414_vk_auction_app_1.lot_version_seq')
+     WHERE id = p_lot_id;
+
+    -- Автоставки, которые уже не могут перебить новую цену, больше не нужны
+    DELETE FROM t_p68201414_vk_auction_app_1.auto_bids
+     WHERE lot_id = p_lot_id AND max_amount < p_amount;
+
+    new_price := p_amount;
+    lot_title := v_lot.title;
+
+    SELECT r.leader_id, r.final_price, r.final_ends_at
+      INTO v_auto
+      FROM t_p68201414_vk_auction_app_1.resolve_auto_bids(p_lot_id, p_now) r;
+    leader_id := v_auto.leader_id;
+    final_price := v_auto.final_price;
+    final_ends_at := v_auto.final_ends_at;
+
+    notify_user_ids := t_p68201414_vk_auction_app_1.track_outbid(p_lot_id, leader_id, p_now, p_cooldown_minutes);
+    RETURN NEXT;
+END;
+$$;
+
+-- Установка/обновление автоставки и немедленный ответ по ней за один вызов.
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.set_auto_bid(
+    p_lot_id INTEGER,
+    p_max_amount INTEGER,
+    p_user_id TEXT,
+    p_user_name TEXT,
+    p_user_avatar TEXT,
+    p_now TIMESTAMPTZ,
+    p_cooldown_minutes INTEGER DEFAULT 5
+) RETURNS TABLE (
+    leader_id TEXT,
+    final_price INTEGER,
+    final_ends_at TIMESTAMPTZ,
+    rounds INTEGER,
+    lot_title TEXT,
+    notify_user_ids TEXT[]
+) LANGUAGE plpgsql AS $$
+DECLARE
+    v_lot RECORD;
+    v_auto RECORD;
+BEGIN
+    SELECT l.status, l.title
+      INTO v_lot
+      FROM t_p68201414_vk_auction_app_1.lots l
+     WHERE l.id = p_lot_id
+       FOR UPDATE;
+
+    IF NOT FOUND OR v_lot.status <> 'active' THEN
+        RAISE EXCEPTION 'Аукцион не активен';
+    END IF;
+
+    INSERT INTO t_p68201414_vk_auction_app_1.auto_bids (lot_id, user_id, user_name, user_avatar, max_amount)
+    VALUES (p_lot_id, p_user_id, p_user_name, p_user_avatar, p_max_amount)
+    ON CONFLICT (lot_id, user_id) DO UPDATE
+      SET max_amount = EXCLUDED.max_amount,
+          user_name = EXCLUDED.user_name,
+          user_avatar = EXCLUDED.user_avatar;
+
+    SELECT r.leader_id, r.final_price, r.final_ends_at, r.rounds
+      INTO v_auto
+      FROM t_p68201414_vk_auction_app_1.resolve_auto_bids(p_lot_id, p_now) r;
+    leader_id := v_auto.leader_id;
+    final_price := v_auto.final_price;
+    final_ends_at := v_auto.final_ends_at;
+    rounds := v_auto.rounds;
+    lot_title := v_lot.title;
+
+    notify_user_ids := '{}';
+    IF rounds > 0 THEN
+        notify_user_ids := t_p68201414_vk_auction_app_1.track_outbid(p_lot_id, leader_id, p_now, p_cooldown_minutes);
+    END IF;
+    RETURN NEXT;
+END;
+$$;
@@ -0,0 +1,144 @@
+-- place_bid / set_auto_bid возвращают версию лота — токен read-your-writes для чтения с реплики.
+-- Тип результата меняется, поэтому функции пересоздаются.
+DROP FUNCTION IF EXISTS t_p68201414_vk_auction_app_1.place_bid(INTEGER, INTEGER, TEXT, TEXT, TEXT, TIMESTAMPTZ, INTEGER);
+DROP FUNCTION IF EXISTS t_p68201414_vk_auction_app_1.set_auto_bid(INTEGER, INTEGER, TEXT, TEXT, TEXT, TIMESTAMPTZ, INTEGER);
+
+-- Обычная ставка: ошибки валидации поднимаются как RAISE EXCEPTION (SQLSTATE P0001) с текстом для пользователя.
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.place_bid(
+    p_lot_id INTEGER,
+    p_amount INTEGER,
+    p_user_id TEXT,
+    p_user_name TEXT,
+    p_user_avatar TEXT,
+    p_now TIMESTAMPTZ,
+    p_cooldown_minutes INTEGER DEFAULT 5
+) RETURNS TABLE (
+    bid_id INTEGER,
+    new_price INTEGER,
+    new_ends_at TIMESTAMPTZ,
+    extended BOOLEAN,
+    leader_id TEXT,
+    final_price INTEGER,
+    final_ends_at TIMESTAMPTZ,
+    lot_title TEXT,
+    notify_user_ids TEXT[],
+    lot_version BIGINT
+) LANGUAGE plpgsql AS $$
+DECLARE
+    v_lot RECORD;
+    v_auto RECORD;
+BEGIN
+    SELECT l.current_price, l.step, l.ends_at, l.status, l.anti_snipe, l.anti_snipe_minutes, l.title
+      INTO v_lot
+      FROM t_p68201414_vk_auction_app_1.lots l
+     WHERE l.id = p_lot_id
+       FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Лот не найден';
+    END IF;
+    IF v_lot.status <> 'active' OR v_lot.ends_at <= p_now THEN
+        RAISE EXCEPTION 'Аукцион уже завершён';
+    END IF;
+    IF p_amount < v_lot.current_price + v_lot.step THEN
+        RAISE EXCEPTION 'Ставка слишком маленькая. Минимум: % ₽', v_lot.current_price + v_lot.step;
+    END IF;
+
+    new_ends_at := v_lot.ends_at;
+    extended := false;
+    IF v_lot.anti_snipe AND v_lot.ends_at - p_now < make_interval(mins => v_lot.anti_snipe_minutes) THEN
+        new_ends_at := v_lot.ends_at + make_interval(mins => v_lot.anti_snipe_minutes);
+        extended := true;
+    END IF;
+
+    INSERT INTO t_p68201414_vk_auction_app_1.bids (lot_id, user_id, user_name, user_avatar, amount)
+    VALUES (p_lot_id, p_user_id, p_user_name, p_user_avatar, p_amount)
+    RETURNING id INTO bid_id;
+
+    UPDATE t_p68201414_vk_auction_app_1.lots
+       SET current_price = p_amount,
+           ends_at = new_ends_at,
+           version = nextval('t_p68201414_vk_auction_app_1.lot_version_seq')
+     WHERE id = p_lot_id;
+
+    -- Автоставки, которые уже не могут перебить новую цену, больше не нужны
+    DELETE FROM t_p68201414_vk_auction_app_1.auto_bids
+     WHERE lot_id = p_lot_id AND max_amount < p_amount;
+
+    new_price := p_amount;
+    lot_title := v_lot.title;
+
+    SELECT r.leader_id, r.final_price, r.final_ends_at
+      INTO v_auto
+      FROM t_p68201414_vk_auction_app_1.resolve_auto_bids(p_lot_id, p_now) r;
+    leader_id := v_auto.leader_id;
+    final_price := v_auto.final_price;
+    final_ends_at := v_auto.final_ends_at;
+
+    notify_user_ids := t_p68201414_vk_auction_app_1.track_outbid(p_lot_id, leader_id, p_now, p_cooldown_minutes);
+    SELECT l.version INTO lot_version FROM t_p68201414_vk_auction_app_1.lots l WHERE l.id = p_lot_id;
+    RETURN NEXT;
+END;
+$$;
+
+-- Установка/обновление автоставки и немедленный ответ по ней за один вызов.
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.set_auto_bid(
+    p_lot_id INTEGER,
+    p_max_amount INTEGER,
+    p_user_id TEXT,
+    p_user_name TEXT,
+    p_user_avatar TEXT,
+    p_now TIMESTAMPTZ,
+    p_cooldown_minutes INTEGER DEFAULT 5
+) RETURNS TABLE (
+    leader_id TEXT,
+    final_price INTEGER,
+    final_ends_at TIMESTAMPTZ,
+    rounds INTEGER,
+    lot_title TEXT,
+    notify_user_ids TEXT[],
+    lot_version BIGINT
+) LANGUAGE plpgsql AS $$
+DECLARE
+    v_lot RECORD;
+    v_auto RECORD;
+BEGIN
+    SELECT l.status, l.title
+      INTO v_lot
+      FROM t_p68201414_vk_auction_app_1.lots l
+     WHERE l.id = p_lot_id
+       FOR UPDATE;
+
+    IF NOT FOUND OR v_lot.status <> 'active' THEN
+        RAISE EXCEPTION 'Аукцион не активен';
+    END IF;
+
+    INSERT INTO t_p68201414_vk_auction_app_1.auto_bids (lot_id, user_id, user_name, user_avatar, max_amount)
+    VALUES (p_lot_id, p_user_id, p_user_name, p_user_avatar, p_max_amount)
+    ON CONFLICT (lot_id, user_id) DO UPDATE
+      SET max_amount = EXCLUDED.max_amount,
+          user_name = EXCLUDED.user_name,
+          user_avatar = EXCLUDED.user_avatar;
+
+    -- Новая версия: по ней участник читает свою автоставку с реплики (read-your-writes)
+    UPDATE t_p68201414_vk_auction_app_1.lots
+       SET version = nextval('t_p68201414_vk_auction_app_1.lot_version_seq')
+     WHERE id = p_lot_id;
+
+    SELECT r.leader_id, r.final_price, r.final_ends_at, r.rounds
+      INTO v_auto
+      FROM t_p68201414_vk_auction_app_1.resolve_auto_bids(p_lot_id, p_now) r;
+    leader_id := v_auto.leader_id;
+    final_price := v_auto.final_price;
+    final_ends_at := v_auto.final_ends_at;
+    rounds := v_auto.rounds;
+    lot_title := v_lot.title;
+
+    notify_user_ids := '{}';
+    IF rounds > 0 THEN
+        notify_user_ids := t_p68201414_vk_auction_app_1.track_outbid(p_lot_id, leader_id, p_now, p_cooldown_minutes);
+    END IF;
+    SELECT l.version INTO lot_version FROM t_p68201414_vk_auction_app_1.lots l WHERE l.id = p_lot_id;
+    RETURN NEXT;
+END;
+$$;
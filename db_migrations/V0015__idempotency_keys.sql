@@ -0,0 +1,112 @@
+-- Результаты ставок и автоставок по ключу идемпотентности: повтор запроса получает исходный ответ,
+-- не блокируя строку лота. Ключи живут p_ttl_seconds.
+CREATE TABLE IF NOT EXISTS t_p68201414_vk_auction_app_1.idempotency_keys (
+    key TEXT PRIMARY KEY,
+    result JSONB,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at
+    ON t_p68201414_vk_auction_app_1.idempotency_keys (created_at);
+
+-- Занимает ключ. Параллельный дубль ждёт на уникальном индексе, пока первый запрос не завершится:
+-- если тот зафиксирован — возвращается его результат, если откатился — ключ достаётся второму.
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.claim_idempotency_key(
+    p_key TEXT,
+    p_now TIMESTAMPTZ,
+    p_ttl_seconds INTEGER,
+    OUT claimed BOOLEAN,
+    OUT stored JSONB
+) LANGUAGE plpgsql AS $$
+BEGIN
+    -- Изредка чистим просроченные ключи, чтобы не держать для этого отдельный таймер
+    IF random() < 0.01 THEN
+        DELETE FROM t_p68201414_vk_auction_app_1.idempotency_keys
+         WHERE created_at < p_now - make_interval(secs => p_ttl_seconds);
+    END IF;
+
+    DELETE FROM t_p68201414_vk_auction_app_1.idempotency_keys
+     WHERE key = p_key AND created_at < p_now - make_interval(secs => p_ttl_seconds);
+
+    INSERT INTO t_p68201414_vk_auction_app_1.idempotency_keys (key, created_at)
+    VALUES (p_key, p_now)
+    ON CONFLICT (key) DO NOTHING;
+    claimed := FOUND;
+
+    IF NOT claimed THEN
+        SELECT k.result INTO stored FROM t_p68201414_vk_auction_app_1.idempotency_keys k WHERE k.key = p_key;
+    END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.place_bid_once(
+    p_key TEXT,
+    p_lot_id INTEGER,
+    p_amount INTEGER,
+    p_user_id TEXT,
+    p_user_name TEXT,
+    p_user_avatar TEXT,
+    p_now TIMESTAMPTZ,
+    p_cooldown_minutes INTEGER DEFAULT 5,
+    p_ttl_seconds INTEGER DEFAULT 600
+) RETURNS TABLE (replayed BOOLEAN, result JSONB) LANGUAGE plpgsql AS $$
+DECLARE
+    v_claim RECORD;
+BEGIN
+    IF p_key IS NOT NULL THEN
+        v_claim := t_p68201414_vk_auction_app_1.claim_idempotency_key(p_key, p_now, p_ttl_seconds);
+        IF NOT v_claim.claimed THEN
+            replayed := true;
+            result := v_claim.stored;
+            RETURN NEXT;
+            RETURN;
+        END IF;
+    END IF;
+
+    SELECT to_jsonb(r) INTO result
+      FROM t_p68201414_vk_auction_app_1.place_bid(
+           p_lot_id, p_amount, p_user_id, p_user_name, p_user_avatar, p_now, p_cooldown_minutes) r;
+
+    IF p_key IS NOT NULL THEN
+        UPDATE t_p68201414_vk_auction_app_1.idempotency_keys SET result = place_bid_once.result WHERE key = p_key;
+    END IF;
+    replayed := false;
+    RETURN NEXT;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.set_auto_bid_once(
+    p_key TEXT,
+    p_lot_id INTEGER,
+    p_max_amount INTEGER,
+    p_user_id TEXT,
+    p_user_name TEXT,
+    p_user_avatar TEXT,
+    p_now TIMESTAMPTZ,
+    p_cooldown_minutes INTEGER DEFAULT 5,
+    p_ttl_seconds INTEGER DEFAULT 600
+) RETURNS TABLE (replayed BOOLEAN, result JSONB) LANGUAGE plpgsql AS $$
+DECLARE
+    v_claim RECORD;
+BEGIN
+    IF p_key IS NOT NULL THEN
+        v_claim := t_p68201414_vk_auction_app_1.claim_idempotency_key(p_key, p_now, p_ttl_seconds);
+        IF NOT v_claim.claimed THEN
+            replayed := true;
+            result := v_claim.stored;
+            RETURN NEXT;
+            RETURN;
+        END IF;
+    END IF;
+
+    SELECT to_jsonb(r) INTO result
+      FROM t_p68201414_vk_auction_app_1.set_auto_bid(
+           p_lot_id, p_max_amount, p_user_id, p_user_name, p_user_avatar, p_now, p_cooldown_minutes) r;
+
+    IF p_key IS NOT NULL THEN
+        UPDATE t_p68201414_vk_auction_app_1.idempotency_keys SET result = set_auto_bid_once.result WHERE key = p_key;
+    END IF;
+    replayed := false;
+    RETURN NEXT;
+END;
+$$;
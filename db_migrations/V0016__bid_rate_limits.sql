@@ -0,0 +1,75 @@
+-- Общий бэкенд ограничения частоты ставок (token bucket). UNLOGGED: состояние не критично и не пишется в WAL.
+CREATE UNLOGGED TABLE IF NOT EXISTS t_p68201414_vk_auction_app_1.rate_limit_buckets (
+    bucket TEXT PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+
+-- Берёт один жетон из корзины. Возвращает 0, если ставку можно принимать, иначе — сколько секунд подождать.
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.take_rate_token(
+    p_bucket TEXT,
+    p_rate DOUBLE PRECISION,
+    p_capacity DOUBLE PRECISION
+) RETURNS DOUBLE PRECISION LANGUAGE plpgsql AS $$
+DECLARE
+    v_now TIMESTAMPTZ := clock_timestamp();
+    v_tokens DOUBLE PRECISION;
+BEGIN
+    INSERT INTO t_p68201414_vk_auction_app_1.rate_limit_buckets AS b (bucket, tokens, updated_at)
+    VALUES (p_bucket, p_capacity, v_now)
+    ON CONFLICT (bucket) DO UPDATE
+       SET tokens = LEAST(p_capacity, b.tokens + EXTRACT(EPOCH FROM v_now - b.updated_at) * p_rate),
+           updated_at = v_now
+    RETURNING b.tokens INTO v_tokens;
+
+    IF v_tokens < 1 THEN
+        RETURN (1 - v_tokens) / p_rate;
+    END IF;
+
+    UPDATE t_p68201414_vk_auction_app_1.rate_limit_buckets SET tokens = tokens - 1 WHERE bucket = p_bucket;
+    RETURN 0;
+END;
+$$;
+
+-- Результат ставки дополнен минимальной следующей ставкой: auction-bid кэширует её и отсекает
+-- заведомо проигрышные ставки до обращения к БД.
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.place_bid_once(
+    p_key TEXT,
+    p_lot_id INTEGER,
+    p_amount INTEGER,
+    p_user_id TEXT,
+    p_user_name TEXT,
+    p_user_avatar TEXT,
+    p_now TIMESTAMPTZ,
+    p_cooldown_minutes INTEGER DEFAULT 5,
+    p_ttl_seconds INTEGER DEFAULT 600
+) RETURNS TABLE (replayed BOOLEAN, result JSONB) LANGUAGE plpgsql AS $$
+DECLARE
+    v_claim RECORD;
+BEGIN
+    IF p_key IS NOT NULL THEN
+        v_claim := t_p68201414_vk_auction_app_1.claim_idempotency_key(p_key, p_now, p_ttl_seconds);
+        IF NOT v_claim.claimed THEN
+            replayed := true;
+            result := v_claim.stored;
+            RETURN NEXT;
+            RETURN;
+        END IF;
+    END IF;
+
+    SELECT to_jsonb(r) INTO result
+      FROM t_p68201414_vk_auction_app_1.place_bid(
+           p_lot_id, p_amount, p_user_id, p_user_name, p_user_avatar, p_now, p_cooldown_minutes) r;
+
+    SELECT result || jsonb_build_object('min_next_bid', (result->>'final_price')::INTEGER + l.step)
+      INTO result
+      FROM t_p68201414_vk_auction_app_1.lots l
+     WHERE l.id = p_lot_id;
+
+    IF p_key IS NOT NULL THEN
+        UPDATE t_p68201414_vk_auction_app_1.idempotency_keys SET result = place_bid_once.result WHERE key = p_key;
+    END IF;
+    replayed := false;
+    RETURN NEXT;
+END;
+$$;
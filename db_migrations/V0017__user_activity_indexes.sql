@@ -0,0 +1,6 @@
+-- «Мои аукционы»: лоты, где пользователь ставил или держит автоставку
+CREATE INDEX IF NOT EXISTS idx_bids_user_lot
+    ON t_p68201414_vk_auction_app_1.bids (user_id, lot_id, amount);
+
+CREATE INDEX IF NOT EXISTS idx_auto_bids_user
+    ON t_p68201414_vk_auction_app_1.auto_bids (user_id);
@@ -0,0 +1,31 @@
+-- Полнотекстовый поиск по лотам: tsvector с русской морфологией + триграммы для поиска по мере ввода
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE t_p68201414_vk_auction_app_1.lots
+    ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.lots_search_vector_update() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', COALESCE(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('russian', COALESCE(NEW.description, '')), 'B');
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_lots_search_vector ON t_p68201414_vk_auction_app_1.lots;
+CREATE TRIGGER trg_lots_search_vector
+    BEFORE INSERT OR UPDATE OF title, description ON t_p68201414_vk_auction_app_1.lots
+    FOR EACH ROW EXECUTE FUNCTION t_p68201414_vk_auction_app_1.lots_search_vector_update();
+
+UPDATE t_p68201414_vk_auction_app_1.lots
+   SET search_vector =
+        setweight(to_tsvector('russian', COALESCE(title, '')), 'A') ||
+        setweight(to_tsvector('russian', COALESCE(description, '')), 'B');
+
+CREATE INDEX IF NOT EXISTS idx_lots_search_vector
+    ON t_p68201414_vk_auction_app_1.lots USING GIN (search_vector);
+
+CREATE INDEX IF NOT EXISTS idx_lots_title_trgm
+    ON t_p68201414_vk_auction_app_1.lots USING GIN (lower(title) gin_trgm_ops);
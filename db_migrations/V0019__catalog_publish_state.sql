@@ -0,0 +1,10 @@
+-- Состояние публикации статического каталога: что и когда последний раз выложено в бакет.
+-- Одна строка; версия — MAX(lots.version) на момент публикации, число лотов ловит удаления.
+CREATE TABLE IF NOT EXISTS t_p68201414_vk_auction_app_1.catalog_publish_state (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    published_version BIGINT NOT NULL DEFAULT 0,
+    published_lot_count INTEGER NOT NULL DEFAULT 0,
+    published_at TIMESTAMPTZ
+);
+
+INSERT INTO t_p68201414_vk_auction_app_1.catalog_publish_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
@@ -0,0 +1,280 @@
+-- Участники в отдельной таблице: ставки и автоставки ссылаются на них компактным user_key
+-- вместо копии имени и аватара в каждой строке. user_id (VK id) в ставках остаётся —
+-- по нему работают уведомления, outbid_tracking и winner_id.
+CREATE TABLE IF NOT EXISTS t_p68201414_vk_auction_app_1.users (
+    id SERIAL PRIMARY KEY,
+    vk_user_id TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL DEFAULT 'Участник',
+    avatar TEXT NOT NULL DEFAULT '',
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Бэкфилл: имя и аватар берём из самой свежей ставки или автоставки пользователя
+INSERT INTO t_p68201414_vk_auction_app_1.users (vk_user_id, name, avatar)
+SELECT DISTINCT ON (user_id) user_id, user_name, user_avatar
+  FROM (
+      SELECT user_id, user_name, user_avatar, created_at FROM t_p68201414_vk_auction_app_1.bids
+      UNION ALL
+      SELECT user_id, user_name, user_avatar, created_at FROM t_p68201414_vk_auction_app_1.auto_bids
+  ) activity
+ ORDER BY user_id, created_at DESC
+ON CONFLICT (vk_user_id) DO NOTHING;
+
+ALTER TABLE t_p68201414_vk_auction_app_1.bids
+    ADD COLUMN IF NOT EXISTS user_key INTEGER REFERENCES t_p68201414_vk_auction_app_1.users(id),
+    ALTER COLUMN user_name DROP NOT NULL,
+    ALTER COLUMN user_avatar DROP NOT NULL;
+ALTER TABLE t_p68201414_vk_auction_app_1.auto_bids
+    ADD COLUMN IF NOT EXISTS user_key INTEGER REFERENCES t_p68201414_vk_auction_app_1.users(id),
+    ALTER COLUMN user_name DROP NOT NULL,
+    ALTER COLUMN user_avatar DROP NOT NULL;
+
+-- Старые текстовые колонки обнуляются (NULL не занимает места в строке) и больше не пишутся;
+-- место в heap освобождается по мере VACUUM
+UPDATE t_p68201414_vk_auction_app_1.bids b
+   SET user_key = u.id, user_name = NULL, user_avatar = NULL
+  FROM t_p68201414_vk_auction_app_1.users u
+ WHERE u.vk_user_id = b.user_id;
+UPDATE t_p68201414_vk_auction_app_1.auto_bids a
+   SET user_key = u.id, user_name = NULL, user_avatar = NULL
+  FROM t_p68201414_vk_auction_app_1.users u
+ WHERE u.vk_user_id = a.user_id;
+
+ALTER TABLE t_p68201414_vk_auction_app_1.bids ALTER COLUMN user_key SET NOT NULL;
+ALTER TABLE t_p68201414_vk_auction_app_1.auto_bids ALTER COLUMN user_key SET NOT NULL;
+
+-- Ключ пользователя; имя и аватар обновляются только если изменились, чтобы ставка не писала в users зря
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.upsert_user(
+    p_user_id TEXT,
+    p_user_name TEXT,
+    p_user_avatar TEXT
+) RETURNS INTEGER LANGUAGE plpgsql AS $$
+DECLARE
+    v_key INTEGER;
+BEGIN
+    INSERT INTO t_p68201414_vk_auction_app_1.users AS u (vk_user_id, name, avatar)
+    VALUES (p_user_id, COALESCE(p_user_name, 'Участник'), COALESCE(p_user_avatar, ''))
+    ON CONFLICT (vk_user_id) DO UPDATE
+      SET name = EXCLUDED.name, avatar = EXCLUDED.avatar, updated_at = NOW()
+      WHERE u.name IS DISTINCT FROM EXCLUDED.name OR u.avatar IS DISTINCT FROM EXCLUDED.avatar
+    RETURNING id INTO v_key;
+
+    IF v_key IS NULL THEN
+        SELECT id INTO v_key FROM t_p68201414_vk_auction_app_1.users WHERE vk_user_id = p_user_id;
+    END IF;
+    RETURN v_key;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.resolve_auto_bids(
+    p_lot_id INTEGER,
+    p_now TIMESTAMPTZ
+) RETURNS TABLE (
+    leader_id TEXT,
+    final_price INTEGER,
+    final_ends_at TIMESTAMPTZ,
+    rounds INTEGER
+) LANGUAGE plpgsql AS $$
+DECLARE
+    v_lot RECORD;
+    v_auto RECORD;
+    v_leader TEXT;
+    v_price INTEGER;
+    v_ends TIMESTAMPTZ;
+    v_rounds INTEGER := 0;
+BEGIN
+    SELECT l.current_price, l.step, l.ends_at, l.status, l.anti_snipe, l.anti_snipe_minutes
+      INTO v_lot
+      FROM t_p68201414_vk_auction_app_1.lots l
+     WHERE l.id = p_lot_id
+       FOR UPDATE;
+
+    SELECT b.user_id INTO v_leader
+      FROM t_p68201414_vk_auction_app_1.bids b
+     WHERE b.lot_id = p_lot_id
+     ORDER BY b.amount DESC, b.created_at ASC
+     LIMIT 1;
+
+    v_price := v_lot.current_price;
+    v_ends := v_lot.ends_at;
+
+    WHILE v_lot.status = 'active' AND v_ends > p_now AND v_rounds < 20 LOOP
+        SELECT a.user_id, a.user_key
+          INTO v_auto
+          FROM t_p68201414_vk_auction_app_1.auto_bids a
+         WHERE a.lot_id = p_lot_id
+           AND a.user_id IS DISTINCT FROM v_leader
+           AND a.max_amount >= v_price + v_lot.step
+         ORDER BY a.max_amount DESC, a.created_at ASC
+         LIMIT 1;
+        EXIT WHEN NOT FOUND;
+
+        v_price := v_price + v_lot.step;
+        IF v_lot.anti_snipe AND v_ends - p_now < make_interval(mins => v_lot.anti_snipe_minutes) THEN
+            v_ends := v_ends + make_interval(mins => v_lot.anti_snipe_minutes);
+        END IF;
+
+        INSERT INTO t_p68201414_vk_auction_app_1.bids (lot_id, user_id, user_key, amount)
+        VALUES (p_lot_id, v_auto.user_id, v_auto.user_key, v_price);
+
+        v_leader := v_auto.user_id;
+        v_rounds := v_rounds + 1;
+    END LOOP;
+
+    IF v_rounds > 0 THEN
+        UPDATE t_p68201414_vk_auction_app_1.lots
+           SET current_price = v_price,
+               ends_at = v_ends,
+               version = nextval('t_p68201414_vk_auction_app_1.lot_version_seq')
+         WHERE id = p_lot_id;
+
+        DELETE FROM t_p68201414_vk_auction_app_1.auto_bids
+         WHERE lot_id = p_lot_id AND max_amount < v_price;
+    END IF;
+
+    leader_id := v_leader;
+    final_price := v_price;
+    final_ends_at := v_ends;
+    rounds := v_rounds;
+    RETURN NEXT;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.place_bid(
+    p_lot_id INTEGER,
+    p_amount INTEGER,
+    p_user_id TEXT,
+    p_user_name TEXT,
+    p_user_avatar TEXT,
+    p_now TIMESTAMPTZ,
+    p_cooldown_minutes INTEGER DEFAULT 5
+) RETURNS TABLE (
+    bid_id INTEGER,
+    new_price INTEGER,
+    new_ends_at TIMESTAMPTZ,
+    extended BOOLEAN,
+    leader_id TEXT,
+    final_price INTEGER,
+    final_ends_at TIMESTAMPTZ,
+    lot_title TEXT,
+    notify_user_ids TEXT[],
+    lot_version BIGINT
+) LANGUAGE plpgsql AS $$
+DECLARE
+    v_lot RECORD;
+    v_auto RECORD;
+BEGIN
+    SELECT l.current_price, l.step, l.ends_at, l.status, l.anti_snipe, l.anti_snipe_minutes, l.title
+      INTO v_lot
+      FROM t_p68201414_vk_auction_app_1.lots l
+     WHERE l.id = p_lot_id
+       FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Лот не найден';
+    END IF;
+    IF v_lot.status <> 'active' OR v_lot.ends_at <= p_now THEN
+        RAISE EXCEPTION 'Аукцион уже завершён';
+    END IF;
+    IF p_amount < v_lot.current_price + v_lot.step THEN
+        RAISE EXCEPTION 'Ставка слишком маленькая. Минимум: % ₽', v_lot.current_price + v_lot.step;
+    END IF;
+
+    new_ends_at := v_lot.ends_at;
+    extended := false;
+    IF v_lot.anti_snipe AND v_lot.ends_at - p_now < make_interval(mins => v_lot.anti_snipe_minutes) THEN
+        new_ends_at := v_lot.ends_at + make_interval(mins => v_lot.anti_snipe_minutes);
+        extended := true;
+    END IF;
+
+    INSERT INTO t_p68201414_vk_auction_app_1.bids (lot_id, user_id, user_key, amount)
+    VALUES (p_lot_id, p_user_id,
+            t_p68201414_vk_auction_app_1.upsert_user(p_user_id, p_user_name, p_user_avatar), p_amount)
+    RETURNING id INTO bid_id;
+
+    UPDATE t_p68201414_vk_auction_app_1.lots
+       SET current_price = p_amount,
+           ends_at = new_ends_at,
+           version = nextval('t_p68201414_vk_auction_app_1.lot_version_seq')
+     WHERE id = p_lot_id;
+
+    -- Автоставки, которые уже не могут перебить новую цену, больше не нужны
+    DELETE FROM t_p68201414_vk_auction_app_1.auto_bids
+     WHERE lot_id = p_lot_id AND max_amount < p_amount;
+
+    new_price := p_amount;
+    lot_title := v_lot.title;
+
+    SELECT r.leader_id, r.final_price, r.final_ends_at
+      INTO v_auto
+      FROM t_p68201414_vk_auction_app_1.resolve_auto_bids(p_lot_id, p_now) r;
+    leader_id := v_auto.leader_id;
+    final_price := v_auto.final_price;
+    final_ends_at := v_auto.final_ends_at;
+
+    notify_user_ids := t_p68201414_vk_auction_app_1.track_outbid(p_lot_id, leader_id, p_now, p_cooldown_minutes);
+    SELECT l.version INTO lot_version FROM t_p68201414_vk_auction_app_1.lots l WHERE l.id = p_lot_id;
+    RETURN NEXT;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.set_auto_bid(
+    p_lot_id INTEGER,
+    p_max_amount INTEGER,
+    p_user_id TEXT,
+    p_user_name TEXT,
+    p_user_avatar TEXT,
+    p_now TIMESTAMPTZ,
+    p_cooldown_minutes INTEGER DEFAULT 5
+) RETURNS TABLE (
+    leader_id TEXT,
+    final_price INTEGER,
+    final_ends_at TIMESTAMPTZ,
+    rounds INTEGER,
+    lot_title TEXT,
+    notify_user_ids TEXT[],
+    lot_version BIGINT
+) LANGUAGE plpgsql AS $$
+DECLARE
+    v_lot RECORD;
+    v_auto RECORD;
+BEGIN
+    SELECT l.status, l.title
+      INTO v_lot
+      FROM t_p68201414_vk_auction_app_1.lots l
+     WHERE l.id = p_lot_id
+       FOR UPDATE;
+
+    IF NOT FOUND OR v_lot.status <> 'active' THEN
+        RAISE EXCEPTION 'Аукцион не активен';
+    END IF;
+
+    INSERT INTO t_p68201414_vk_auction_app_1.auto_bids (lot_id, user_id, user_key, max_amount)
+    VALUES (p_lot_id, p_user_id,
+            t_p68201414_vk_auction_app_1.upsert_user(p_user_id, p_user_name, p_user_avatar), p_max_amount)
+    ON CONFLICT (lot_id, user_id) DO UPDATE
+      SET max_amount = EXCLUDED.max_amount;
+
+    -- Новая версия: по ней участник читает свою автоставку с реплики (read-your-writes)
+    UPDATE t_p68201414_vk_auction_app_1.lots
+       SET version = nextval('t_p68201414_vk_auction_app_1.lot_version_seq')
+     WHERE id = p_lot_id;
+
+    SELECT r.leader_id, r.final_price, r.final_ends_at, r.rounds
+      INTO v_auto
+      FROM t_p68201414_vk_auction_app_1.resolve_auto_bids(p_lot_id, p_now) r;
+    leader_id := v_auto.leader_id;
+    final_price := v_auto.final_price;
+    final_ends_at := v_auto.final_ends_at;
+    rounds := v_auto.rounds;
+    lot_title := v_lot.title;
+
+    notify_user_ids := '{}';
+    IF rounds > 0 THEN
+        notify_user_ids := t_p68201414_vk_auction_app_1.track_outbid(p_lot_id, leader_id, p_now, p_cooldown_minutes);
+    END IF;
+    SELECT l.version INTO lot_version FROM t_p68201414_vk_auction_app_1.lots l WHERE l.id = p_lot_id;
+    RETURN NEXT;
+END;
+$$;
@@ -0,0 +1,165 @@
+-- Журнал событий аукциона: ставки, продления, запуск, завершение и правки лотов пишутся триггерами
+-- в той же транзакции, что и само изменение, — через процедуры, движок торгов, таймеры или админку.
+-- Производные представления читают журнал по своему смещению вместо повторного сканирования таблиц.
+CREATE TABLE IF NOT EXISTS t_p68201414_vk_auction_app_1.auction_events (
+    id BIGSERIAL PRIMARY KEY,
+    txid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+    lot_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Порядок чтения — (txid, id): id выдаётся до фиксации, и транзакция с меньшим id может закоммититься позже.
+-- Читатель берёт только транзакции старше самой старой незавершённой, поэтому позади смещения ничего не появится.
+CREATE INDEX IF NOT EXISTS idx_auction_events_txid_id
+    ON t_p68201414_vk_auction_app_1.auction_events (txid, id);
+
+CREATE INDEX IF NOT EXISTS idx_auction_events_created_at
+    ON t_p68201414_vk_auction_app_1.auction_events (created_at);
+
+CREATE TABLE IF NOT EXISTS t_p68201414_vk_auction_app_1.event_consumers (
+    name TEXT PRIMARY KEY,
+    last_txid xid8 NOT NULL DEFAULT '0',
+    last_id BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- ── Запись ──────────────────────────────────────────────────────────────────
+
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.bids_append_event() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO t_p68201414_vk_auction_app_1.auction_events (lot_id, kind, payload)
+    VALUES (NEW.lot_id, 'bid', jsonb_build_object(
+        'bidId', NEW.id, 'userId', NEW.user_id, 'amount', NEW.amount, 'createdAt', NEW.created_at));
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_bids_append_event ON t_p68201414_vk_auction_app_1.bids;
+CREATE TRIGGER trg_bids_append_event
+    AFTER INSERT ON t_p68201414_vk_auction_app_1.bids
+    FOR EACH ROW EXECUTE FUNCTION t_p68201414_vk_auction_app_1.bids_append_event();
+
+-- Смена цены без смены статуса не пишется: её уже описывает событие bid.
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.lots_append_event() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO t_p68201414_vk_auction_app_1.auction_events (lot_id, kind, payload)
+        VALUES (NEW.id, 'lot_created', jsonb_build_object(
+            'status', NEW.status, 'startsAt', NEW.starts_at, 'endsAt', NEW.ends_at));
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO t_p68201414_vk_auction_app_1.auction_events (lot_id, kind, payload)
+        VALUES (OLD.id, 'lot_deleted', jsonb_build_object('status', OLD.status));
+        RETURN NULL;
+    END IF;
+
+    IF NEW.status IS DISTINCT FROM OLD.status THEN
+        INSERT INTO t_p68201414_vk_auction_app_1.auction_events (lot_id, kind, payload)
+        VALUES (NEW.id,
+                CASE NEW.status
+                    WHEN 'active' THEN 'lot_activated'
+                    WHEN 'finished' THEN 'lot_finished'
+                    WHEN 'cancelled' THEN 'lot_cancelled'
+                    ELSE 'lot_status'
+                END,
+                jsonb_build_object(
+                    'from', OLD.status, 'to', NEW.status, 'price', NEW.current_price,
+                    'winnerId', NEW.winner_id, 'endsAt', NEW.ends_at));
+    ELSIF NEW.ends_at IS DISTINCT FROM OLD.ends_at THEN
+        INSERT INTO t_p68201414_vk_auction_app_1.auction_events (lot_id, kind, payload)
+        VALUES (NEW.id, 'lot_extended', jsonb_build_object('endsAt', NEW.ends_at, 'previousEndsAt', OLD.ends_at));
+    END IF;
+
+    IF (NEW.title, NEW.description, NEW.image, NEW.video, NEW.video_duration, NEW.start_price, NEW.step,
+        NEW.starts_at, NEW.anti_snipe, NEW.anti_snipe_minutes, NEW.payment_status)
+       IS DISTINCT FROM
+       (OLD.title, OLD.description, OLD.image, OLD.video, OLD.video_duration, OLD.start_price, OLD.step,
+        OLD.starts_at, OLD.anti_snipe, OLD.anti_snipe_minutes, OLD.payment_status) THEN
+        INSERT INTO t_p68201414_vk_auction_app_1.auction_events (lot_id, kind, payload)
+        VALUES (NEW.id, 'lot_updated', jsonb_build_object('paymentStatus', NEW.payment_status));
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_lots_append_event ON t_p68201414_vk_auction_app_1.lots;
+CREATE TRIGGER trg_lots_append_event
+    AFTER INSERT OR UPDATE OR DELETE ON t_p68201414_vk_auction_app_1.lots
+    FOR EACH ROW EXECUTE FUNCTION t_p68201414_vk_auction_app_1.lots_append_event();
+
+-- ── Чтение ──────────────────────────────────────────────────────────────────
+
+-- Следующая пачка событий после смещения потребителя (или после p_after_*, если читаем несколько пачек подряд).
+-- Смещение не двигается: потребитель подтверждает обработанное через ack_auction_events,
+-- так что упавший обработчик перечитает те же события.
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.read_auction_events(
+    p_consumer TEXT,
+    p_limit INTEGER DEFAULT 500,
+    p_after_txid xid8 DEFAULT NULL,
+    p_after_id BIGINT DEFAULT NULL
+) RETURNS SETOF t_p68201414_vk_auction_app_1.auction_events LANGUAGE plpgsql AS $$
+DECLARE
+    v_pos RECORD;
+BEGIN
+    IF p_after_txid IS NOT NULL THEN
+        SELECT p_after_txid AS last_txid, p_after_id AS last_id INTO v_pos;
+    ELSE
+        INSERT INTO t_p68201414_vk_auction_app_1.event_consumers (name) VALUES (p_consumer)
+        ON CONFLICT (name) DO NOTHING;
+
+        SELECT c.last_txid, c.last_id INTO v_pos
+          FROM t_p68201414_vk_auction_app_1.event_consumers c
+         WHERE c.name = p_consumer;
+    END IF;
+
+    RETURN QUERY
+    SELECT e.*
+      FROM t_p68201414_vk_auction_app_1.auction_events e
+     WHERE (e.txid, e.id) > (v_pos.last_txid, v_pos.last_id)
+       AND e.txid < pg_snapshot_xmin(pg_current_snapshot())
+     ORDER BY e.txid, e.id
+     LIMIT p_limit;
+END;
+$$;
+
+-- Удаляет события старше p_keep_days, которые уже прочитали все потребители
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.prune_auction_events(
+    p_keep_days INTEGER DEFAULT 7
+) RETURNS INTEGER LANGUAGE plpgsql AS $$
+DECLARE
+    v_deleted INTEGER;
+BEGIN
+    DELETE FROM t_p68201414_vk_auction_app_1.auction_events e
+     WHERE e.created_at < NOW() - make_interval(days => p_keep_days)
+       AND NOT EXISTS (
+           SELECT 1 FROM t_p68201414_vk_auction_app_1.event_consumers c
+            WHERE (c.last_txid, c.last_id) < (e.txid, e.id)
+       );
+    GET DIAGNOSTICS v_deleted = ROW_COUNT;
+    RETURN v_deleted;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.ack_auction_events(
+    p_consumer TEXT,
+    p_txid xid8,
+    p_id BIGINT
+) RETURNS VOID LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE t_p68201414_vk_auction_app_1.event_consumers
+       SET last_txid = p_txid, last_id = p_id, updated_at = NOW()
+     WHERE name = p_consumer
+       AND (last_txid, last_id) < (p_txid, p_id);
+
+    -- Изредка чистим прочитанный хвост, чтобы не держать для этого отдельный таймер
+    IF random() < 0.01 THEN
+        PERFORM t_p68201414_vk_auction_app_1.prune_auction_events();
+    END IF;
+END;
+$$;
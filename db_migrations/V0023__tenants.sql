@@ -0,0 +1,149 @@
+-- Несколько VK-сообществ в одной установке: сообщество (tenant) определяется по vk_group_id,
+-- лоты и визиты помечены tenant_id. Ставки, автоставки и трекинг привязаны к лоту и отдельной колонки не требуют.
+CREATE TABLE IF NOT EXISTS t_p68201414_vk_auction_app_1.tenants (
+    id SERIAL PRIMARY KEY,
+    vk_group_id BIGINT UNIQUE,
+    vk_app_id BIGINT,
+    name TEXT NOT NULL DEFAULT '',
+    -- Сколько соединений с БД сообщество может держать одновременно (на каждый сервер БД)
+    max_connections INTEGER NOT NULL DEFAULT 5 CHECK (max_connections > 0),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Существующие данные принадлежат первому сообществу. Пока у него не задан vk_group_id,
+-- к нему попадают все запросы без зарегистрированного сообщества — установка работает как раньше.
+INSERT INTO t_p68201414_vk_auction_app_1.tenants (id, name, max_connections)
+VALUES (1, 'default', 20)
+ON CONFLICT (id) DO NOTHING;
+
+SELECT setval(pg_get_serial_sequence('t_p68201414_vk_auction_app_1.tenants', 'id'),
+              GREATEST((SELECT MAX(id) FROM t_p68201414_vk_auction_app_1.tenants), 1));
+
+ALTER TABLE t_p68201414_vk_auction_app_1.lots
+    ADD COLUMN IF NOT EXISTS tenant_id INTEGER NOT NULL DEFAULT 1
+        REFERENCES t_p68201414_vk_auction_app_1.tenants(id);
+
+ALTER TABLE t_p68201414_vk_auction_app_1.visits
+    ADD COLUMN IF NOT EXISTS tenant_id INTEGER NOT NULL DEFAULT 1
+        REFERENCES t_p68201414_vk_auction_app_1.tenants(id);
+
+ALTER TABLE t_p68201414_vk_auction_app_1.auction_events
+    ADD COLUMN IF NOT EXISTS tenant_id INTEGER;
+
+-- Каталог и админка сообщества: лоты по дате создания
+CREATE INDEX IF NOT EXISTS idx_lots_tenant_created_at
+    ON t_p68201414_vk_auction_app_1.lots (tenant_id, created_at DESC);
+
+DROP INDEX IF EXISTS t_p68201414_vk_auction_app_1.visits_user_date_idx;
+CREATE UNIQUE INDEX IF NOT EXISTS visits_tenant_user_date_idx
+    ON t_p68201414_vk_auction_app_1.visits (tenant_id, vk_user_id, visit_date);
+
+-- ── Сообщество запроса и его квота соединений ────────────────────────────────
+
+-- Находит сообщество по vk_group_id и занимает один из его max_connections слотов
+-- (сессионная advisory-блокировка: освобождается вместе с соединением).
+-- tenant_id NULL — сообщество не подключено; slot NULL — все слоты заняты, запрос надо отклонить.
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.acquire_tenant_slot(
+    p_vk_group_id BIGINT,
+    OUT tenant_id INTEGER,
+    OUT slot INTEGER
+) LANGUAGE plpgsql AS $$
+DECLARE
+    v_max INTEGER;
+    v_start INTEGER;
+BEGIN
+    IF p_vk_group_id IS NOT NULL THEN
+        SELECT t.id, t.max_connections INTO tenant_id, v_max
+          FROM t_p68201414_vk_auction_app_1.tenants t
+         WHERE t.vk_group_id = p_vk_group_id;
+    END IF;
+    IF tenant_id IS NULL THEN
+        SELECT t.id, t.max_connections INTO tenant_id, v_max
+          FROM t_p68201414_vk_auction_app_1.tenants t
+         WHERE t.id = 1 AND t.vk_group_id IS NULL;
+    END IF;
+    IF tenant_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    -- Слоты перебираются со случайного места, чтобы параллельные запросы не толкались на первых
+    v_start := floor(random() * v_max)::INTEGER;
+    FOR i IN 0 .. v_max - 1 LOOP
+        IF pg_try_advisory_lock(tenant_id, (v_start + i) % v_max) THEN
+            slot := (v_start + i) % v_max;
+            RETURN;
+        END IF;
+    END LOOP;
+END;
+$$;
+
+-- ── Журнал событий с сообществом ─────────────────────────────────────────────
+
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.bids_append_event() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO t_p68201414_vk_auction_app_1.auction_events (lot_id, tenant_id, kind, payload)
+    SELECT NEW.lot_id, l.tenant_id, 'bid', jsonb_build_object(
+               'bidId', NEW.id, 'userId', NEW.user_id, 'amount', NEW.amount, 'createdAt', NEW.created_at)
+      FROM t_p68201414_vk_auction_app_1.lots l
+     WHERE l.id = NEW.lot_id;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.lots_append_event() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO t_p68201414_vk_auction_app_1.auction_events (lot_id, tenant_id, kind, payload)
+        VALUES (NEW.id, NEW.tenant_id, 'lot_created', jsonb_build_object(
+            'status', NEW.status, 'startsAt', NEW.starts_at, 'endsAt', NEW.ends_at));
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO t_p68201414_vk_auction_app_1.auction_events (lot_id, tenant_id, kind, payload)
+        VALUES (OLD.id, OLD.tenant_id, 'lot_deleted', jsonb_build_object('status', OLD.status));
+        RETURN NULL;
+    END IF;
+
+    IF NEW.status IS DISTINCT FROM OLD.status THEN
+        INSERT INTO t_p68201414_vk_auction_app_1.auction_events (lot_id, tenant_id, kind, payload)
+        VALUES (NEW.id, NEW.tenant_id,
+                CASE NEW.status
+                    WHEN 'active' THEN 'lot_activated'
+                    WHEN 'finished' THEN 'lot_finished'
+                    WHEN 'cancelled' THEN 'lot_cancelled'
+                    ELSE 'lot_status'
+                END,
+                jsonb_build_object(
+                    'from', OLD.status, 'to', NEW.status, 'price', NEW.current_price,
+                    'winnerId', NEW.winner_id, 'endsAt', NEW.ends_at));
+    ELSIF NEW.ends_at IS DISTINCT FROM OLD.ends_at THEN
+        INSERT INTO t_p68201414_vk_auction_app_1.auction_events (lot_id, tenant_id, kind, payload)
+        VALUES (NEW.id, NEW.tenant_id, 'lot_extended',
+                jsonb_build_object('endsAt', NEW.ends_at, 'previousEndsAt', OLD.ends_at));
+    END IF;
+
+    IF (NEW.title, NEW.description, NEW.image, NEW.video, NEW.video_duration, NEW.start_price, NEW.step,
+        NEW.starts_at, NEW.anti_snipe, NEW.anti_snipe_minutes, NEW.payment_status)
+       IS DISTINCT FROM
+       (OLD.title, OLD.description, OLD.image, OLD.video, OLD.video_duration, OLD.start_price, OLD.step,
+        OLD.starts_at, OLD.anti_snipe, OLD.anti_snipe_minutes, OLD.payment_status) THEN
+        INSERT INTO t_p68201414_vk_auction_app_1.auction_events (lot_id, tenant_id, kind, payload)
+        VALUES (NEW.id, NEW.tenant_id, 'lot_updated', jsonb_build_object('paymentStatus', NEW.payment_status));
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+UPDATE t_p68201414_vk_auction_app_1.auction_events SET tenant_id = 1 WHERE tenant_id IS NULL;
+
+-- ── Публикация каталога по сообществам ───────────────────────────────────────
+
+-- Строка состояния на сообщество: id = tenants.id
+ALTER TABLE t_p68201414_vk_auction_app_1.catalog_publish_state
+    DROP CONSTRAINT IF EXISTS catalog_publish_state_id_check;
+ALTER TABLE t_p68201414_vk_auction_app_1.catalog_publish_state
+    ALTER COLUMN id TYPE INTEGER,
+    ALTER COLUMN id DROP DEFAULT;
@@ -0,0 +1,29 @@
+-- Сессии загрузки видео: какие части дошли, их размер и SHA-256. Части лежат в S3 (uploads/<id>/),
+-- поэтому их можно слать параллельно, в любом порядке и на любой инстанс функции, а после обрыва — докачать.
+CREATE TABLE IF NOT EXISTS t_p68201414_vk_auction_app_1.upload_sessions (
+    id UUID PRIMARY KEY,
+    key TEXT NOT NULL,
+    filename TEXT NOT NULL DEFAULT '',
+    content_type TEXT NOT NULL DEFAULT 'video/mp4',
+    total_parts INTEGER,
+    -- open → completing → completed; aborted / expired — части удалены
+    status TEXT NOT NULL DEFAULT 'open',
+    url TEXT,
+    checksum TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS t_p68201414_vk_auction_app_1.upload_parts (
+    upload_id UUID NOT NULL REFERENCES t_p68201414_vk_auction_app_1.upload_sessions(id) ON DELETE CASCADE,
+    part_number INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (upload_id, part_number)
+);
+
+-- Уборка брошенных сессий: незавершённые по давности последней части
+CREATE INDEX IF NOT EXISTS idx_upload_sessions_unfinished_updated_at
+    ON t_p68201414_vk_auction_app_1.upload_sessions (updated_at)
+    WHERE status IN ('open', 'completing');
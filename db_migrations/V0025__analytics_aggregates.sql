@@ -0,0 +1,179 @@
+-- Аналитика для админки без сканов истории: итоги лота фиксируются в lot_settlements при завершении,
+-- суммы по сообществу (tenant_stats, revenue_by_payment_status) сдвигаются на разницу в той же транзакции.
+
+-- Продления антиснайпинга считаются прямо в строке лота: ставка её всё равно обновляет
+ALTER TABLE t_p68201414_vk_auction_app_1.lots
+    ADD COLUMN IF NOT EXISTS extensions INTEGER NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS t_p68201414_vk_auction_app_1.lot_settlements (
+    lot_id INTEGER PRIMARY KEY,
+    tenant_id INTEGER NOT NULL,
+    bids INTEGER NOT NULL,
+    -- ставок за последние FINAL_WINDOW_MINUTES (10) минут перед концом
+    final_window_bids INTEGER NOT NULL,
+    extensions INTEGER NOT NULL,
+    start_price INTEGER NOT NULL,
+    final_price INTEGER NOT NULL,
+    payment_status TEXT,
+    settled_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS t_p68201414_vk_auction_app_1.tenant_stats (
+    tenant_id INTEGER PRIMARY KEY,
+    lots_settled INTEGER NOT NULL DEFAULT 0,
+    lots_sold INTEGER NOT NULL DEFAULT 0,
+    lots_extended INTEGER NOT NULL DEFAULT 0,
+    bids INTEGER NOT NULL DEFAULT 0,
+    final_window_bids INTEGER NOT NULL DEFAULT 0,
+    extensions INTEGER NOT NULL DEFAULT 0,
+    -- стартовые и итоговые цены только проданных лотов (со ставками) — для прироста цены
+    sold_start_price BIGINT NOT NULL DEFAULT 0,
+    sold_final_price BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS t_p68201414_vk_auction_app_1.revenue_by_payment_status (
+    tenant_id INTEGER NOT NULL,
+    payment_status TEXT NOT NULL,
+    lots INTEGER NOT NULL DEFAULT 0,
+    amount BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (tenant_id, payment_status)
+);
+
+-- ── Продления ───────────────────────────────────────────────────────────────
+
+-- Продление — ставка, сдвинувшая конец активного лота; правка ends_at админом не считается
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.lots_count_extension() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF NEW.status = 'active' AND OLD.status = 'active'
+       AND NEW.ends_at > OLD.ends_at AND NEW.current_price > OLD.current_price THEN
+        NEW.extensions := OLD.extensions + 1;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_lots_count_extension ON t_p68201414_vk_auction_app_1.lots;
+CREATE TRIGGER trg_lots_count_extension
+    BEFORE UPDATE OF ends_at ON t_p68201414_vk_auction_app_1.lots
+    FOR EACH ROW EXECUTE FUNCTION t_p68201414_vk_auction_app_1.lots_count_extension();
+
+-- ── Итоги лота ──────────────────────────────────────────────────────────────
+
+-- Сдвигает суммы сообщества на итоги одного лота со знаком p_sign (+1 — учесть, -1 — откатить)
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.apply_lot_settlement(
+    s t_p68201414_vk_auction_app_1.lot_settlements,
+    p_sign INTEGER
+) RETURNS VOID LANGUAGE plpgsql AS $$
+DECLARE
+    v_sold INTEGER := CASE WHEN s.bids > 0 THEN 1 ELSE 0 END;
+BEGIN
+    INSERT INTO t_p68201414_vk_auction_app_1.tenant_stats AS t (
+        tenant_id, lots_settled, lots_sold, lots_extended, bids, final_window_bids, extensions,
+        sold_start_price, sold_final_price)
+    VALUES (
+        s.tenant_id, p_sign, p_sign * v_sold, p_sign * (CASE WHEN s.extensions > 0 THEN 1 ELSE 0 END),
+        p_sign * s.bids, p_sign * s.final_window_bids, p_sign * s.extensions,
+        p_sign * v_sold * s.start_price, p_sign * v_sold * s.final_price)
+    ON CONFLICT (tenant_id) DO UPDATE SET
+        lots_settled = t.lots_settled + EXCLUDED.lots_settled,
+        lots_sold = t.lots_sold + EXCLUDED.lots_sold,
+        lots_extended = t.lots_extended + EXCLUDED.lots_extended,
+        bids = t.bids + EXCLUDED.bids,
+        final_window_bids = t.final_window_bids + EXCLUDED.final_window_bids,
+        extensions = t.extensions + EXCLUDED.extensions,
+        sold_start_price = t.sold_start_price + EXCLUDED.sold_start_price,
+        sold_final_price = t.sold_final_price + EXCLUDED.sold_final_price,
+        updated_at = NOW();
+
+    IF v_sold = 1 THEN
+        INSERT INTO t_p68201414_vk_auction_app_1.revenue_by_payment_status AS r (tenant_id, payment_status, lots, amount)
+        VALUES (s.tenant_id, COALESCE(s.payment_status, 'pending'), p_sign, p_sign * s.final_price)
+        ON CONFLICT (tenant_id, payment_status) DO UPDATE SET
+            lots = r.lots + EXCLUDED.lots,
+            amount = r.amount + EXCLUDED.amount;
+    END IF;
+END;
+$$;
+
+-- Завершение лота фиксирует его итоги; выход из finished (перезапуск админом, удаление) их откатывает,
+-- смена статуса оплаты переносит выручку между корзинами.
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.lots_settle() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_old t_p68201414_vk_auction_app_1.lot_settlements;
+    v_new t_p68201414_vk_auction_app_1.lot_settlements;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status = 'finished' THEN
+        DELETE FROM t_p68201414_vk_auction_app_1.lot_settlements WHERE lot_id = OLD.id RETURNING * INTO v_old;
+        IF v_old.lot_id IS NOT NULL THEN
+            PERFORM t_p68201414_vk_auction_app_1.apply_lot_settlement(v_old, -1);
+        END IF;
+    END IF;
+
+    IF TG_OP = 'UPDATE' AND NEW.status = 'finished' THEN
+        IF v_old.lot_id IS NOT NULL THEN
+            -- Лот уже был завершён: пересчитывать ставки незачем, меняются только цена и статус оплаты
+            v_new := v_old;
+            v_new.final_price := NEW.current_price;
+            v_new.payment_status := NEW.payment_status;
+            v_new.extensions := NEW.extensions;
+        ELSE
+            SELECT NEW.id, NEW.tenant_id, COUNT(*),
+                   COUNT(*) FILTER (WHERE b.created_at >= NEW.ends_at - INTERVAL '10 minutes'),
+                   NEW.extensions, NEW.start_price, NEW.current_price, NEW.payment_status, NOW()
+              INTO v_new
+              FROM t_p68201414_vk_auction_app_1.bids b
+             WHERE b.lot_id = NEW.id;
+        END IF;
+        INSERT INTO t_p68201414_vk_auction_app_1.lot_settlements VALUES (v_new.*);
+        PERFORM t_p68201414_vk_auction_app_1.apply_lot_settlement(v_new, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_lots_settle ON t_p68201414_vk_auction_app_1.lots;
+CREATE TRIGGER trg_lots_settle
+    AFTER UPDATE ON t_p68201414_vk_auction_app_1.lots
+    FOR EACH ROW
+    WHEN (OLD.status = 'finished' OR NEW.status = 'finished')
+    EXECUTE FUNCTION t_p68201414_vk_auction_app_1.lots_settle();
+
+DROP TRIGGER IF EXISTS trg_lots_unsettle_deleted ON t_p68201414_vk_auction_app_1.lots;
+CREATE TRIGGER trg_lots_unsettle_deleted
+    AFTER DELETE ON t_p68201414_vk_auction_app_1.lots
+    FOR EACH ROW
+    WHEN (OLD.status = 'finished')
+    EXECUTE FUNCTION t_p68201414_vk_auction_app_1.lots_settle();
+
+-- ── Уже завершённые лоты ────────────────────────────────────────────────────
+-- Число продлений для истории неизвестно и считается нулём.
+
+INSERT INTO t_p68201414_vk_auction_app_1.lot_settlements
+SELECT l.id, l.tenant_id, COUNT(b.id),
+       COUNT(b.id) FILTER (WHERE b.created_at >= l.ends_at - INTERVAL '10 minutes'),
+       l.extensions, l.start_price, l.current_price, l.payment_status, NOW()
+  FROM t_p68201414_vk_auction_app_1.lots l
+  LEFT JOIN t_p68201414_vk_auction_app_1.bids b ON b.lot_id = l.id
+ WHERE l.status = 'finished'
+ GROUP BY l.id
+ON CONFLICT (lot_id) DO NOTHING;
+
+INSERT INTO t_p68201414_vk_auction_app_1.tenant_stats (
+    tenant_id, lots_settled, lots_sold, lots_extended, bids, final_window_bids, extensions,
+    sold_start_price, sold_final_price)
+SELECT tenant_id, COUNT(*), COUNT(*) FILTER (WHERE bids > 0), COUNT(*) FILTER (WHERE extensions > 0),
+       SUM(bids), SUM(final_window_bids), SUM(extensions),
+       COALESCE(SUM(start_price) FILTER (WHERE bids > 0), 0), COALESCE(SUM(final_price) FILTER (WHERE bids > 0), 0)
+  FROM t_p68201414_vk_auction_app_1.lot_settlements
+ GROUP BY tenant_id
+ON CONFLICT (tenant_id) DO NOTHING;
+
+INSERT INTO t_p68201414_vk_auction_app_1.revenue_by_payment_status (tenant_id, payment_status, lots, amount)
+SELECT tenant_id, COALESCE(payment_status, 'pending'), COUNT(*), SUM(final_price)
+  FROM t_p68201414_vk_auction_app_1.lot_settlements
+ WHERE bids > 0
+ GROUP BY tenant_id, COALESCE(payment_status, 'pending')
+ON CONFLICT (tenant_id, payment_status) DO NOTHING;
@@ -0,0 +1,150 @@
+-- Уведомления копятся в очереди и уходят одним сообщением на пользователя (дайджест):
+-- участник двадцати лотов в горячие минуты получает одно сообщение вместо двадцати.
+-- Повторные события по тому же лоту схлопываются в одну строку с последней ценой.
+CREATE TABLE IF NOT EXISTS t_p68201414_vk_auction_app_1.notification_queue (
+    user_id TEXT NOT NULL,
+    -- outbid — ставку перебили; ending — лот скоро завершится
+    kind TEXT NOT NULL,
+    lot_id INTEGER NOT NULL,
+    lot_title TEXT NOT NULL DEFAULT '',
+    price INTEGER,
+    ends_at TIMESTAMPTZ,
+    -- первое событие, ещё не ушедшее пользователю: от него отсчитывается окно накопления
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, kind, lot_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_notification_queue_created_at
+    ON t_p68201414_vk_auction_app_1.notification_queue (created_at);
+
+-- Ограничение частоты дайджестов: одна строка на пользователя, общая для всех инстансов функций
+CREATE TABLE IF NOT EXISTS t_p68201414_vk_auction_app_1.notification_digests (
+    user_id TEXT PRIMARY KEY,
+    next_allowed_at TIMESTAMPTZ NOT NULL,
+    sent INTEGER NOT NULL DEFAULT 0
+);
+
+-- track_outbid кладёт перебитых в очередь сам, поэтому ставки через процедуры и через движок
+-- попадают в дайджест одинаково. Возвращает тех же пользователей, что и раньше.
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.track_outbid(
+    p_lot_id INTEGER,
+    p_leader_id TEXT,
+    p_now TIMESTAMPTZ,
+    p_cooldown_minutes INTEGER
+) RETURNS TEXT[] LANGUAGE plpgsql AS $$
+DECLARE
+    v_notify TEXT[];
+BEGIN
+    IF NOT COALESCE((SELECT enabled FROM t_p68201414_vk_auction_app_1.notification_config WHERE key = 'outbid'), false) THEN
+        RETURN '{}';
+    END IF;
+
+    INSERT INTO t_p68201414_vk_auction_app_1.outbid_tracking (lot_id, user_id, last_outbid_at)
+    SELECT DISTINCT p_lot_id, b.user_id, p_now
+      FROM t_p68201414_vk_auction_app_1.bids b
+     WHERE b.lot_id = p_lot_id AND b.user_id <> p_leader_id
+    ON CONFLICT (lot_id, user_id) DO UPDATE SET last_outbid_at = EXCLUDED.last_outbid_at;
+
+    WITH due AS (
+        UPDATE t_p68201414_vk_auction_app_1.outbid_tracking ot
+           SET last_notified_at = p_now
+          FROM t_p68201414_vk_auction_app_1.notification_settings ns
+         WHERE ns.user_id = ot.user_id
+           AND ns.allowed = true
+           AND ot.lot_id = p_lot_id
+           AND ot.user_id <> p_leader_id
+           AND ot.last_outbid_at >= p_now - make_interval(mins => p_cooldown_minutes)
+           AND (ot.last_notified_at IS NULL
+                OR ot.last_notified_at < ot.last_outbid_at - make_interval(mins => p_cooldown_minutes))
+        RETURNING ot.user_id
+    )
+    SELECT array_agg(user_id) INTO v_notify FROM due;
+
+    IF v_notify IS NOT NULL THEN
+        INSERT INTO t_p68201414_vk_auction_app_1.notification_queue AS q (user_id, kind, lot_id, lot_title, price, created_at)
+        SELECT u, 'outbid', p_lot_id, l.title, l.current_price, p_now
+          FROM unnest(v_notify) AS u, t_p68201414_vk_auction_app_1.lots l
+         WHERE l.id = p_lot_id
+        ON CONFLICT (user_id, kind, lot_id) DO UPDATE SET price = EXCLUDED.price, lot_title = EXCLUDED.lot_title;
+    END IF;
+
+    RETURN COALESCE(v_notify, '{}');
+END;
+$$;
+
+-- Забирает из очереди события пользователей, у которых самое старое событие ждёт дольше p_window_seconds
+-- и не исчерпан лимит частоты, и сразу сдвигает их next_allowed_at на p_min_interval_seconds.
+-- Параллельные вызовы делят пользователей через SKIP LOCKED; забранное из очереди удаляется.
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.claim_notification_digests(
+    p_now TIMESTAMPTZ,
+    p_window_seconds INTEGER,
+    p_min_interval_seconds INTEGER,
+    p_limit INTEGER DEFAULT 100
+) RETURNS TABLE (
+    user_id TEXT,
+    kind TEXT,
+    lot_id INTEGER,
+    lot_title TEXT,
+    price INTEGER,
+    ends_at TIMESTAMPTZ
+) LANGUAGE plpgsql AS $$
+DECLARE
+    v_users TEXT[];
+BEGIN
+    SELECT array_agg(d.user_id) INTO v_users
+      FROM (
+          SELECT q.user_id
+            FROM t_p68201414_vk_auction_app_1.notification_queue q
+            LEFT JOIN t_p68201414_vk_auction_app_1.notification_digests nd ON nd.user_id = q.user_id
+           GROUP BY q.user_id, nd.next_allowed_at
+          HAVING MIN(q.created_at) <= p_now - make_interval(secs => p_window_seconds)
+             AND (nd.next_allowed_at IS NULL OR nd.next_allowed_at <= p_now)
+           LIMIT p_limit
+      ) d;
+
+    IF v_users IS NULL THEN
+        RETURN;
+    END IF;
+
+    -- Блокировка строки лимита закрепляет пользователя за этим вызовом.
+    -- Имя ограничения вместо (user_id): колонка совпадает с OUT-параметром функции.
+    INSERT INTO t_p68201414_vk_auction_app_1.notification_digests (user_id, next_allowed_at)
+    SELECT u, '-infinity' FROM unnest(v_users) AS u
+    ON CONFLICT ON CONSTRAINT notification_digests_pkey DO NOTHING;
+
+    SELECT array_agg(nd.user_id) INTO v_users
+      FROM (
+          SELECT nd.user_id FROM t_p68201414_vk_auction_app_1.notification_digests nd
+           WHERE nd.user_id = ANY(v_users) AND nd.next_allowed_at <= p_now
+             FOR UPDATE SKIP LOCKED
+      ) nd;
+
+    IF v_users IS NULL THEN
+        RETURN;
+    END IF;
+
+    UPDATE t_p68201414_vk_auction_app_1.notification_digests nd
+       SET next_allowed_at = p_now + make_interval(secs => p_min_interval_seconds),
+           sent = nd.sent + 1
+     WHERE nd.user_id = ANY(v_users);
+
+    RETURN QUERY
+    DELETE FROM t_p68201414_vk_auction_app_1.notification_queue q
+     WHERE q.user_id = ANY(v_users)
+    RETURNING q.user_id, q.kind, q.lot_id, q.lot_title, q.price, q.ends_at;
+END;
+$$;
+
+-- Ближайший момент, когда claim_notification_digests найдёт работу (NULL — очередь пуста)
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.next_notification_digest_at(
+    p_window_seconds INTEGER
+) RETURNS TIMESTAMPTZ LANGUAGE sql STABLE AS $$
+    SELECT MIN(GREATEST(p.first_at + make_interval(secs => p_window_seconds),
+                        COALESCE(nd.next_allowed_at, '-infinity')))
+      FROM (
+          SELECT q.user_id, MIN(q.created_at) AS first_at
+            FROM t_p68201414_vk_auction_app_1.notification_queue q
+           GROUP BY q.user_id
+      ) p
+      LEFT JOIN t_p68201414_vk_auction_app_1.notification_digests nd ON nd.user_id = p.user_id;
+$$;
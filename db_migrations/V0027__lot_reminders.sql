@@ -0,0 +1,21 @@
+-- Напоминания «скоро конец» по нескольким окнам (REMINDER_WINDOWS_MINUTES в auction-lots) вместо флага notified_15min.
+-- Строка на лот и окно хранит, для какого ends_at и когда напоминание ушло. Если антиснайпинг отодвинул конец
+-- так, что окно началось заново (sent_at < ends_at - окно), напоминание снова становится должным.
+CREATE TABLE IF NOT EXISTS t_p68201414_vk_auction_app_1.lot_reminders (
+    lot_id INTEGER NOT NULL,
+    window_minutes INTEGER NOT NULL,
+    ends_at TIMESTAMPTZ NOT NULL,
+    sent_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (lot_id, window_minutes)
+);
+
+-- Уже отправленные 15-минутные напоминания не повторяются; более широкое окно к этому моменту тоже прошло
+INSERT INTO t_p68201414_vk_auction_app_1.lot_reminders (lot_id, window_minutes, ends_at, sent_at)
+SELECT l.id, w.minutes, l.ends_at, NOW()
+  FROM t_p68201414_vk_auction_app_1.lots l
+ CROSS JOIN (VALUES (15), (60)) AS w (minutes)
+ WHERE l.status = 'active' AND l.notified_15min = true
+ON CONFLICT (lot_id, window_minutes) DO NOTHING;
+
+DROP INDEX IF EXISTS t_p68201414_vk_auction_app_1.idx_lots_active_not_notified_ends_at;
+ALTER TABLE t_p68201414_vk_auction_app_1.lots DROP COLUMN IF EXISTS notified_15min;
@@ -0,0 +1,100 @@
+-- Дайджест удаляется из очереди только после успешной отправки (ack_notification_digest), а не при разборе:
+-- раньше пользователи, до которых не дошла очередь в бюджете вызова или чей VK-запрос упал, теряли уведомления.
+-- claim_notification_digests теперь лишь закрепляет пользователей за вызовом, сдвигая next_allowed_at:
+-- упавшая отправка повторится после p_min_interval_seconds, недошедших release_notification_digests отпускает сразу.
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.claim_notification_digests(
+    p_now TIMESTAMPTZ,
+    p_window_seconds INTEGER,
+    p_min_interval_seconds INTEGER,
+    p_limit INTEGER DEFAULT 100
+) RETURNS TABLE (
+    user_id TEXT,
+    kind TEXT,
+    lot_id INTEGER,
+    lot_title TEXT,
+    price INTEGER,
+    ends_at TIMESTAMPTZ
+) LANGUAGE plpgsql AS $$
+DECLARE
+    v_users TEXT[];
+BEGIN
+    SELECT array_agg(d.user_id) INTO v_users
+      FROM (
+          SELECT q.user_id
+            FROM t_p68201414_vk_auction_app_1.notification_queue q
+            LEFT JOIN t_p68201414_vk_auction_app_1.notification_digests nd ON nd.user_id = q.user_id
+           GROUP BY q.user_id, nd.next_allowed_at
+          HAVING MIN(q.created_at) <= p_now - make_interval(secs => p_window_seconds)
+             AND (nd.next_allowed_at IS NULL OR nd.next_allowed_at <= p_now)
+           LIMIT p_limit
+      ) d;
+
+    IF v_users IS NULL THEN
+        RETURN;
+    END IF;
+
+    -- Блокировка строки лимита закрепляет пользователя за этим вызовом.
+    -- Имя ограничения вместо (user_id): колонка совпадает с OUT-параметром функции.
+    INSERT INTO t_p68201414_vk_auction_app_1.notification_digests (user_id, next_allowed_at)
+    SELECT u, '-infinity' FROM unnest(v_users) AS u
+    ON CONFLICT ON CONSTRAINT notification_digests_pkey DO NOTHING;
+
+    SELECT array_agg(nd.user_id) INTO v_users
+      FROM (
+          SELECT nd.user_id FROM t_p68201414_vk_auction_app_1.notification_digests nd
+           WHERE nd.user_id = ANY(v_users) AND nd.next_allowed_at <= p_now
+             FOR UPDATE SKIP LOCKED
+      ) nd;
+
+    IF v_users IS NULL THEN
+        RETURN;
+    END IF;
+
+    UPDATE t_p68201414_vk_auction_app_1.notification_digests nd
+       SET next_allowed_at = p_now + make_interval(secs => p_min_interval_seconds)
+     WHERE nd.user_id = ANY(v_users);
+
+    RETURN QUERY
+    SELECT q.user_id, q.kind, q.lot_id, q.lot_title, q.price, q.ends_at
+      FROM t_p68201414_vk_auction_app_1.notification_queue q
+     WHERE q.user_id = ANY(v_users);
+END;
+$$;
+
+-- Отправленные события пользователя уходят из очереди. Строка, которую за время отправки обновило
+-- новое событие (другая цена или ends_at), остаётся и попадёт в следующий дайджест.
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.ack_notification_digest(
+    p_user_id TEXT,
+    p_kinds TEXT[],
+    p_lot_ids INTEGER[],
+    p_prices INTEGER[],
+    p_ends_at TIMESTAMPTZ[]
+) RETURNS INTEGER LANGUAGE plpgsql AS $$
+DECLARE
+    v_deleted INTEGER;
+BEGIN
+    DELETE FROM t_p68201414_vk_auction_app_1.notification_queue q
+     USING unnest(p_kinds, p_lot_ids, p_prices, p_ends_at) AS s (kind, lot_id, price, ends_at)
+     WHERE q.user_id = p_user_id
+       AND q.kind = s.kind
+       AND q.lot_id = s.lot_id
+       AND q.price IS NOT DISTINCT FROM s.price
+       AND q.ends_at IS NOT DISTINCT FROM s.ends_at;
+    GET DIAGNOSTICS v_deleted = ROW_COUNT;
+
+    UPDATE t_p68201414_vk_auction_app_1.notification_digests
+       SET sent = sent + 1
+     WHERE user_id = p_user_id;
+    RETURN v_deleted;
+END;
+$$;
+
+-- Пользователи, до которых вызов не успел дойти: снова доступны следующему таймеру без ожидания
+CREATE OR REPLACE FUNCTION t_p68201414_vk_auction_app_1.release_notification_digests(
+    p_user_ids TEXT[],
+    p_now TIMESTAMPTZ
+) RETURNS VOID LANGUAGE sql AS $$
+    UPDATE t_p68201414_vk_auction_app_1.notification_digests
+       SET next_allowed_at = p_now
+     WHERE user_id = ANY(p_user_ids);
+$$;
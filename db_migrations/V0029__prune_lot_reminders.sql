@@ -0,0 +1,10 @@
+-- Отметки напоминаний нужны только активным лотам: sweep в auction-lots теперь снимает их у завершённых,
+-- а удаление лота из админки — вместе с очередью уведомлений. Здесь убираются строки, накопленные до этого.
+DELETE FROM t_p68201414_vk_auction_app_1.lot_reminders r
+ WHERE NOT EXISTS (
+    SELECT 1 FROM t_p68201414_vk_auction_app_1.lots l
+     WHERE l.id = r.lot_id AND l.status NOT IN ('finished', 'cancelled')
+ );
+
+DELETE FROM t_p68201414_vk_auction_app_1.notification_queue q
+ WHERE NOT EXISTS (SELECT 1 FROM t_p68201414_vk_auction_app_1.lots l WHERE l.id = q.lot_id);
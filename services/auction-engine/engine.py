@@ -0,0 +1,598 @@
+"""
+Движок торгов для горячих лотов: состояние лота (цена, лидер, лестница автоставок, ends_at с антиснайпингом)
+живёт в памяти, ставки применяются последовательно, а события пишутся в журнал engine_events
+групповыми коммитами — одна транзакция на пачку ставок по всем лотам движка.
+POST /bid      {lotId, amount, userId, userName, userAvatar, idempotencyKey} — как процедура place_bid
+POST /auto_bid {lotId, maxAmount, userId, userName, userAvatar, idempotencyKey} — как set_auto_bid
+POST /claim    {lotId} — забрать лот: снимок состояния в журнал, строка в engine_lots
+POST /release  {lotId} — дописать журнал и вернуть лот обычному пути через БД
+GET  /health   — лоты в памяти и счётчики групповых коммитов
+Ответ: {replayed, result} в формате строки процедуры (см. V0014, V0016) или {error} с кодом 400.
+Ключи идемпотентности пишутся в idempotency_keys той же транзакцией, что и события команды, и
+подгружаются при старте и при claim — повтор после рестарта или смены пути (БД ↔ движок) не применится дважды.
+Вместе с журналом в той же транзакции пишутся bids, auto_bids и lots — остальные функции видят
+горячий лот как обычный. После рестарта состояние восстанавливается повтором журнала от последнего снимка.
+Запуск: DATABASE_URL=... ENGINE_URL=http://<адрес движка> python engine.py [порт]
+"""
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SCHEMA = "t_p68201414_vk_auction_app_1"
+OUTBID_COOLDOWN_MINUTES = 5
+AUTO_BID_MAX_ROUNDS = 20
+
+# Пачка коммитится, как только набралось столько событий или прошло столько времени с первого в ней
+GROUP_COMMIT_MAX_EVENTS = 500
+GROUP_COMMIT_WINDOW_SECONDS = 0.005
+REQUEST_TIMEOUT_SECONDS = 5
+IDEMPOTENCY_MAX_KEYS = 10000
+# Как IDEMPOTENCY_TTL_SECONDS в auction-bid
+IDEMPOTENCY_TTL_SECONDS = 600
+
+
+def get_conn():
+    import psycopg2
+    return psycopg2.connect(os.environ["DATABASE_URL"])
+
+
+class BidRejected(Exception):
+    """Ставка не прошла валидацию — текст для пользователя, как RAISE EXCEPTION в процедурах."""
+
+
+class LotState:
+    """Состояние одного лота. Меняется только через apply(), поэтому повтор журнала даёт то же состояние."""
+
+    def __init__(self, lot_id: int):
+        self.lot_id = lot_id
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.auto = {}  # user_id -> [max_amount, порядок постановки]
+        self.auto_order = 0
+        self.released = False
+
+    def apply(self, seq: int, kind: str, p: dict):
+        self.seq = seq
+        if kind == "snapshot":
+            self.price = p["price"]
+            self.step = p["step"]
+            self.ends_at = datetime.fromisoformat(p["endsAt"])
+            self.status = p["status"]
+            self.anti_snipe = p["antiSnipe"]
+            self.anti_snipe_minutes = p["antiSnipeMinutes"]
+            self.title = p["title"]
+            self.leader = p["leaderId"]
+            self.auto = {}
+            self.auto_order = 0
+            for user_id, max_amount in p["autoBids"]:
+                self.auto_order += 1
+                self.auto[user_id] = [max_amount, self.auto_order]
+        elif kind == "bid":
+            self.price = p["amount"]
+            self.ends_at = datetime.fromisoformat(p["endsAt"])
+            self.leader = p["userId"]
+            # Автоставки, которые уже не могут перебить цену, больше не нужны
+            for user_id in [u for u, (m, _) in self.auto.items() if m < self.price]:
+                del self.auto[user_id]
+        elif kind == "auto_bid":
+            if p["userId"] in self.auto:
+                self.auto[p["userId"]][0] = p["maxAmount"]
+            else:
+                self.auto_order += 1
+                self.auto[p["userId"]] = [p["maxAmount"], self.auto_order]
+
+    def emit(self, events: list, kind: str, payload: dict):
+        events.append((self.seq + 1, kind, payload))
+        self.apply(self.seq + 1, kind, payload)
+
+    def bid_payload(self, user_id: str, amount: int, now: datetime, auto: bool) -> dict:
+        ends_at = self.ends_at
+        if self.anti_snipe and ends_at - now < timedelta(minutes=self.anti_snipe_minutes):
+            ends_at = ends_at + timedelta(minutes=self.anti_snipe_minutes)
+        return {"userId": user_id, "amount": amount, "endsAt": ends_at.isoformat(), "at": now.isoformat(), "auto": auto}
+
+    def resolve_auto_bids(self, events: list, now: datetime) -> int:
+        """Тот же цикл, что resolve_auto_bids в БД: сильнейшая автоставка не-лидера перебивает на шаг."""
+        rounds = 0
+        while self.status == "active" and self.ends_at > now and rounds < AUTO_BID_MAX_ROUNDS:
+            candidates = [
+                (-m, order, user_id) for user_id, (m, order) in self.auto.items()
+                if user_id != self.leader and m >= self.price + self.step
+            ]
+            if not candidates:
+                break
+            user_id = min(candidates)[2]
+            self.emit(events, "bid", self.bid_payload(user_id, self.price + self.step, now, auto=True))
+            rounds += 1
+        return rounds
+
+    def place_bid(self, user_id: str, amount: int, now: datetime) -> list:
+        if self.status != "active" or self.ends_at <= now:
+            raise BidRejected("Аукцион уже завершён")
+        if amount < self.price + self.step:
+            raise BidRejected(f"Ставка слишком маленькая. Минимум: {self.price + self.step} ₽")
+        events = []
+        self.emit(events, "bid", self.bid_payload(user_id, amount, now, auto=False))
+        self.resolve_auto_bids(events, now)
+        return events
+
+    def set_auto_bid(self, user_id: str, max_amount: int, now: datetime) -> list:
+        if self.status != "active":
+            raise BidRejected("Аукцион не активен")
+        events = []
+        self.emit(events, "auto_bid", {"userId": user_id, "maxAmount": max_amount})
+        self.resolve_auto_bids(events, now)
+        return events
+
+
+class PendingWrite:
+    """События одной команды в очереди группового коммита; запросивший ждёт done."""
+
+    def __init__(self, state: LotState, kind: str, events: list, user: tuple = None, result: dict = None, key: str = None):
+        self.state = state
+        self.kind = kind  # bid | auto_bid | release
+        self.events = events
+        self.user = user  # (user_id, name, avatar) автора команды
+        self.result = result or {}
+        self.key = key  # ключ идемпотентности
+        self.error = None
+        self.done = threading.Event()
+
+
+class Engine:
+    def __init__(self, engine_url: str):
+        self.engine_url = engine_url
+        self.lots = {}
+        self.lots_lock = threading.Lock()
+        self.writes = queue.Queue()
+        self.results = OrderedDict()  # ключ идемпотентности -> PendingWrite (в очереди или завершённая)
+        self.results_lock = threading.Lock()
+        self.stats = {"batches": 0, "events": 0, "commands": 0, "failed_batches": 0, "commit_seconds": 0.0}
+
+    # ── Загрузка и восстановление ────────────────────────────────────────────
+
+    def recover(self, cur, lot_id: int, state: LotState = None):
+        """
+        Состояние из журнала: последний снимок и всё после него. None — лот не принадлежит движку.
+        state — перечитать в существующий объект (его блокировку уже ждут команды).
+        """
+        cur.execute(f"""
+            SELECT seq, kind, payload FROM {SCHEMA}.engine_events
+            WHERE lot_id = %s
+              AND seq >= (SELECT MAX(seq) FROM {SCHEMA}.engine_events WHERE lot_id = %s AND kind = 'snapshot')
+            ORDER BY seq
+        """, (lot_id, lot_id))
+        rows = cur.fetchall()
+        if not rows:
+            return None
+        state = state or LotState(lot_id)
+        for seq, kind, payload in rows:
+            state.apply(seq, kind, payload)
+        return state
+
+    def get_lot(self, lot_id: int):
+        with self.lots_lock:
+            state = self.lots.get(lot_id)
+        if state is not None:
+            return state
+        conn = get_conn()
+        try:
+            cur = conn.cursor()
+            cur.execute(f"SELECT engine_url FROM {SCHEMA}.engine_lots WHERE lot_id = %s", (lot_id,))
+            row = cur.fetchone()
+            if not row or row[0] != self.engine_url:
+                return None
+            state = self.recover(cur, lot_id)
+        finally:
+            conn.close()
+        if state is None:
+            return None
+        with self.lots_lock:
+            return self.lots.setdefault(lot_id, state)
+
+    def load_keys(self, cur):
+        """Недавние ключи идемпотентности из БД — записанные процедурами, этим или прежним экземпляром движка."""
+        cur.execute(f"""
+            SELECT key, result FROM {SCHEMA}.idempotency_keys
+            WHERE result IS NOT NULL AND created_at > NOW() - make_interval(secs => %s)
+            ORDER BY created_at DESC LIMIT %s
+        """, (IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_MAX_KEYS))
+        rows = cur.fetchall()
+        with self.results_lock:
+            for key, result in reversed(rows):
+                if key not in self.results:
+                    write = PendingWrite(None, "stored", [], result=result, key=key)
+                    write.done.set()
+                    self.results[key] = write
+            while len(self.results) > IDEMPOTENCY_MAX_KEYS:
+                self.results.popitem(last=False)
+
+    def load_owned(self):
+        conn = get_conn()
+        try:
+            cur = conn.cursor()
+            self.load_keys(cur)
+            cur.execute(f"SELECT lot_id FROM {SCHEMA}.engine_lots WHERE engine_url = %s", (self.engine_url,))
+            for (lot_id,) in cur.fetchall():
+                state = self.recover(cur, lot_id)
+                if state is not None:
+                    self.lots[lot_id] = state
+        finally:
+            conn.close()
+        print(f"[engine] recovered {len(self.lots)} lots")
+
+    def claim(self, lot_id: int) -> dict:
+        """Снимок лота под блокировкой строки: после коммита процедуры БД отклоняют ставки в него (P0004)."""
+        conn = get_conn()
+        try:
+            cur = conn.cursor()
+            cur.execute(f"""
+                SELECT current_price, step, ends_at, status, anti_snipe, anti_snipe_minutes, title
+                FROM {SCHEMA}.lots WHERE id = %s FOR UPDATE
+            """, (lot_id,))
+            lot = cur.fetchone()
+            if not lot:
+                raise BidRejected("Лот не найден")
+            if lot[3] != "active":
+                raise BidRejected("Аукцион не активен")
+            cur.execute(f"""
+                SELECT user_id FROM {SCHEMA}.bids WHERE lot_id = %s
+                ORDER BY amount DESC, created_at ASC LIMIT 1
+            """, (lot_id,))
+            leader = cur.fetchone()
+            cur.execute(f"""
+                SELECT user_id, max_amount FROM {SCHEMA}.auto_bids WHERE lot_id = %s ORDER BY created_at, id
+            """, (lot_id,))
+            snapshot = {
+                "price": lot[0], "step": lot[1], "endsAt": lot[2].isoformat(), "status": lot[3],
+                "antiSnipe": lot[4], "antiSnipeMinutes": lot[5], "title": lot[6],
+                "leaderId": leader[0] if leader else None,
+                "autoBids": [list(r) for r in cur.fetchall()],
+            }
+            cur.execute(f"""
+                INSERT INTO {SCHEMA}.engine_lots (lot_id, engine_url) VALUES (%s, %s)
+                ON CONFLICT (lot_id) DO UPDATE SET engine_url = EXCLUDED.engine_url, claimed_at = NOW()
+            """, (lot_id, self.engine_url))
+            cur.execute(f"""
+                INSERT INTO {SCHEMA}.engine_events (lot_id, seq, kind, payload)
+                SELECT %s, COALESCE(MAX(seq), 0) + 1, 'snapshot', %s FROM {SCHEMA}.engine_events WHERE lot_id = %s
+                RETURNING seq
+            """, (lot_id, json.dumps(snapshot), lot_id))
+            seq = cur.fetchone()[0]
+            conn.commit()
+            # Ставки в лот до claim шли процедурами — их повторы должны получить сохранённый ответ
+            self.load_keys(cur)
+        finally:
+            conn.close()
+
+        state = LotState(lot_id)
+        state.apply(seq, "snapshot", snapshot)
+        with self.lots_lock:
+            self.lots[lot_id] = state
+        print(f"[engine] claimed lot={lot_id} seq={seq}")
+        return {"lotId": lot_id, "seq": seq}
+
+    # ── Команды ──────────────────────────────────────────────────────────────
+
+    def reserve(self, key: str, kind: str) -> tuple:
+        """
+        (write, own) по ключу идемпотентности. own — команду выполняет этот запрос: ключ занят заранее,
+        и параллельный дубль ждёт ту же запись, а не применяет ставку второй раз. Упавшая команда ключ освобождает.
+        """
+        with self.results_lock:
+            write = self.results.get(key)
+            if write is not None and not (write.done.is_set() and write.error is not None):
+                self.results.move_to_end(key)
+                return write, False
+            write = self.results[key] = PendingWrite(None, kind, [], key=key)
+            while len(self.results) > IDEMPOTENCY_MAX_KEYS:
+                self.results.popitem(last=False)
+            return write, True
+
+    def wait(self, write: PendingWrite) -> dict:
+        # После таймаута ключ остаётся занят записью в очереди: повтор дождётся её итога, а не продублирует ставку
+        if not write.done.wait(REQUEST_TIMEOUT_SECONDS):
+            raise RuntimeError("group commit timeout")
+        if write.error is not None:
+            raise write.error
+        return write.result
+
+    def command(self, kind: str, body: dict) -> tuple:
+        key = body.get("idempotencyKey")
+        if key:
+            write, own = self.reserve(key, kind)
+            if not own:
+                return True, self.wait(write)
+        else:
+            write = PendingWrite(None, kind, [])
+        try:
+            self.enqueue(write, kind, body)
+        except Exception as e:
+            write.error = e
+            write.done.set()
+            raise
+        result = self.wait(write)
+        self.stats["commands"] += 1
+        return False, result
+
+    def enqueue(self, write: PendingWrite, kind: str, body: dict):
+        """Применяет команду к состоянию лота и ставит её события в очередь группового коммита."""
+        lot_id = int(body["lotId"])
+        state = self.get_lot(lot_id)
+        if state is None:
+            raise BidRejected("Лот не обслуживается движком")
+        user = (body["userId"], body.get("userName") or "Участник", body.get("userAvatar") or "")
+        now = datetime.now(timezone.utc)
+
+        with state.lock:
+            if state.released:
+                raise BidRejected("Лот не обслуживается движком")
+            if kind == "bid":
+                prev_ends_at = state.ends_at.isoformat()
+                events = state.place_bid(user[0], int(body["amount"]), now)
+                result = {
+                    "new_price": events[0][2]["amount"],
+                    "new_ends_at": events[0][2]["endsAt"],
+                    "extended": events[0][2]["endsAt"] != prev_ends_at,
+                }
+            else:
+                events = state.set_auto_bid(user[0], int(body["maxAmount"]), now)
+                result = {"rounds": sum(1 for e in events if e[1] == "bid")}
+            result.update({
+                "leader_id": state.leader,
+                "final_price": state.price,
+                "final_ends_at": state.ends_at.isoformat(),
+                "lot_title": state.title,
+            })
+            if kind == "bid":
+                result["min_next_bid"] = state.price + state.step
+            write.state, write.events, write.user, write.result = state, events, user, result
+            # Очередь пополняется под блокировкой лота — события лота коммитятся в порядке seq
+            self.writes.put(write)
+
+    def release(self, lot_id: int) -> dict:
+        state = self.get_lot(lot_id)
+        if state is None:
+            raise BidRejected("Лот не обслуживается движком")
+        with state.lock:
+            state.released = True
+            write = PendingWrite(state, "release", [])
+            self.writes.put(write)
+        # Лот уходит из памяти только после коммита release (см. writer_loop); при таймауте он так и
+        # остаётся за движком, пока release не закоммитится или не откатится
+        if not write.done.wait(REQUEST_TIMEOUT_SECONDS):
+            raise RuntimeError("release commit timeout")
+        if write.error is not None:
+            raise write.error
+        print(f"[engine] released lot={lot_id} seq={state.seq}")
+        return {"lotId": lot_id, "seq": state.seq}
+
+    # ── Групповой коммит ─────────────────────────────────────────────────────
+
+    def writer_loop(self):
+        conn = get_conn()
+        while True:
+            batch = [self.writes.get()]
+            n_events = len(batch[0].events)
+            deadline = time.monotonic() + GROUP_COMMIT_WINDOW_SECONDS
+            while n_events < GROUP_COMMIT_MAX_EVENTS:
+                try:
+                    write = self.writes.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                batch.append(write)
+                n_events += len(write.events)
+
+            started = time.monotonic()
+            try:
+                if conn.closed:
+                    conn = get_conn()
+                self.commit_batch(conn.cursor(), batch)
+                conn.commit()
+            except Exception as e:
+                print(f"[engine] group commit failed ({len(batch)} commands): {e!r}")
+                try:
+                    conn.rollback()
+                except Exception:
+                    conn.close()
+                self.stats["failed_batches"] += 1
+                self.fail_batch(batch, e)
+                continue
+            self.stats["batches"] += 1
+            self.stats["events"] += n_events
+            self.stats["commit_seconds"] += time.monotonic() - started
+            for write in batch:
+                if write.kind == "release":
+                    with self.lots_lock:
+                        if self.lots.get(write.state.lot_id) is write.state:
+                            del self.lots[write.state.lot_id]
+                write.done.set()
+
+    def commit_batch(self, cur, batch: list):
+        import psycopg2.extras
+
+        for user_id, name, avatar in {w.user for w in batch if w.user}:
+            cur.execute(f"SELECT {SCHEMA}.upsert_user(%s, %s, %s)", (user_id, name, avatar))
+
+        psycopg2.extras.execute_values(
+            cur,
+            f"INSERT INTO {SCHEMA}.engine_events (lot_id, seq, kind, payload) VALUES %s",
+            [(w.state.lot_id, seq, kind, json.dumps(p)) for w in batch for seq, kind, p in w.events],
+            page_size=1000,
+        )
+
+        bid_rows = [
+            (w.state.lot_id, p["userId"], p["userId"], p["amount"], p["at"])
+            for w in batch for _, kind, p in w.events if kind == "bid"
+        ]
+        bid_ids = psycopg2.extras.execute_values(
+            cur,
+            f"""INSERT INTO {SCHEMA}.bids (lot_id, user_id, user_key, amount, created_at) VALUES %s RETURNING id""",
+            bid_rows,
+            template=f"(%s, %s, (SELECT id FROM {SCHEMA}.users WHERE vk_user_id = %s), %s, %s)",
+            page_size=1000,
+            fetch=True,
+        ) if bid_rows else []
+        bid_ids = iter(r[0] for r in bid_ids)
+        for w in batch:
+            for i, (_, kind, _) in enumerate(w.events):
+                if kind == "bid":
+                    bid_id = next(bid_ids)
+                    if i == 0 and w.kind == "bid":
+                        w.result["bid_id"] = bid_id
+
+        for w in batch:
+            for _, kind, p in w.events:
+                if kind == "auto_bid":
+                    cur.execute(f"""
+                        INSERT INTO {SCHEMA}.auto_bids (lot_id, user_id, user_key, max_amount)
+                        VALUES (%s, %s, (SELECT id FROM {SCHEMA}.users WHERE vk_user_id = %s), %s)
+                        ON CONFLICT (lot_id, user_id) DO UPDATE SET max_amount = EXCLUDED.max_amount
+                    """, (w.state.lot_id, p["userId"], p["userId"], p["maxAmount"]))
+
+        # Итог по каждому лоту пачки — по последней его команде
+        last = OrderedDict()
+        for w in batch:
+            if w.kind == "release":
+                cur.execute(f"DELETE FROM {SCHEMA}.engine_lots WHERE lot_id = %s", (w.state.lot_id,))
+            else:
+                last[w.state.lot_id] = w
+        for lot_id, w in last.items():
+            cur.execute(f"""
+                UPDATE {SCHEMA}.lots
+                SET current_price = %s, ends_at = %s, version = nextval('{SCHEMA}.lot_version_seq')
+                WHERE id = %s
+                RETURNING version
+            """, (w.result["final_price"], w.result["final_ends_at"], lot_id))
+            version = cur.fetchone()[0]
+            cur.execute(f"DELETE FROM {SCHEMA}.auto_bids WHERE lot_id = %s AND max_amount < %s",
+                        (lot_id, w.result["final_price"]))
+            notify = []
+            if any(kind == "bid" for x in batch if x.state.lot_id == lot_id for _, kind, _ in x.events):
+                cur.execute(f"SELECT {SCHEMA}.track_outbid(%s, %s, NOW(), %s)",
+                            (lot_id, w.result["leader_id"], OUTBID_COOLDOWN_MINUTES))
+                notify = cur.fetchone()[0] or []
+            for x in batch:
+                if x.state.lot_id == lot_id and x.kind != "release":
+                    x.result["lot_version"] = version
+                    x.result.setdefault("notify_user_ids", [])
+            w.result["notify_user_ids"] = notify
+
+        # Ключи — с итоговым ответом и в той же транзакции, что и события: после коммита повтор найдёт их и в БД
+        keyed = [(w.key, json.dumps(w.result)) for w in batch if w.key]
+        if keyed:
+            psycopg2.extras.execute_values(
+                cur,
+                f"INSERT INTO {SCHEMA}.idempotency_keys (key, result) VALUES %s ON CONFLICT (key) DO NOTHING",
+                keyed,
+                page_size=1000,
+            )
+
+    def fail_batch(self, batch: list, error: Exception):
+        """
+        Память ушла вперёд журнала: состояние затронутых лотов перечитывается из журнала,
+        а их команды, успевшие встать в очередь за упавшей пачкой, тоже отклоняются.
+        """
+        failed_lots = {w.state.lot_id: w.state for w in batch}
+        for state in failed_lots.values():
+            state.lock.acquire()
+        try:
+            pending = []
+            while True:
+                try:
+                    pending.append(self.writes.get_nowait())
+                except queue.Empty:
+                    break
+            for write in pending:
+                if write.state.lot_id in failed_lots:
+                    batch.append(write)
+                else:
+                    self.writes.put(write)
+
+            conn = get_conn()
+            try:
+                cur = conn.cursor()
+                for lot_id, state in failed_lots.items():
+                    # Упавший release тоже откатился — лот по-прежнему за движком
+                    state.released = False
+                    if self.recover(cur, lot_id, state) is None:
+                        with self.lots_lock:
+                            self.lots.pop(lot_id, None)
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[engine] recovery failed, dropping lots from memory: {e!r}")
+            with self.lots_lock:
+                for lot_id in failed_lots:
+                    self.lots.pop(lot_id, None)
+        finally:
+            for state in failed_lots.values():
+                state.lock.release()
+
+        for write in batch:
+            write.error = RuntimeError(f"group commit failed: {error!r}")
+            write.done.set()
+
+
+engine = None
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def reply(self, status: int, data: dict):
+        body = json.dumps(data, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self.reply(404, {"error": "not found"})
+        with engine.lots_lock:
+            lots = {lot_id: state.seq for lot_id, state in engine.lots.items()}
+        self.reply(200, {"lots": lots, "queue": engine.writes.qsize(), **engine.stats})
+
+    def do_POST(self):
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if self.path in ("/bid", "/auto_bid"):
+                replayed, result = engine.command(self.path[1:], body)
+                return self.reply(200, {"replayed": replayed, "result": result})
+            if self.path == "/claim":
+                return self.reply(200, engine.claim(int(body["lotId"])))
+            if self.path == "/release":
+                return self.reply(200, engine.release(int(body["lotId"])))
+            return self.reply(404, {"error": "not found"})
+        except BidRejected as e:
+            return self.reply(400, {"error": str(e)})
+        except (KeyError, TypeError, ValueError) as e:
+            return self.reply(400, {"error": f"invalid request: {e}"})
+        except Exception as e:
+            print(f"[engine] {self.path} failed: {e!r}")
+            return self.reply(503, {"error": "engine unavailable"})
+
+
+def main():
+    global engine
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    engine = Engine(os.environ["ENGINE_URL"])
+    engine.load_owned()
+    threading.Thread(target=engine.writer_loop, daemon=True).start()
+    print(f"[engine] listening on :{port} as {engine.engine_url}")
+    ThreadingHTTPServer(("0.0.0.0", port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
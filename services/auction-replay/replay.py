@@ -0,0 +1,391 @@
+"""
+Повтор реальной истории торгов для проверки изменений в процедурах ставок, цикле автоставок и антиснайпинге.
+export — выгружает завершённые лоты, их ставки и журнал движка (engine_events) в компактный файл:
+  DATABASE_URL=... python replay.py export history.jsonl.gz [--since 2026-01-01] [--lots 12,15]
+run — проигрывает файл через handler функции auction-bid на локальной БД с применёнными миграциями:
+  REPLAY_DATABASE_URL=... python replay.py run history.jsonl.gz [--speed 0|1|60] [--workers 4] [--no-rate-limit]
+Часы handler'а подменяются фальшивыми: каждая команда выполняется «в момент» исходной ставки,
+поэтому ends_at и антиснайпинг решаются так же, как в истории. --speed 1 — реальный темп, 60 — в 60 раз
+быстрее, 0 (по умолчанию) — без пауз. В конце сверяются итоговые цена, лидер и ends_at каждого лота
+и печатаются пропускная способность и задержки handler'а; код выхода 1, если хоть один лот разошёлся.
+
+Что повторяется:
+- лоты движка (есть журнал engine_events) — исходные команды: ручные ставки и постановка автоставок,
+  ответные автоставки должен породить цикл resolve_auto_bids;
+- остальные лоты — все ставки как ручные: какая из них была ответом автоставки, в bids не записано,
+  а проигравшие автоставки удалены. Такие лоты проверяют place_bid и антиснайпинг, но не цикл автоставок.
+Начальный ends_at не хранится: он подбирается так, чтобы правило антиснайпинга на моментах ставок
+привело к итоговому ends_at. Лоты, у которых это невозможно (конец правили из админки), не выгружаются.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta
+
+SCHEMA = "t_p68201414_vk_auction_app_1"
+FORMAT_VERSION = 1
+HANDLER_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "backend", "auction-bid", "index.py")
+
+
+def get_conn(url: str):
+    import psycopg2
+    return psycopg2.connect(url)
+
+
+# ── Выгрузка ────────────────────────────────────────────────────────────────
+
+def initial_ends_at(final_ends_at: datetime, anti_snipe: bool, minutes: int, bid_times: list):
+    """
+    Исходный конец лота: final_ends_at минус k продлений, где k — наименьшее число, при котором правило
+    place_bid (продлить на minutes, если до конца меньше minutes) на моментах bid_times даёт final_ends_at.
+    None — подходящего k нет.
+    """
+    if not anti_snipe:
+        return final_ends_at
+    step = timedelta(minutes=minutes)
+    for k in range(len(bid_times) + 1):
+        start = final_ends_at - k * step
+        ends_at = start
+        for t in bid_times:
+            if ends_at <= t:
+                break
+            if ends_at - t < step:
+                ends_at += step
+        else:
+            if ends_at == final_ends_at:
+                return start
+    return None
+
+
+def journal_commands(journal: list) -> tuple:
+    """
+    Команды лота из журнала движка: [(at, op, user_id, value)] и множество (user_id, amount) ставок,
+    которые журнал покрывает. Время постановки автоставки в журнале не пишется: берётся момент её
+    первой ответной ставки, иначе — время предыдущей команды (или записи журнала).
+    """
+    commands, covered, known_auto = [], set(), {}
+    last_at = None
+    for i, (seq, kind, p, created_at) in enumerate(journal):
+        if kind == "snapshot":
+            last_at = last_at or created_at
+            # Автоставки, поставленные мимо движка, появляются в снимке — ставим их в момент захвата
+            for user_id, max_amount in p["autoBids"]:
+                if known_auto.get(user_id) != max_amount:
+                    commands.append((created_at, "auto_bid", user_id, max_amount))
+                    known_auto[user_id] = max_amount
+        elif kind == "bid":
+            at = datetime.fromisoformat(p["at"])
+            covered.add((p["userId"], p["amount"]))
+            if not p.get("auto"):
+                commands.append((at, "bid", p["userId"], p["amount"]))
+            last_at = at
+        elif kind == "auto_bid":
+            at = last_at or created_at
+            for _, next_kind, next_p, _ in journal[i + 1:i + 2]:
+                if next_kind == "bid" and next_p.get("auto"):
+                    at = datetime.fromisoformat(next_p["at"])
+            commands.append((at, "auto_bid", p["userId"], p["maxAmount"]))
+            known_auto[p["userId"]] = p["maxAmount"]
+    return commands, covered
+
+
+def export(args):
+    conn = get_conn(os.environ["DATABASE_URL"])
+    cur = conn.cursor()
+    where, params = ["status = 'finished'"], []
+    if args.since:
+        where.append("ends_at >= %s")
+        params.append(args.since)
+    if args.lots:
+        where.append("id = ANY(%s)")
+        params.append([int(x) for x in args.lots.split(",")])
+    cur.execute(f"""
+        SELECT id, title, start_price, step, ends_at, anti_snipe, anti_snipe_minutes, current_price, winner_id
+        FROM {SCHEMA}.lots WHERE {' AND '.join(where)} ORDER BY id
+    """, params)
+    lots = cur.fetchall()
+    lot_ids = [r[0] for r in lots]
+
+    cur.execute(f"""
+        SELECT b.lot_id, b.user_id, COALESCE(u.name, ''), COALESCE(u.avatar, ''), b.amount, b.created_at
+        FROM {SCHEMA}.bids b LEFT JOIN {SCHEMA}.users u ON u.id = b.user_key
+        WHERE b.lot_id = ANY(%s)
+        ORDER BY b.lot_id, b.created_at, b.id
+    """, (lot_ids,))
+    bids = defaultdict(list)
+    users = {}
+    for lot_id, user_id, name, avatar, amount, created_at in cur.fetchall():
+        bids[lot_id].append((user_id, amount, created_at))
+        users.setdefault(user_id, (name, avatar))
+
+    cur.execute(f"""
+        SELECT lot_id, seq, kind, payload, created_at FROM {SCHEMA}.engine_events
+        WHERE lot_id = ANY(%s) ORDER BY lot_id, seq
+    """, (lot_ids,))
+    journals = defaultdict(list)
+    for lot_id, seq, kind, payload, created_at in cur.fetchall():
+        journals[lot_id].append((seq, kind, payload, created_at))
+    conn.close()
+
+    lot_rows, commands, skipped = [], [], []
+    for lot_id, title, start_price, step, ends_at, anti_snipe, minutes, price, winner_id in lots:
+        lot_bids = bids.get(lot_id, [])
+        if not lot_bids:
+            continue
+        # Одна транзакция — один момент created_at и не больше одного продления
+        start_ends_at = initial_ends_at(ends_at, anti_snipe, minutes, sorted({t for _, _, t in lot_bids}))
+        if start_ends_at is None:
+            skipped.append(lot_id)
+            continue
+        lot_commands, covered = journal_commands(journals[lot_id]) if lot_id in journals else ([], set())
+        lot_commands += [(t, "bid", u, a) for u, a, t in lot_bids if (u, a) not in covered]
+        commands += [(at, lot_id, op, user_id, value) for at, op, user_id, value in lot_commands]
+        lot_rows.append({
+            "type": "lot", "id": lot_id, "title": title, "startPrice": start_price, "step": step,
+            "endsAt": start_ends_at.isoformat(), "antiSnipe": anti_snipe, "antiSnipeMinutes": minutes,
+            "autoBids": lot_id in journals,
+            "expect": {"price": price, "winner": winner_id, "endsAt": ends_at.isoformat()},
+        })
+
+    # Порядок внутри лота — как в истории; sort устойчив, поэтому равные моменты не переставляются
+    commands.sort(key=lambda c: c[0])
+    user_index = {user_id: i for i, user_id in enumerate(users)}
+    t0 = commands[0][0] if commands else datetime.now(timezone.utc)
+    with gzip.open(args.file, "wt", encoding="utf-8") as f:
+        f.write(json.dumps({
+            "format": "auction-replay", "version": FORMAT_VERSION, "t0": t0.isoformat(),
+            "users": [[user_id, name, avatar] for user_id, (name, avatar) in users.items()],
+        }, ensure_ascii=False) + "\n")
+        for row in lot_rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        for at, lot_id, op, user_id, value in commands:
+            # Компактно: миллисекунды от t0 и номер пользователя в заголовке
+            f.write(json.dumps([round((at - t0).total_seconds() * 1000), lot_id, op, user_index[user_id], value]) + "\n")
+    print(f"[replay] exported lots={len(lot_rows)} commands={len(commands)} users={len(users)} "
+          f"skipped={len(skipped)} {skipped[:20]}")
+
+
+# ── Фальшивые часы ──────────────────────────────────────────────────────────
+# Handler читает время через datetime.now() и time.monotonic()/time.time(). Модулю подставляются
+# заменители, которые в каждом потоке возвращают момент выполняемой команды.
+
+class FakeClock:
+    def __init__(self, t0: datetime):
+        self.t0 = t0
+        self._local = threading.local()
+
+    def set(self, at: datetime):
+        self._local.now = at
+
+    def now(self) -> datetime:
+        return getattr(self._local, "now", self.t0)
+
+    def datetime_class(self):
+        clock = self
+
+        class FakeDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                now = clock.now()
+                return now.astimezone(tz) if tz else now.replace(tzinfo=None)
+
+            @classmethod
+            def utcnow(cls):
+                return clock.now().replace(tzinfo=None)
+
+        return FakeDatetime
+
+    def time_module(self):
+        clock = self
+
+        class FakeTime:
+            def time(self):
+                return clock.now().timestamp()
+
+            def monotonic(self):
+                return (clock.now() - clock.t0).total_seconds()
+
+            def __getattr__(self, name):
+                return getattr(time, name)
+
+        return FakeTime()
+
+
+class NoRateLimit:
+    def take(self, bucket: str, rate: float, capacity: float) -> float:
+        return 0.0
+
+
+def load_handler(clock: FakeClock, rate_limit: bool):
+    import importlib.util
+    os.environ.setdefault("RATE_LIMIT_BACKEND", "memory")
+    spec = importlib.util.spec_from_file_location("auction_bid_replay", HANDLER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.datetime = clock.datetime_class()
+    module.time = clock.time_module()
+    if not rate_limit:
+        module.rate_limiter = NoRateLimit()
+    return module
+
+
+# ── Повтор ──────────────────────────────────────────────────────────────────
+
+def read_replay(path: str) -> tuple:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("format") != "auction-replay" or header.get("version") != FORMAT_VERSION:
+            raise SystemExit(f"{path}: not an auction-replay v{FORMAT_VERSION} file")
+        lots, commands = [], []
+        for line in f:
+            row = json.loads(line)
+            if isinstance(row, dict):
+                lots.append(row)
+            else:
+                commands.append(row)
+    return header, lots, commands
+
+
+def create_lots(conn, lots: list, t0: datetime) -> dict:
+    """Заводит лоты в локальной БД активными с начальной ценой; возвращает {исходный id: новый id}."""
+    cur = conn.cursor()
+    ids = {}
+    for lot in lots:
+        cur.execute(f"""
+            INSERT INTO {SCHEMA}.lots
+                (title, description, start_price, current_price, step, starts_at, ends_at, status,
+                 anti_snipe, anti_snipe_minutes)
+            VALUES (%s, '', %s, %s, %s, %s, %s, 'active', %s, %s)
+            RETURNING id
+        """, (f"[replay {lot['id']}] {lot['title']}", lot["startPrice"], lot["startPrice"], lot["step"],
+              t0 - timedelta(minutes=1), lot["endsAt"], lot["antiSnipe"], lot["antiSnipeMinutes"]))
+        ids[lot["id"]] = cur.fetchone()[0]
+    conn.commit()
+    return ids
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(args):
+    url = os.environ.get("REPLAY_DATABASE_URL")
+    if not url:
+        raise SystemExit("REPLAY_DATABASE_URL is required: replay writes lots and bids into that database")
+    # handler берёт соединение из DATABASE_URL — направляем его в локальную БД, а не в рабочую
+    os.environ["DATABASE_URL"] = url
+
+    header, lots, commands = read_replay(args.file)
+    t0 = datetime.fromisoformat(header["t0"])
+    users = header["users"]
+    conn = get_conn(url)
+    lot_ids = create_lots(conn, lots, t0)
+
+    clock = FakeClock(t0)
+    module = load_handler(clock, args.rate_limit)
+
+    # Команды одного лота выполняет один поток по порядку; лоты раскладываются по потокам
+    queues = [[] for _ in range(args.workers)]
+    for cmd in commands:
+        queues[cmd[1] % args.workers].append(cmd)
+    latencies = [[] for _ in range(args.workers)]
+    outcomes = defaultdict(int)
+    outcomes_lock = threading.Lock()
+    started = time.monotonic()
+
+    def worker(n: int):
+        for offset_ms, lot_id, op, user, value in queues[n]:
+            if args.speed > 0:
+                delay = started + offset_ms / 1000 / args.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            user_id, name, avatar = users[user]
+            body = {"lotId": lot_ids[lot_id], "userId": user_id, "userName": name, "userAvatar": avatar}
+            if op == "auto_bid":
+                body.update(action="auto_bid", maxAmount=value)
+            else:
+                body["amount"] = value
+            clock.set(t0 + timedelta(milliseconds=offset_ms))
+            t = time.perf_counter()
+            resp = module.handler({"httpMethod": "POST", "headers": {}, "body": json.dumps(body)}, None)
+            latencies[n].append(time.perf_counter() - t)
+            with outcomes_lock:
+                outcomes[f"{op}:{resp['statusCode']}"] += 1
+
+    # Логи handler'а на каждую ставку заглушаются, отчёт печатается после
+    stdout = sys.stdout
+    if not args.verbose:
+        sys.stdout = open(os.devnull, "w")
+    try:
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.workers)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+    finally:
+        if sys.stdout is not stdout:
+            sys.stdout.close()
+            sys.stdout = stdout
+    elapsed = time.monotonic() - started
+
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT l.id, l.current_price, l.ends_at,
+               (SELECT b.user_id FROM {SCHEMA}.bids b WHERE b.lot_id = l.id
+                ORDER BY b.amount DESC, b.created_at ASC, b.id ASC LIMIT 1)
+        FROM {SCHEMA}.lots l WHERE l.id = ANY(%s)
+    """, (list(lot_ids.values()),))
+    actual = {r[0]: r[1:] for r in cur.fetchall()}
+    conn.close()
+
+    mismatches = []
+    for lot in lots:
+        price, ends_at, leader = actual[lot_ids[lot["id"]]]
+        expect = lot["expect"]
+        got = {"price": price, "winner": leader, "endsAt": ends_at.isoformat()}
+        if (price, leader, ends_at) != (expect["price"], expect["winner"], datetime.fromisoformat(expect["endsAt"])):
+            mismatches.append((lot["id"], expect, got))
+
+    all_latencies = [x for part in latencies for x in part]
+    print(f"[replay] lots={len(lots)} (auto-bid replay: {sum(1 for x in lots if x['autoBids'])}) "
+          f"commands={len(commands)} outcomes={dict(outcomes)}")
+    print(f"[replay] elapsed={elapsed:.2f}s throughput={len(commands) / elapsed if elapsed else 0:.1f} cmd/s "
+          f"latency p50={percentile(all_latencies, 0.5) * 1000:.1f}ms p95={percentile(all_latencies, 0.95) * 1000:.1f}ms "
+          f"p99={percentile(all_latencies, 0.99) * 1000:.1f}ms max={max(all_latencies, default=0) * 1000:.1f}ms")
+    for lot_id, expect, got in mismatches[:50]:
+        print(f"[replay] MISMATCH lot={lot_id} expected={expect} got={got}")
+    print(f"[replay] {'FAIL' if mismatches else 'OK'}: {len(mismatches)} of {len(lots)} lots differ")
+    return 1 if mismatches else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Auction history replay")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("export")
+    p.add_argument("file")
+    p.add_argument("--since", help="только лоты, завершившиеся не раньше этой даты")
+    p.add_argument("--lots", help="id лотов через запятую")
+    p = sub.add_parser("run")
+    p.add_argument("file")
+    p.add_argument("--speed", type=float, default=0, help="1 — реальный темп, N — в N раз быстрее, 0 — без пауз")
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--no-rate-limit", dest="rate_limit", action="store_false",
+                   help="не ограничивать частоту ставок (в истории лимит мог делиться между инстансами)")
+    p.add_argument("--verbose", action="store_true", help="не глушить логи handler'а")
+    args = parser.parse_args()
+    if args.command == "export":
+        export(args)
+        return 0
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
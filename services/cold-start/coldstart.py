@@ -0,0 +1,108 @@
+"""
+Холодный старт функций: сколько стоит импорт index.py и первый запрос, который не трогает БД и S3.
+Каждая функция грузится в свежем процессе `python -X importtime`, как при холодном старте облачной функции:
+  python coldstart.py [--runs 5] [auction-bid auction-lots upload-video]
+Печатает медианы по запускам: import — загрузка index.py (сумма self-времени из -X importtime, по ней же
+счётчик модулей), options и invalid — первый OPTIONS и первая ошибка валидации после импорта. Колонка
+deferred — сколько стоили бы отложенные импорты (psycopg2, boto3), если бы index.py грузил их сразу;
+n/a — пакет здесь не установлен.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND = os.path.join(os.path.dirname(__file__), "..", "..", "backend")
+
+# Первый запрос, который функция должна обслужить без драйвера БД и AWS SDK
+INVALID_EVENTS = {
+    "auction-bid": {"httpMethod": "POST", "body": "{}"},
+    "auction-lots": {"httpMethod": "GET", "queryStringParameters": {"action": "me"}},
+    "upload-video": {"httpMethod": "POST", "body": json.dumps({"action": "status", "uploadId": "x"})},
+}
+DEFERRED = {
+    "auction-bid": ["psycopg2"],
+    "auction-lots": ["psycopg2"],
+    "upload-video": ["psycopg2", "boto3"],
+}
+
+# -X importtime пишет в stderr: маркеры отделяют импорты index.py от старта интерпретатора
+MARKER = "-- index.py --"
+PROBE = """
+import importlib.util, json, sys, time
+path, event, marker = sys.argv[1], json.loads(sys.argv[2]), sys.argv[3]
+spec = importlib.util.spec_from_file_location("index", path)
+module = importlib.util.module_from_spec(spec)
+print(marker, file=sys.stderr, flush=True)
+spec.loader.exec_module(module)
+print(marker, file=sys.stderr, flush=True)
+timings = {}
+for name, ev in (("options", {"httpMethod": "OPTIONS"}), ("invalid", event)):
+    started = time.perf_counter()
+    status = module.handler(ev, None)["statusCode"]
+    timings[name] = (time.perf_counter() - started) * 1000
+    timings[name + "_status"] = status
+timings["loaded"] = sorted(m for m in ("psycopg2", "boto3", "urllib.request") if m in sys.modules)
+print(json.dumps(timings))
+"""
+
+
+def import_profile(stderr: str) -> tuple:
+    """Сумма self-времени (мс) и число модулей из вывода -X importtime (между маркерами, если они есть)."""
+    if MARKER in stderr:
+        stderr = stderr.split(MARKER)[1]
+    total_us, modules = 0, 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        total_us += int(line.split(":", 1)[1].split("|")[0])
+        modules += 1
+    return total_us / 1000, modules
+
+
+def probe(name: str) -> dict:
+    path = os.path.join(BACKEND, name, "index.py")
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE, path, json.dumps(INVALID_EVENTS[name]), MARKER],
+        capture_output=True, text=True, check=True,
+    )
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["import"], result["modules"] = import_profile(out.stderr)
+    return result
+
+
+def deferred_cost(packages: list):
+    """Время импорта отложенных пакетов в свежем процессе; None, если какого-то нет."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "; ".join(f"import {p}" for p in packages)],
+        capture_output=True, text=True,
+    )
+    if out.returncode != 0:
+        return None
+    return import_profile(out.stderr)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("functions", nargs="*", default=list(INVALID_EVENTS))
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'function':<14}{'import ms':>11}{'modules':>9}{'options ms':>12}{'invalid ms':>12}"
+          f"{'deferred ms':>13}  loaded after invalid")
+    for name in args.functions:
+        runs = [probe(name) for _ in range(args.runs)]
+        costs = [deferred_cost(DEFERRED[name]) for _ in range(args.runs)]
+        deferred = "n/a" if None in costs else f"{statistics.median(costs):.1f}"
+        last = runs[-1]
+        print(f"{name:<14}{statistics.median(r['import'] for r in runs):>11.1f}"
+              f"{int(statistics.median(r['modules'] for r in runs)):>9}"
+              f"{statistics.median(r['options'] for r in runs):>12.2f}"
+              f"{statistics.median(r['invalid'] for r in runs):>12.2f}"
+              f"{deferred:>13}  {', '.join(last['loaded']) or '-'} (HTTP {last['invalid_status']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,26 @@ const API = {
   admin: "https://functions.poehali.dev/c80458b7-040f-4c1e-afc7-9418aa34e00f",
 };
 
+// Снимок каталога в CDN (baseUrl из ответа catalog-publish); пусто — каталог читается из API
+const CATALOG_CDN = "";
+
+let catalogSnapshot: { version: number; lotCount: number; lots: ApiResponse[] } | null = null;
+
 type ApiResponse = Record<string, unknown>;
 
+// Сообщество, из которого открыто приложение: бэкенд отдаёт только его лоты
+function launchGroupId(): string | null {
+  return new URLSearchParams(window.location.search).get("vk_group_id");
+}
+
+export function tenantHeaders(): Record<string, string> {
+  const groupId = launchGroupId();
+  return groupId ? { "X-Vk-Group-Id": groupId } : {};
+}
+
 async function apiFetch(url: string, opts?: RequestInit): Promise<ApiResponse | ApiResponse[]> {
   try {
-    const r = await fetch(url, { headers: { "Content-Type": "application/json" }, ...opts });
+    const r = await fetch(url, { headers: { "Content-Type": "application/json", ...tenantHeaders() }, ...opts });
     if (!r.ok) {
       const text = await r.text();
       console.error(`[api] HTTP ${r.status} for ${url}:`, text);
@@ -23,19 +38,49 @@ async function apiFetch(url: string, opts?: RequestInit): Promise<ApiResponse |
   }
 }
 
-export function apiGetLots(): Promise<ApiResponse | ApiResponse[]> {
-  return apiFetch(API.lots);
+// Каталог из CDN: сначала маленький version.json, lots.json — только когда версия сменилась.
+// Снимок сообщества лежит в подкаталоге с его vk_group_id.
+async function getCatalogSnapshot(): Promise<ApiResponse[]> {
+  const groupId = launchGroupId();
+  const base = groupId ? `${CATALOG_CDN}/${groupId}` : CATALOG_CDN;
+  const r = await fetch(`${base}/version.json`, { cache: "no-cache" });
+  if (!r.ok) throw new Error(`HTTP ${r.status}`);
+  const { version, lotCount } = await r.json() as { version: number; lotCount: number };
+  if (catalogSnapshot && catalogSnapshot.version === version && catalogSnapshot.lotCount === lotCount) {
+    return catalogSnapshot.lots;
+  }
+  const lr = await fetch(`${base}/lots.json?v=${version}`);
+  if (!lr.ok) throw new Error(`HTTP ${lr.status}`);
+  const lots = await lr.json() as ApiResponse[];
+  catalogSnapshot = { version, lotCount, lots };
+  return lots;
+}
+
+// readToken из ответа на ставку: сервер прочитает с primary, если реплика ещё не догнала эту ставку.
+// fresh — нужен каталог без задержки публикации (последние минуты торгов): читаем из API.
+export async function apiGetLots(readToken?: string, fresh = false): Promise<ApiResponse | ApiResponse[]> {
+  if (CATALOG_CDN && !readToken && !fresh) {
+    try {
+      return await getCatalogSnapshot();
+    } catch (e) {
+      console.error(`[api] catalog snapshot unavailable: ${e}`);
+    }
+  }
+  return apiFetch(readToken ? `${API.lots}?readToken=${encodeURIComponent(readToken)}` : API.lots);
 }
 
-export function apiGetLot(id: number, userId?: string): Promise<ApiResponse | ApiResponse[]> {
-  const qs = userId ? `?id=${id}&userId=${encodeURIComponent(userId)}` : `?id=${id}`;
+export function apiGetLot(id: number, userId?: string, readToken?: string): Promise<ApiResponse | ApiResponse[]> {
+  let qs = userId ? `?id=${id}&userId=${encodeURIComponent(userId)}` : `?id=${id}`;
+  if (readToken) qs += `&readToken=${encodeURIComponent(readToken)}`;
   return apiFetch(`${API.lots}${qs}`);
 }
 
-export function apiPlaceBid(lotId: number, amount: number, user: User): Promise<ApiResponse | ApiResponse[]> {
+// idempotencyKey создаёт вызывающий — один на действие пользователя: повтор с тем же ключом
+// (например, после таймаута) вернёт исходный ответ, а не вторую ставку
+export function apiPlaceBid(lotId: number, amount: number, user: User, idempotencyKey: string): Promise<ApiResponse | ApiResponse[]> {
   return apiFetch(API.bid, {
     method: "POST",
-    body: JSON.stringify({ lotId, amount, userId: user.id, userName: user.name, userAvatar: user.avatar }),
+    body: JSON.stringify({ lotId, amount, userId: user.id, userName: user.name, userAvatar: user.avatar, idempotencyKey }),
   });
 }
 
@@ -43,10 +88,10 @@ export function apiAdmin(body: object): Promise<ApiResponse | ApiResponse[]> {
   return apiFetch(API.admin, { method: "POST", body: JSON.stringify(body) });
 }
 
-export function apiSetAutoBid(lotId: number, maxAmount: number, user: User): Promise<ApiResponse | ApiResponse[]> {
+export function apiSetAutoBid(lotId: number, maxAmount: number, user: User, idempotencyKey: string): Promise<ApiResponse | ApiResponse[]> {
   return apiFetch(API.bid, {
     method: "POST",
-    body: JSON.stringify({ action: "auto_bid", lotId, maxAmount, userId: user.id, userName: user.name, userAvatar: user.avatar }),
+    body: JSON.stringify({ action: "auto_bid", lotId, maxAmount, userId: user.id, userName: user.name, userAvatar: user.avatar, idempotencyKey }),
   });
 }
 
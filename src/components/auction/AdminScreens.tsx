@@ -2,6 +2,7 @@ import { useState, useEffect } from "react";
 import bridge from "@vkontakte/vk-bridge";
 import Icon from "@/components/ui/icon";
 import type { Lot } from "@/types/auction";
+import { tenantHeaders } from "@/api/auction";
 import { AdminLotCard } from "@/components/auction/AdminLotCard";
 export { AdminLotForm } from "@/components/auction/AdminLotForm";
 
@@ -14,7 +15,7 @@ type NotifConfig = { key: NotifKey; enabled: boolean };
 
 const NOTIF_LABELS: Record<NotifKey, { label: string; desc: string; icon: string }> = {
   outbid: { label: "Перебили ставку", desc: "Когда участника перебивают и он остаётся не лидером 5+ мин", icon: "TrendingUp" },
-  ending_15min: { label: "Скоро конец аукциона", desc: "За ~15 минут до завершения всем участникам лота", icon: "Clock" },
+  ending_15min: { label: "Скоро конец аукциона", desc: "За час, 15 и 5 минут до завершения всем участникам лота", icon: "Clock" },
   winner: { label: "Победитель", desc: "Уведомление победителю после завершения лота", icon: "Trophy" },
 };
 
@@ -161,7 +162,7 @@ export function AdminScreen({ lots, onEditLot, onNewLot, onUpdateStatus, onStopL
 
   useEffect(() => {
     if (!adminId) return;
-    fetch(`${TRACK_URL}?requesterId=${adminId}`)
+    fetch(`${TRACK_URL}?requesterId=${adminId}`, { headers: tenantHeaders() })
       .then((r) => r.json())
       .then((d) => {
         const parsed = typeof d === "string" ? JSON.parse(d) : d;
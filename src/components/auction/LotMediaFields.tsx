@@ -143,6 +143,7 @@ export function LotMediaFields({ form, set, videoUploading, uploadProgress, vide
     setUploadProgress(0);
     setVideoName(file.name);
     const CHUNK_SIZE = 256 * 1024;
+    const PARALLEL_PARTS = 4;
     const api = async (body: object, retries = 3): Promise<Record<string, unknown>> => {
       for (let attempt = 1; attempt <= retries; attempt++) {
         try {
@@ -156,23 +157,67 @@ export function LotMediaFields({ form, set, videoUploading, uploadProgress, vide
       }
       throw new Error("max retries");
     };
+    const sha256 = async (blob: Blob): Promise<string> => {
+      const digest = await crypto.subtle.digest("SHA-256", await blob.arrayBuffer());
+      return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, "0")).join("");
+    };
+    // Сессия переживает перезагрузку страницы: тот же файл докачивается с недостающих частей
+    const resumeKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+    let uploadId = "";
     try {
-      const { uploadId, key } = await api({ action: "init", filename: file.name, contentType: file.type });
       const totalChunks = Math.ceil(file.size / CHUNK_SIZE);
+      const hashes: string[] = new Array(totalChunks);
+      let pending = Array.from({ length: totalChunks }, (_, i) => i + 1);
+
+      const saved = localStorage.getItem(resumeKey);
+      if (saved) {
+        ({ uploadId } = JSON.parse(saved) as { uploadId: string });
+        const st = await api({ action: "status", uploadId, totalParts: totalChunks }).catch(() => null);
+        if (st?.status === "open") pending = st.missing as number[];
+        else uploadId = "";
+      }
+      if (!uploadId) {
+        ({ uploadId } = await api({ action: "init", filename: file.name, contentType: file.type, totalParts: totalChunks }) as { uploadId: string });
+        localStorage.setItem(resumeKey, JSON.stringify({ uploadId }));
+      }
+
+      const uploadParts = async (parts: number[]) => {
+        let done = totalChunks - parts.length;
+        const queue = [...parts];
+        const worker = async () => {
+          for (let n = queue.shift(); n !== undefined; n = queue.shift()) {
+            const chunk = file.slice((n - 1) * CHUNK_SIZE, n * CHUNK_SIZE);
+            const [data, hash] = await Promise.all([toBase64(chunk), sha256(chunk)]);
+            await api({ action: "chunk", uploadId, partNumber: n, data, sha256: hash });
+            hashes[n - 1] = hash;
+            done++;
+            setUploadProgress(Math.round((done / totalChunks) * 95));
+          }
+        };
+        await Promise.all(Array.from({ length: Math.min(PARALLEL_PARTS, parts.length) }, worker));
+      };
+      await uploadParts(pending);
+
+      // Хэши частей, дошедших до перезагрузки страницы, досчитываем локально
       for (let i = 0; i < totalChunks; i++) {
-        const chunk = file.slice(i * CHUNK_SIZE, (i + 1) * CHUNK_SIZE);
-        const data = await toBase64(chunk);
-        await api({ action: "chunk", key, uploadId, partNumber: i + 1, data });
-        setUploadProgress(Math.round(((i + 1) / totalChunks) * 95));
+        hashes[i] ??= await sha256(file.slice(i * CHUNK_SIZE, (i + 1) * CHUNK_SIZE));
+      }
+      let result = await api({ action: "complete", uploadId, totalParts: totalChunks, contentType: file.type, sha256s: hashes }, 1).catch(() => null);
+      if (!result?.url) {
+        // Сервер не досчитался частей (обрыв на последних) — докачиваем недостающие и пробуем ещё раз
+        const st = await api({ action: "status", uploadId, totalParts: totalChunks });
+        await uploadParts((st.missing as number[]) ?? []);
+        result = await api({ action: "complete", uploadId, totalParts: totalChunks, contentType: file.type, sha256s: hashes });
       }
-      const { url } = await api({ action: "complete", key, uploadId, totalParts: totalChunks, contentType: file.type });
+      const { url } = result;
+      localStorage.removeItem(resumeKey);
       if (url) {
         videoUrlRef.current = url as string;
         set("video", url);
         setUploadProgress(100);
         extractVideoThumbnail(file, url as string, set);
       } else {
-        await api({ action: "abort", key, uploadId });
+        await api({ action: "abort", uploadId });
         alert("Ошибка завершения загрузки");
       }
     } catch (err) {
@@ -46,9 +46,9 @@ export function useAuction() {
     }).catch(() => null);
   }
 
-  const loadLots = useCallback(async () => {
+  const loadLots = useCallback(async (readToken?: string, fresh?: boolean) => {
     try {
-      const data = await apiGetLots();
+      const data = await apiGetLots(readToken, fresh);
       if (Array.isArray(data)) {
         const normalized = data.map(normalizeLot);
         setLots(normalized);
@@ -80,18 +80,20 @@ export function useAuction() {
       return 15000;
     }
     function scheduleCatalog() {
+      const interval = getCatalogInterval();
       catalogTimer = setTimeout(async () => {
-        await loadLots();
+        // Ежесекундный опрос — последние минуты торгов: снимок CDN может отставать на окно публикации
+        await loadLots(undefined, interval < 5000);
         scheduleCatalog();
-      }, getCatalogInterval());
+      }, interval);
     }
     scheduleCatalog();
     return () => clearTimeout(catalogTimer);
   }, [loadLots]);
 
-  async function loadLot(id: string) {
+  async function loadLot(id: string, readToken?: string) {
     try {
-      const data = await apiGetLot(Number(id), user.id !== "guest" ? user.id : undefined);
+      const data = await apiGetLot(Number(id), user.id !== "guest" ? user.id : undefined, readToken);
       if (!Array.isArray(data) && data && !data.error) {
         setActiveLot(normalizeLot(data as Record<string, unknown>));
       }
@@ -154,13 +156,31 @@ export function useAuction() {
     }
   }
 
+  // Ключ идемпотентности ставки живёт до успешного ответа: повтор после сетевой ошибки или 503
+  // (та же сумма в тот же лот) и двойное нажатие уходят с тем же ключом и не дают второй ставки.
+  // Отказы сервер не запоминает, так что повтор с прежним ключом просто выполняется заново
+  const pendingBidKeys = useRef<Map<string, string>>(new Map());
+
+  function bidKey(action: string, lotId: string, amount: number): [string, string] {
+    const slot = `${action}:${lotId}:${amount}`;
+    let key = pendingBidKeys.current.get(slot);
+    if (!key) {
+      key = crypto.randomUUID();
+      pendingBidKeys.current.set(slot, key);
+    }
+    return [slot, key];
+  }
+
   async function handleBid(lotId: string, amount: number): Promise<string> {
     console.log("[handleBid] called, lotId:", lotId, "amount:", amount);
     requestNotificationPermission();
+    const [slot, idempotencyKey] = bidKey("bid", lotId, amount);
     try {
-      const res = await apiPlaceBid(Number(lotId), amount, user) as Record<string, unknown>;
+      const res = await apiPlaceBid(Number(lotId), amount, user, idempotencyKey) as Record<string, unknown>;
       if (res.error) return String(res.error);
-      await Promise.all([loadLot(lotId), loadLots()]);
+      pendingBidKeys.current.delete(slot);
+      const readToken = res.readToken as string | undefined;
+      await Promise.all([loadLot(lotId, readToken), loadLots(readToken)]);
       return "ok";
     } catch {
       return "Ошибка сети. Попробуйте ещё раз.";
@@ -210,10 +230,12 @@ export function useAuction() {
   }
 
   async function handleAutoBid(lotId: string, maxAmount: number): Promise<string> {
+    const [slot, idempotencyKey] = bidKey("auto_bid", lotId, maxAmount);
     try {
-      const res = await apiSetAutoBid(Number(lotId), maxAmount, user) as Record<string, unknown>;
+      const res = await apiSetAutoBid(Number(lotId), maxAmount, user, idempotencyKey) as Record<string, unknown>;
       if (res.error) return String(res.error);
-      await loadLot(lotId);
+      pendingBidKeys.current.delete(slot);
+      await loadLot(lotId, res.readToken as string | undefined);
       return "ok";
     } catch {
       return "Ошибка сети. Попробуйте ещё раз.";
@@ -1,5 +1,6 @@
 import { useEffect, useState } from "react";
 import bridge from "@vkontakte/vk-bridge";
+import { tenantHeaders } from "@/api/auction";
 
 export interface VKUser {
   id: string;
@@ -96,7 +97,7 @@ export function useVKUser(): VKUser {
         const vkId = String(userInfo.id);
         fetch("https://functions.poehali.dev/e8bd7a1d-ec16-415b-ade0-2d0e35b9ba7e", {
           method: "POST",
-          headers: { "Content-Type": "application/json" },
+          headers: { "Content-Type": "application/json", ...tenantHeaders() },
           body: JSON.stringify({ vkUserId: vkId, userName: name }),
         }).catch(() => {});
 
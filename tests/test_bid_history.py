@@ -0,0 +1,61 @@
+"""
+Постраничная история ставок (bid_history в auction-lots): страницы по nextCursor вместе дают все ставки
+лота в порядке карточки без повторов. Курсор БД заменён списком ставок, который понимает три запроса функции.
+"""
+import importlib.util
+import pathlib
+from datetime import datetime, timedelta, timezone
+
+BACKEND = pathlib.Path(__file__).resolve().parent.parent / "backend"
+
+
+def load_lots():
+    spec = importlib.util.spec_from_file_location("fn_auction_lots", BACKEND / "auction-lots" / "index.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class BidsCursor:
+    """Ставки (id, user_key, amount, created_at) и участники; фильтры повторяют WHERE запросов bid_history."""
+
+    def __init__(self, bids: list, users: dict):
+        self.bids = bids
+        self.users = users
+        self.result = []
+
+    def execute(self, sql: str, params=()):
+        if ".users" in sql:
+            self.result = [(k,) + self.users[k] for k in params[0]]
+            return
+        rows = sorted(self.bids, key=lambda b: (-b[2], b[3], b[0]))
+        if "amount <=" in sql:
+            _, amount, _, created_at, bid_id, limit = params
+            rows = [b for b in rows if b[2] < amount or (b[2] == amount and (b[3], b[0]) > (created_at, bid_id))]
+        else:
+            limit = params[-1]
+        self.result = rows[:limit]
+
+    def fetchall(self):
+        return self.result
+
+
+def test_pages_through_history_with_next_cursor():
+    lots = load_lots()
+    t0 = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+    # Равные суммы с разным временем проверяют второй ключ сортировки на границе страниц
+    bids = [(i, 1 + i % 3, 1000 + (i // 2) * 100, t0 + timedelta(seconds=i)) for i in range(1, 12)]
+    users = {k: (f"id{k}", f"Участник {k}", "") for k in (1, 2, 3)}
+    cur = BidsCursor(bids, users)
+
+    seen, cursor = [], None
+    for _ in range(10):
+        page = lots.bid_history(cur, 7, 3, cursor=cursor)
+        seen += [b[0] for b in page["bids"]]
+        if not page["hasMore"]:
+            assert "nextCursor" not in page
+            break
+        cursor = lots.decode_cursor(page["nextCursor"])
+
+    expected = [b[0] for b in sorted(bids, key=lambda b: (-b[2], b[3], b[0]))]
+    assert seen == expected
@@ -0,0 +1,120 @@
+"""
+Повтор ставки по Idempotency-Key на инстансе, где закэшированы подсказка минимума или закрытый лот:
+уже принятая ставка получает свой исходный ответ, а не отказ без БД. Соединение с БД заменено объектом,
+который отвечает на запросы handler'а auction-bid из словаря сохранённых результатов.
+"""
+import importlib.util
+import json
+import pathlib
+
+import pytest
+
+BACKEND = pathlib.Path(__file__).resolve().parent.parent / "backend"
+USER_ID = "id900000001"
+LOT_ID = 7
+RESULT = {
+    "bid_id": 41, "new_price": 1100, "extended": False, "new_ends_at": "2026-03-01T12:00:00+00:00",
+    "final_price": 1100, "leader_id": USER_ID, "lot_version": 5, "min_next_bid": 1200, "notify_user_ids": [],
+}
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.row = None
+
+    def execute(self, sql: str, params=()):
+        if "acquire_tenant_slot" in sql:
+            self.row = (1, 0)
+        elif "engine_lots" in sql:
+            self.row = []
+        elif "idempotency_keys" in sql:
+            self.row = (1,) if params[0] in self.db.results else None
+        elif "place_bid_once" in sql:
+            self.db.placed.append(params[0])
+            self.row = (True, self.db.results[params[0]])
+        elif "lots" in sql:
+            self.row = (1,)
+        else:
+            raise AssertionError(sql)
+
+    def fetchone(self):
+        return self.row
+
+    def fetchall(self):
+        return self.row
+
+
+class FakeConn:
+    autocommit = False
+
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeDB:
+    def __init__(self):
+        self.results = {}
+        self.placed = []
+
+
+@pytest.fixture
+def bid_fn(monkeypatch):
+    monkeypatch.setenv("CACHE_LISTEN", "0")
+    spec = importlib.util.spec_from_file_location("fn_auction_bid", BACKEND / "auction-bid" / "index.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    db = FakeDB()
+    monkeypatch.setattr(module, "get_conn", lambda: FakeConn(db))
+    # Подсказке минимума верят, только пока инстанс слушает NOTIFY
+    module.lot_meta_cache.stats["listening"] = True
+    return module, db
+
+
+def bid_event(amount: int, key: str) -> dict:
+    return {
+        "httpMethod": "POST",
+        "headers": {"Idempotency-Key": key},
+        "body": json.dumps({"lotId": LOT_ID, "amount": amount, "userId": USER_ID, "userName": "Тест"}),
+    }
+
+
+def test_retry_of_accepted_bid_replays_despite_price_hint(bid_fn):
+    fn, db = bid_fn
+    db.results[f"{USER_ID}:k1"] = RESULT
+    fn.remember_price_hint(LOT_ID, 1500, since=None)
+
+    resp = fn.handler(bid_event(1100, "k1"), None)
+    assert resp["statusCode"] == 200
+    assert resp["headers"].get("Idempotent-Replayed") == "true"
+    assert json.loads(resp["body"])["bidId"] == 41
+    assert db.placed == [f"{USER_ID}:k1"]
+
+
+def test_retry_of_accepted_bid_replays_despite_closed_lot(bid_fn):
+    fn, db = bid_fn
+    db.results[f"{USER_ID}:k2"] = RESULT
+    fn.lot_meta_cache.set("lot", LOT_ID, "finished")
+
+    resp = fn.handler(bid_event(1100, "k2"), None)
+    assert resp["statusCode"] == 200
+    assert json.loads(resp["body"])["bidId"] == 41
+
+
+def test_new_bid_below_hint_rejected_without_placing(bid_fn):
+    fn, db = bid_fn
+    fn.remember_price_hint(LOT_ID, 1500, since=None)
+
+    resp = fn.handler(bid_event(1100, "fresh"), None)
+    assert resp["statusCode"] == 400
+    assert "Минимум: 1500" in json.loads(resp["body"])["error"]
+    assert db.placed == []
@@ -0,0 +1,70 @@
+"""
+Удаление лотов из админки (delete_lots в auction-admin) против настоящей БД: лот, который движок торгов
+захватывал и отпустил, удаляется вместе с журналом engine_events.
+Нужна отдельная БД с применёнными db_migrations: TEST_DATABASE_URL=... python -m pytest tests
+"""
+import importlib.util
+import os
+import pathlib
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+SCHEMA = "t_p68201414_vk_auction_app_1"
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+pytestmark = pytest.mark.skipif(not os.environ.get("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL is not set")
+
+
+def load(name: str, path: pathlib.Path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def db(monkeypatch):
+    import psycopg2
+    monkeypatch.setenv("DATABASE_URL", os.environ["TEST_DATABASE_URL"])
+    conn = psycopg2.connect(os.environ["TEST_DATABASE_URL"])
+    cur = conn.cursor()
+    lot_ids = []
+    yield conn, cur, lot_ids
+    conn.rollback()
+    for table in ("engine_lots", "engine_events", "bids", "auto_bids"):
+        cur.execute(f"DELETE FROM {SCHEMA}.{table} WHERE lot_id = ANY(%s)", (lot_ids,))
+    cur.execute(f"DELETE FROM {SCHEMA}.lots WHERE id = ANY(%s)", (lot_ids,))
+    conn.commit()
+    conn.close()
+
+
+def test_delete_lot_after_engine_claim_and_release(db):
+    conn, cur, lot_ids = db
+    admin = load("fn_auction_admin", ROOT / "backend" / "auction-admin" / "index.py")
+    engine_module = load("auction_engine", ROOT / "services" / "auction-engine" / "engine.py")
+
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.lots (title, current_price, step, ends_at, status)
+        VALUES ('Горячий лот', 1000, 100, %s, 'active') RETURNING id, tenant_id
+    """, (datetime.now(timezone.utc) + timedelta(hours=1),))
+    lot_id, tenant_id = cur.fetchone()
+    lot_ids.append(lot_id)
+    conn.commit()
+
+    engine = engine_module.Engine("http://engine.test")
+    threading.Thread(target=engine.writer_loop, daemon=True).start()
+    engine.claim(lot_id)
+    engine.release(lot_id)
+
+    cur.execute(f"SELECT COUNT(*) FROM {SCHEMA}.engine_events WHERE lot_id = %s", (lot_id,))
+    assert cur.fetchone()[0] > 0
+    assert admin.engine_owned(cur, [lot_id]) == []
+
+    admin.delete_lots(cur, tenant_id, [lot_id])
+    conn.commit()
+    cur.execute(f"SELECT COUNT(*) FROM {SCHEMA}.lots WHERE id = %s", (lot_id,))
+    assert cur.fetchone()[0] == 0
+    cur.execute(f"SELECT COUNT(*) FROM {SCHEMA}.engine_events WHERE lot_id = %s", (lot_id,))
+    assert cur.fetchone()[0] == 0
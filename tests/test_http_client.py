@@ -0,0 +1,110 @@
+"""
+HttpClient против локального HTTP-сервера: breaker, бюджет deadline и переиспользование keep-alive.
+Клиент скопирован в пять функций — тесты гоняются по каждой копии и проверяют, что копии не разошлись.
+"""
+import importlib.util
+import pathlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+BACKEND = pathlib.Path(__file__).resolve().parent.parent / "backend"
+COPIES = ["auction-bid", "auction-lots", "upload-video", "vk-notify", "vk-widget"]
+
+
+def load(name: str):
+    spec = importlib.util.spec_from_file_location(f"fn_{name.replace('-', '_')}", BACKEND / name / "index.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def client_source(name: str) -> str:
+    text = (BACKEND / name / "index.py").read_text()
+    return text[text.index("class OutboundError"):text.index("http_client = HttpClient()")]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+    status = 200
+    connections = set()
+
+    def do_GET(self):
+        Handler.connections.add(self.client_address)
+        time.sleep(Handler.delay)
+        body = b'{"ok": true}'
+        self.send_response(Handler.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.delay, Handler.status, Handler.connections = 0.0, 200, set()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(params=COPIES)
+def fn(request):
+    return load(request.param)
+
+
+def test_copies_in_sync():
+    reference = client_source(COPIES[0])
+    for name in COPIES[1:]:
+        assert client_source(name) == reference, name
+
+
+def test_keep_alive_reused(fn, server):
+    client = fn.HttpClient()
+    for _ in range(3):
+        assert client.get_json(server) == {"ok": True}
+    assert client.metrics["connected"] == 1
+    assert client.metrics["reused"] == 2
+    assert len(Handler.connections) == 1
+
+
+def test_breaker_opens_and_recovers(fn, server):
+    client = fn.HttpClient(breaker_failures=3, breaker_reset_seconds=0.2)
+    Handler.status = 503
+    for _ in range(3):
+        status, _ = client.request("GET", server)
+        assert status == 503
+    with pytest.raises(fn.OutboundError, match="circuit open"):
+        client.request("GET", server)
+    assert client.snapshot()["open"] == ["127.0.0.1"]
+
+    Handler.status = 200
+    time.sleep(0.25)
+    assert client.request("GET", server)[0] == 200
+    assert client.snapshot()["open"] == []
+
+
+def test_deadline_does_not_open_breaker(fn, server):
+    # Здоровый сервер на 0,3 с и бюджет 1 с: часть запросов не укладывается, но хост ни при чём
+    client = fn.HttpClient(breaker_failures=2)
+    Handler.delay = 0.3
+    deadline = time.monotonic() + 1.0
+    outcomes = []
+    for _ in range(6):
+        try:
+            outcomes.append(client.request("GET", server, deadline=deadline)[0])
+        except fn.OutboundError as e:
+            outcomes.append(str(e))
+    assert outcomes[:3] == [200, 200, 200]
+    assert any("deadline exceeded" in str(o) for o in outcomes)
+    assert client.metrics["budget_exhausted"] >= 1
+    assert client.snapshot()["open"] == []
+    assert client.request("GET", server)[0] == 200
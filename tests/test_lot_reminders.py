@@ -0,0 +1,120 @@
+"""
+Напоминания «скоро конец» (notify_ending_soon в auction-lots) против настоящей БД: продление внутри окна
+напоминание не повторяет, а вынесенный из окна конец лота взводит его заново.
+Нужна отдельная БД с применёнными db_migrations: TEST_DATABASE_URL=... python -m pytest tests
+"""
+import importlib.util
+import os
+import pathlib
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+SCHEMA = "t_p68201414_vk_auction_app_1"
+BACKEND = pathlib.Path(__file__).resolve().parent.parent / "backend"
+USER_ID = "id900000001"
+
+pytestmark = pytest.mark.skipif(not os.environ.get("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL is not set")
+
+
+@pytest.fixture
+def lots_fn(monkeypatch):
+    spec = importlib.util.spec_from_file_location("fn_auction_lots", BACKEND / "auction-lots" / "index.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, "REMINDER_WINDOWS_MINUTES", (15,))
+    return module
+
+
+@pytest.fixture
+def db():
+    import psycopg2
+    conn = psycopg2.connect(os.environ["TEST_DATABASE_URL"])
+    cur = conn.cursor()
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.notification_config (key, enabled) VALUES ('ending_15min', true)
+        ON CONFLICT (key) DO UPDATE SET enabled = true
+    """)
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.notification_settings (user_id, allowed) VALUES (%s, true)
+        ON CONFLICT (user_id) DO UPDATE SET allowed = true
+    """, (USER_ID,))
+    cur.execute(f"SELECT {SCHEMA}.upsert_user(%s, %s, %s)", (USER_ID, "Тест", ""))
+    conn.commit()
+    lot_ids = []
+    yield conn, cur, lot_ids
+    conn.rollback()
+    for table, column in (("notification_queue", "lot_id"), ("lot_reminders", "lot_id"), ("bids", "lot_id"), ("lots", "id")):
+        cur.execute(f"DELETE FROM {SCHEMA}.{table} WHERE {column} = ANY(%s)", (lot_ids,))
+    conn.commit()
+    conn.close()
+
+
+def create_lot(cur, lot_ids: list, ends_at: datetime) -> int:
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.lots (title, current_price, step, ends_at, status)
+        VALUES ('Напоминание', 1000, 100, %s, 'active') RETURNING id
+    """, (ends_at,))
+    lot_id = cur.fetchone()[0]
+    lot_ids.append(lot_id)
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.bids (lot_id, user_id, user_key, amount)
+        SELECT %s, vk_user_id, id, 1100 FROM {SCHEMA}.users WHERE vk_user_id = %s
+    """, (lot_id, USER_ID))
+    return lot_id
+
+
+def queued(cur, lot_id: int) -> int:
+    """Сколько напоминаний лота ждёт в очереди; очередь очищается, как после отправки дайджеста."""
+    cur.execute(f"DELETE FROM {SCHEMA}.notification_queue WHERE lot_id = %s AND kind = 'ending' RETURNING 1", (lot_id,))
+    return len(cur.fetchall())
+
+
+def test_anti_snipe_extension_does_not_repeat_reminder(lots_fn, db):
+    conn, cur, lot_ids = db
+    t0 = datetime.now(timezone.utc)
+    lot_id = create_lot(cur, lot_ids, t0 + timedelta(minutes=10))
+    conn.commit()
+
+    lots_fn.notify_ending_soon(conn, cur, t0)
+    assert queued(cur, lot_id) == 1
+
+    # Ставка за минуту до конца продлевает лот на две минуты — он всё ещё внутри 15-минутного окна
+    cur.execute(f"UPDATE {SCHEMA}.lots SET ends_at = ends_at + INTERVAL '2 minutes' WHERE id = %s", (lot_id,))
+    conn.commit()
+    lots_fn.notify_ending_soon(conn, cur, t0 + timedelta(minutes=9))
+    lots_fn.notify_ending_soon(conn, cur, t0 + timedelta(minutes=11))
+    assert queued(cur, lot_id) == 0
+
+
+def test_end_moved_out_of_window_rearms_reminder(lots_fn, db):
+    conn, cur, lot_ids = db
+    t0 = datetime.now(timezone.utc)
+    lot_id = create_lot(cur, lot_ids, t0 + timedelta(minutes=10))
+    conn.commit()
+
+    lots_fn.notify_ending_soon(conn, cur, t0)
+    assert queued(cur, lot_id) == 1
+
+    # Админка отодвинула конец на час: пока лот вне окна, напоминание не уходит, но снова взводится
+    cur.execute(f"UPDATE {SCHEMA}.lots SET ends_at = %s WHERE id = %s", (t0 + timedelta(minutes=70), lot_id))
+    conn.commit()
+    lots_fn.notify_ending_soon(conn, cur, t0 + timedelta(minutes=1))
+    assert queued(cur, lot_id) == 0
+
+    lots_fn.notify_ending_soon(conn, cur, t0 + timedelta(minutes=56))
+    assert queued(cur, lot_id) == 1
+
+
+def test_finished_lot_reminders_pruned(lots_fn, db):
+    conn, cur, lot_ids = db
+    t0 = datetime.now(timezone.utc)
+    lot_id = create_lot(cur, lot_ids, t0 + timedelta(minutes=10))
+    conn.commit()
+
+    lots_fn.notify_ending_soon(conn, cur, t0)
+    cur.execute(f"UPDATE {SCHEMA}.lots SET status = 'finished' WHERE id = %s", (lot_id,))
+    conn.commit()
+    lots_fn.notify_ending_soon(conn, cur, t0 + timedelta(minutes=11))
+    cur.execute(f"SELECT COUNT(*) FROM {SCHEMA}.lot_reminders WHERE lot_id = %s", (lot_id,))
+    assert cur.fetchone()[0] == 0
@@ -0,0 +1,37 @@
+"""
+Хелперы сообществ (TenantError, vk_group_id, acquire_tenant) скопированы в каждую функцию, которая берёт
+слот квоты: функции деплоятся поодиночке и общего модуля у них нет. Тест не даёт копиям разойтись.
+"""
+import importlib.util
+import pathlib
+
+import pytest
+
+BACKEND = pathlib.Path(__file__).resolve().parent.parent / "backend"
+COPIES = ["auction-admin", "auction-bid", "auction-lots", "track-visit", "vk-widget"]
+
+
+def helpers_source(name: str) -> str:
+    text = (BACKEND / name / "index.py").read_text()
+    start = text.index("class TenantError")
+    return text[start:text.index("    return tenant_id\n", start)]
+
+
+def test_copies_in_sync():
+    reference = helpers_source(COPIES[0])
+    for name in COPIES[1:]:
+        assert helpers_source(name) == reference, name
+
+
+@pytest.mark.parametrize("event, expected", [
+    ({"headers": {"X-Vk-Group-Id": "42"}}, 42),
+    ({"headers": {"x-vk-group-id": "42"}, "queryStringParameters": {"vk_group_id": "7"}}, 42),
+    ({"queryStringParameters": {"vk_group_id": "7"}}, 7),
+    ({"headers": {"X-Vk-Group-Id": "club42"}}, None),
+    ({}, None),
+])
+def test_vk_group_id(event, expected):
+    spec = importlib.util.spec_from_file_location("fn_track_visit", BACKEND / "track-visit" / "index.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    assert module.vk_group_id(event) == expected